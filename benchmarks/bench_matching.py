@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Compare the legacy per-point county loop with the bulk matching engine."""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import shapely
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_counties, make_states, random_points
+from src.geo_utils import match_points_to_counties
+from src.spatial_index import BoundaryIndex
+
+def legacy_match(counties, points):
+    """Per-point sindex lookup as done by find_matching_counties before the bulk engine."""
+    counts = np.zeros(len(counties), dtype=np.int64)
+    for pt in points:
+        for idx in counties.sindex.intersection(pt.bounds):
+            if counties.iloc[idx].geometry.contains(pt):
+                counts[idx] += 1
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark point-in-county matching.")
+    parser.add_argument('--points', type=int, default=1_000_000, help='Points for the bulk engine')
+    parser.add_argument('--legacy-points', type=int, default=20_000, help='Points for the legacy loop')
+    args = parser.parse_args()
+    
+    counties = make_counties()
+    lons, lats = random_points(args.points, counties.total_bounds)
+    
+    legacy_pts = list(shapely.points(lons[:args.legacy_points], lats[:args.legacy_points]))
+    counties.sindex  # build outside the timed region
+    start = time.perf_counter()
+    legacy_counts = legacy_match(counties, legacy_pts)
+    legacy_rate = len(legacy_pts) / (time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    _, counts = match_points_to_counties(counties, lons, lats)
+    bulk_rate = len(lons) / (time.perf_counter() - start)
+    
+    index = BoundaryIndex(counties, make_states(counties))
+    start = time.perf_counter()
+    _, grid_counts = index.match(lons, lats)
+    grid_rate = len(lons) / (time.perf_counter() - start)
+    if not np.array_equal(grid_counts, counts):
+        print("WARNING: hierarchical and bulk counts differ")
+    
+    _, subset_counts = match_points_to_counties(counties, lons[:args.legacy_points], lats[:args.legacy_points])
+    if not np.array_equal(subset_counts, legacy_counts):
+        print("WARNING: bulk and legacy counts differ")
+    
+    print(f"Counties: {len(counties)}")
+    print(f"Legacy loop: {legacy_rate:,.0f} points/s ({len(legacy_pts):,} points)")
+    print(f"Bulk engine: {bulk_rate:,.0f} points/s ({len(lons):,} points)")
+    print(f"Hierarchical grid index: {grid_rate:,.0f} points/s (grid hit rate {index.grid_hit_rate:.1%})")
+    print(f"Speedup: {bulk_rate / legacy_rate:.1f}x bulk, {grid_rate / legacy_rate:.1f}x hierarchical")
+
+if __name__ == '__main__':
+    main()
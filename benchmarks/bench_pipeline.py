@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Time each pipeline stage on synthetic timelines and boundaries, writing a JSON report."""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import subprocess
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import shapely
+import geopandas as gpd
+from benchmarks.synthetic import make_counties, make_states, write_boundary_project, timeline_points, FORMAT_WRITERS
+from src.data_loader import load_shapefiles, load_points_from_json
+from src.boundary_cache import clear_boundary_cache
+from src.geo_utils import find_matching_counties, get_states_from_counties
+from src.visualization import generate_map
+
+def measure(func, memory):
+    """Run func once; return (result, wall seconds, cpu seconds, peak traced MB or None)."""
+    if memory:
+        tracemalloc.start()
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return result, wall, cpu, peak
+
+def stage_entry(wall, cpu, peak, items, unit):
+    """Report entry for one stage with throughput in items per second."""
+    return {
+        "seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "items": items,
+        "unit": unit,
+        "throughput": round(items / wall, 1) if wall > 0 else None,
+        "peak_mb": round(peak, 2) if peak is not None else None,
+    }
+
+def run_case(project_dir, json_path, n_points, pattern, input_format, map_path, memory):
+    """Time every stage for one timeline; stages run in pipeline order on each other's output."""
+    stages = {}
+    
+    (counties, states), wall, cpu, peak = measure(
+        lambda: load_shapefiles(project_dir, use_cache=False), memory)
+    stages["load_shapefiles"] = stage_entry(wall, cpu, peak, len(counties), "counties")
+    # Building the boundary cache and hitting it are timed separately, starting from a cold cache
+    clear_boundary_cache(project_dir)
+    _, wall, cpu, peak = measure(lambda: load_shapefiles(project_dir), memory)
+    stages["load_shapefiles_cache_build"] = stage_entry(wall, cpu, peak, len(counties), "counties")
+    _, wall, cpu, peak = measure(lambda: load_shapefiles(project_dir), memory)
+    stages["load_shapefiles_cached"] = stage_entry(wall, cpu, peak, len(counties), "counties")
+    
+    points, wall, cpu, peak = measure(lambda: load_points_from_json(json_path, input_format=input_format), memory)
+    stages["load_points_from_json"] = stage_entry(wall, cpu, peak, len(points), "points")
+    
+    matched, wall, cpu, peak = measure(lambda: find_matching_counties(counties, points), memory)
+    stages["find_matching_counties"] = stage_entry(wall, cpu, peak, len(points), "points")
+    
+    state_names, wall, cpu, peak = measure(lambda: get_states_from_counties(matched, states), memory)
+    stages["get_states_from_counties"] = stage_entry(wall, cpu, peak, len(matched), "counties")
+    
+    map_report, wall, cpu, peak = measure(
+        lambda: generate_map(counties, matched, states, points, map_path, False, state_names), memory)
+    stages["generate_map"] = stage_entry(wall, cpu, peak, len(points), "points")
+    
+    return {
+        "points": n_points,
+        "pattern": pattern,
+        "format": input_format,
+        "input_bytes": os.path.getsize(json_path),
+        "counties_matched": len(matched),
+        "states_covered": len(state_names),
+        "html_bytes": map_report["html_bytes"],
+        "stages": stages,
+    }
+
+def measure_startup(repeats=5):
+    """Median wall time of fresh interpreters doing the CLI's fixed startup work."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    commands = {
+        "cli_help": [sys.executable, os.path.join(root, "wanderglyph.py"), "--help"],
+        "import_core": [sys.executable, "-c", "import src.core"],
+        "import_visualization": [sys.executable, "-c", "import src.visualization"],
+    }
+    startup = {}
+    for name, command in commands.items():
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=root, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        startup[name] = round(float(np.median(times)), 4)
+    return startup
+
+def environment():
+    """Interpreter, library and machine details stored with every report."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "shapely": shapely.__version__,
+        "geopandas": gpd.__version__,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the processing pipeline stage by stage.")
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='Comma-separated timeline sizes in points (e.g. 10000,...,10000000)')
+    parser.add_argument('--patterns', default='clustered,dispersed', help='Comma-separated point patterns')
+    parser.add_argument('--formats', default='timeline',
+                        help=f"Comma-separated input formats to compare ({', '.join(FORMAT_WRITERS)})")
+    parser.add_argument('--grid', default='60x50', help='Synthetic county grid, columns x rows')
+    parser.add_argument('--vertices', type=int, default=40, help='Vertices per synthetic county side')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for boundaries and points')
+    parser.add_argument('--workdir', help='Directory for generated inputs (default: a temporary directory)')
+    parser.add_argument('--report', default='benchmark_report.json', help='Output JSON report path')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the tracemalloc pass (peak memory) and only record timings')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    sizes = [int(size) for size in args.sizes.split(',')]
+    patterns = args.patterns.split(',')
+    formats = args.formats.split(',')
+    nx, ny = (int(v) for v in args.grid.lower().split('x'))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="wanderglyph_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    
+    counties = make_counties(nx=nx, ny=ny, vertices=args.vertices, seed=args.seed)
+    project_dir = os.path.join(workdir, "project")
+    write_boundary_project(project_dir, counties, make_states(counties))
+    
+    startup = measure_startup()
+    print("Startup: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in startup.items()))
+    
+    results = []
+    try:
+        for pattern in patterns:
+            for n in sizes:
+                for input_format in formats:
+                    writer, extension = FORMAT_WRITERS[input_format]
+                    json_path = os.path.join(workdir, f"{input_format}_{pattern}_{n}{extension}")
+                    if not os.path.exists(json_path):
+                        writer(json_path, *timeline_points(n, counties.total_bounds, pattern, args.seed))
+                    map_path = os.path.join(workdir, f"map_{input_format}_{pattern}_{n}.html")
+                    result = run_case(project_dir, json_path, n, pattern, input_format, map_path, memory=False)
+                    if not args.no_memory:
+                        # Tracing slows allocation-heavy stages, so peaks come from a separate pass
+                        traced = run_case(project_dir, json_path, n, pattern, input_format, map_path, memory=True)
+                        for name, stage in result["stages"].items():
+                            stage["peak_mb"] = traced["stages"][name]["peak_mb"]
+                    results.append(result)
+                    print(f"{pattern:>10} {input_format:>8} {n:>10,} points: " + ", ".join(
+                        f"{name} {stage['seconds']:.2f}s" for name, stage in result["stages"].items()))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "environment": environment(),
+        "config": {"sizes": sizes, "patterns": patterns, "formats": formats, "counties": len(counties),
+                   "vertices_per_side": args.vertices, "seed": args.seed},
+        "startup_seconds": startup,
+        "results": results,
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to: {args.report}")
+
+if __name__ == '__main__':
+    main()
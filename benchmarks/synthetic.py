@@ -0,0 +1,141 @@
+"""Synthetic boundaries and points for benchmarking without TIGER shapefiles."""
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+def make_counties(nx=60, ny=50, origin=(-125.0, 25.0), cell=1.0, vertices=40, seed=0):
+    """Build an nx-by-ny grid of jagged county-like polygons in EPSG:4326."""
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(nx):
+        for j in range(ny):
+            x0 = origin[0] + i * cell
+            y0 = origin[1] + j * cell
+            # Walk the cell outline with small inward jitter so polygons have
+            # realistic vertex counts rather than being simple boxes
+            t = np.linspace(0, 4, vertices * 4, endpoint=False)
+            side = t.astype(int)
+            f = t - side
+            xs = np.choose(side, [f, np.ones_like(f), 1 - f, np.zeros_like(f)])
+            ys = np.choose(side, [np.zeros_like(f), f, np.ones_like(f), 1 - f])
+            jitter = rng.uniform(0, 0.02, size=(len(t), 2))
+            ring = np.column_stack([x0 + (xs * (1 - 2 * jitter[:, 0]) + jitter[:, 0]) * cell,
+                                    y0 + (ys * (1 - 2 * jitter[:, 1]) + jitter[:, 1]) * cell])
+            state = j // 10 * (nx // 10 + 1) + i // 10 + 1
+            records.append({
+                'STATEFP': f"{state:02d}",
+                'COUNTYFP': f"{i * ny + j:03d}",
+                'GEOID': f"{state:02d}{i * ny + j:05d}",
+                'NAME': f"County {i}-{j}",
+                'geometry': shapely.Polygon(ring),
+            })
+    return gpd.GeoDataFrame(records, crs="EPSG:4326")
+
+def make_states(counties):
+    """Dissolve synthetic counties into state polygons keyed by STATEFP."""
+    states = counties.dissolve(by='STATEFP', as_index=False)[['STATEFP', 'geometry']]
+    states['NAME'] = "State " + states['STATEFP']
+    return states
+
+def random_points(n, bounds, seed=0):
+    """Uniformly distributed lon/lat arrays inside bounds (minx, miny, maxx, maxy)."""
+    rng = np.random.default_rng(seed)
+    lons = rng.uniform(bounds[0], bounds[2], n)
+    lats = rng.uniform(bounds[1], bounds[3], n)
+    return lons, lats
+
+def write_boundary_project(project_dir, counties, states):
+    """Write counties and states as shapefiles in the TIGER tl_2024 layout load_shapefiles expects."""
+    for layer, gdf in (("county", counties), ("state", states)):
+        layer_dir = os.path.join(project_dir, f"tl_2024_us_{layer}")
+        os.makedirs(layer_dir, exist_ok=True)
+        gdf.to_file(os.path.join(layer_dir, f"tl_2024_us_{layer}.shp"))
+
+def timeline_points(n, bounds, pattern="clustered", seed=0):
+    """Synthetic lon/lat/epoch-ms arrays in time order.
+    
+    clustered: a few hundred places revisited in sessions with GPS jitter, the
+    shape of a real location history. dispersed: points spread uniformly over
+    bounds, a worst case for thinning, binning and clustering.
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+    if pattern == "dispersed":
+        lons = rng.uniform(minx, maxx, n)
+        lats = rng.uniform(miny, maxy, n)
+    elif pattern == "clustered":
+        n_places = 300
+        place_lons = rng.uniform(minx, maxx, n_places)
+        place_lats = rng.uniform(miny, maxy, n_places)
+        # Zipf-like popularity: a handful of places account for most visits
+        popularity = 1.0 / np.arange(1, n_places + 1)
+        sessions = rng.choice(n_places, size=max(1, n // 50), p=popularity / popularity.sum())
+        place = np.repeat(sessions, 50)[:n]
+        if len(place) < n:
+            place = np.concatenate([place, np.full(n - len(place), sessions[-1])])
+        lons = place_lons[place] + rng.normal(0, 0.002, n)
+        lats = place_lats[place] + rng.normal(0, 0.002, n)
+    else:
+        raise ValueError(f"Unknown point pattern: {pattern}")
+    start_ms = 1_672_531_200_000  # 2023-01-01T00:00:00Z
+    timestamps = start_ms + np.cumsum(rng.integers(5_000, 120_000, n))
+    return lons, lats, timestamps
+
+def write_timeline(path, lons, lats, timestamps, points_per_segment=500):
+    """Stream points to a Google semantic-timeline JSON file (timelinePath segments)."""
+    times = pd.to_datetime(timestamps, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%S.%f').str[:-3] + "+00:00"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"semanticSegments": [')
+        for start in range(0, len(lons), points_per_segment):
+            end = min(start + points_per_segment, len(lons))
+            path_items = ",".join(
+                f'{{"point": "{lat:.7f}°, {lon:.7f}°", "time": "{t}"}}'
+                for lat, lon, t in zip(lats[start:end], lons[start:end], times[start:end]))
+            if start:
+                f.write(",")
+            f.write(f'{{"startTime": "{times[start]}", "endTime": "{times[end - 1]}", '
+                    f'"timelinePath": [{path_items}]}}')
+        f.write("]}")
+
+def write_records(path, lons, lats, timestamps):
+    """Stream points to a Takeout Records.json file (locations[] with E7 integers)."""
+    times = pd.to_datetime(timestamps, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%S.%f').str[:-3] + "Z"
+    lat_e7 = np.round(np.asarray(lats) * 1e7).astype(np.int64)
+    lon_e7 = np.round(np.asarray(lons) * 1e7).astype(np.int64)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"locations": [')
+        for i, (lat, lon, t) in enumerate(zip(lat_e7, lon_e7, times)):
+            f.write(f'{"," if i else ""}{{"latitudeE7": {lat}, "longitudeE7": {lon}, "accuracy": 20, '
+                    f'"source": "WIFI", "timestamp": "{t}"}}')
+        f.write("]}")
+
+def write_gpx(path, lons, lats, timestamps, points_per_segment=500):
+    """Stream points to a GPX 1.1 file with one track segment per points_per_segment points."""
+    times = pd.to_datetime(timestamps, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="wanderglyph-bench" xmlns="http://www.topografix.com/GPX/1/1"><trk>')
+        for start in range(0, len(lons), points_per_segment):
+            end = min(start + points_per_segment, len(lons))
+            f.write("<trkseg>" + "".join(
+                f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><time>{t}</time></trkpt>'
+                for lat, lon, t in zip(lats[start:end], lons[start:end], times[start:end])) + "</trkseg>")
+        f.write("</trk></gpx>\n")
+
+def write_csv(path, lons, lats, timestamps):
+    """Write points to a CSV with latitude, longitude and ISO-8601 timestamp columns."""
+    pd.DataFrame({
+        'latitude': np.round(lats, 7),
+        'longitude': np.round(lons, 7),
+        'timestamp': pd.to_datetime(timestamps, unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }).to_csv(path, index=False)
+
+# Writers for every input format the readers support, with their file extensions
+FORMAT_WRITERS = {
+    'timeline': (write_timeline, '.json'),
+    'records': (write_records, '.json'),
+    'gpx': (write_gpx, '.gpx'),
+    'csv': (write_csv, '.csv'),
+}
@@ -0,0 +1,90 @@
+import numpy as np
+from .defaults import DEFAULT_MAX_HEAT_BINS, DEFAULT_MAX_CLUSTER_POINTS, DEFAULT_MAX_RAW_POINTS
+
+# Finest zoom level clusters are computed for; deeper zooms reuse it
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_RADIUS_PX = 60
+TILE_SIZE = 256
+MAX_MERCATOR_LAT = 85.05112878
+
+def _grouped_centroids(keys, lats, lons, weights):
+    """Weighted centroid and total weight of points sharing a key."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    total = np.bincount(inverse, weights=weights, minlength=len(unique))
+    lat = np.bincount(inverse, weights=lats * weights, minlength=len(unique)) / total
+    lon = np.bincount(inverse, weights=lons * weights, minlength=len(unique)) / total
+    return unique, lat, lon, total
+
+def bin_points(lats, lons, weights=None, cell_deg=0.01, max_bins=DEFAULT_MAX_HEAT_BINS):
+    """Aggregate points into weighted grid bins for the heatmap.
+    
+    The cell size doubles until the number of non-empty bins fits max_bins.
+    Returns bin latitudes, longitudes, weights and the cell size used.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    weights = np.ones(len(lats)) if weights is None else np.asarray(weights, dtype=np.float64)
+    while True:
+        n_cols = int(np.ceil(360.0 / cell_deg)) + 1
+        keys = (np.floor((lats + 90.0) / cell_deg).astype(np.int64) * n_cols
+                + np.floor((lons + 180.0) / cell_deg).astype(np.int64))
+        _, lat, lon, total = _grouped_centroids(keys, lats, lons, weights)
+        if len(total) <= max_bins:
+            return lat, lon, total, cell_deg
+        cell_deg *= 2
+
+def _mercator_pixels(lats, lons, zoom):
+    """Global Web Mercator pixel coordinates at a zoom level."""
+    size = TILE_SIZE * 2 ** zoom
+    lat = np.radians(np.clip(lats, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (lons + 180.0) / 360.0 * size
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * size
+    return x, y
+
+def build_cluster_levels(lats, lons, weights=None, min_zoom=0, max_zoom=CLUSTER_MAX_ZOOM,
+                         radius_px=CLUSTER_RADIUS_PX, max_points=DEFAULT_MAX_CLUSTER_POINTS):
+    """Precompute hierarchical point clusters per zoom level (supercluster-style grid).
+    
+    Points are clustered on a grid of radius_px screen pixels at max_zoom; every
+    coarser level merges 2x2 cells of the level below, so clusters nest exactly.
+    Levels are dropped from the fine end until the total number of emitted
+    clusters fits max_points. Returns {zoom: (lats, lons, weights)}.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    weights = np.ones(len(lats)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(lats) == 0:
+        return {}
+    
+    x, y = _mercator_pixels(lats, lons, max_zoom)
+    cx = np.floor(x / radius_px).astype(np.int64)
+    cy = np.floor(y / radius_px).astype(np.int64)
+    
+    levels = {}
+    level_lats, level_lons, level_weights = lats, lons, weights
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        n_cols = int(np.ceil(TILE_SIZE * 2 ** zoom / radius_px)) + 1
+        unique, level_lats, level_lons, level_weights = _grouped_centroids(
+            cy * n_cols + cx, level_lats, level_lons, level_weights)
+        levels[zoom] = (level_lats, level_lons, level_weights)
+        # Cells of the next coarser level are exactly 2x2 cells of this one
+        cx = (unique % n_cols) // 2
+        cy = (unique // n_cols) // 2
+    
+    total = sum(len(level[0]) for level in levels.values())
+    for zoom in range(max_zoom, min_zoom, -1):
+        if total <= max_points:
+            break
+        total -= len(levels.pop(zoom)[0])
+    return levels
+
+def encode_levels(levels, precision=5):
+    """Compact JSON-ready form: {zoom: [lat, lon, weight, lat, lon, weight, ...]}."""
+    encoded = {}
+    for zoom, (lats, lons, weights) in levels.items():
+        flat = np.column_stack([np.round(lats, precision), np.round(lons, precision), np.rint(weights)]).ravel()
+        # Python floats serialize without numpy's repr overhead; whole weights as ints
+        values = flat.tolist()
+        values[2::3] = [int(w) for w in values[2::3]]
+        encoded[str(zoom)] = values
+    return encoded
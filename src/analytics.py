@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from .points import NAT_TIMESTAMP
+from .geo_utils import visit_time_bounds, merge_visit_bounds
+
+EARTH_RADIUS_M = 6_371_008.8
+# Gaps between consecutive points longer than this are missing data, not travel or dwell
+MAX_STEP_GAP_S = 6 * 3600
+# Per-county arrays kept by TravelAnalytics (and stored with cached results and incremental state)
+TRAVEL_ARRAYS = ('first_visit', 'last_visit', 'distance_m', 'dwell_s')
+# Columns of the exported county table, in order
+COUNTY_TABLE_COLUMNS = ['GEOID', 'NAME', 'STATEFP', 'point_count', 'distance_km', 'dwell_hours',
+                        'first_visit', 'last_visit']
+
+def haversine_m(lons1, lats1, lons2, lats2):
+    """Great-circle distance in meters between paired coordinate arrays."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lons1, lats1, lons2, lats2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def empty_travel_arrays(n_counties):
+    """Zeroed per-county travel arrays (NAT_TIMESTAMP where never visited)."""
+    return {
+        'first_visit': np.full(n_counties, NAT_TIMESTAMP, dtype=np.int64),
+        'last_visit': np.full(n_counties, NAT_TIMESTAMP, dtype=np.int64),
+        'distance_m': np.zeros(n_counties, dtype=np.float64),
+        'dwell_s': np.zeros(n_counties, dtype=np.float64),
+    }
+
+class TravelAnalytics:
+    """Per-county first/last visit, distance travelled and time spent, accumulated chunk by chunk.
+    
+    Consecutive points in input order form steps, also across chunk
+    boundaries. A step counts for the county of its first point when both
+    points have timestamps, time does not go backwards and the gap is at
+    most max_gap_s: its great-circle length adds to distance_m and its
+    duration to dwell_s. Everything is computed with whole-chunk array
+    operations grouped by the point-to-county assignment.
+    """
+    
+    def __init__(self, n_counties, arrays=None, max_gap_s=MAX_STEP_GAP_S):
+        self.n_counties = n_counties
+        self.arrays = arrays if arrays is not None else empty_travel_arrays(n_counties)
+        self.max_gap_ms = int(max_gap_s * 1000)
+        # Last point of the previous chunk as (lon, lat, timestamp, county)
+        self.tail = None
+    
+    def add(self, chunk, county_idx):
+        """Add one matched PointStore chunk (county_idx: county position of each point, -1 if none)."""
+        if len(chunk) == 0:
+            return
+        lons = np.asarray(chunk.lons, dtype=np.float64)
+        lats = np.asarray(chunk.lats, dtype=np.float64)
+        timestamps = np.asarray(chunk.timestamps)
+        county_idx = np.asarray(county_idx, dtype=np.int64)
+        
+        first, last = visit_time_bounds(county_idx, timestamps, self.n_counties)
+        self.arrays['first_visit'], self.arrays['last_visit'] = merge_visit_bounds(
+            self.arrays['first_visit'], self.arrays['last_visit'], first, last)
+        
+        tail = self.tail
+        self.tail = (lons[-1], lats[-1], timestamps[-1], county_idx[-1])
+        if tail is not None:
+            lons, lats, timestamps, county_idx = (np.concatenate([[t], a]) for t, a in
+                                                  zip(tail, (lons, lats, timestamps, county_idx)))
+        if len(lons) < 2:
+            return
+        
+        start = county_idx[:-1]
+        timed = (timestamps[:-1] != NAT_TIMESTAMP) & (timestamps[1:] != NAT_TIMESTAMP)
+        gaps = np.where(timed, timestamps[1:] - np.where(timed, timestamps[:-1], 0), -1)
+        step = timed & (gaps >= 0) & (gaps <= self.max_gap_ms) & (start >= 0)
+        distances = haversine_m(lons[:-1][step], lats[:-1][step], lons[1:][step], lats[1:][step])
+        self.arrays['distance_m'] += np.bincount(start[step], weights=distances, minlength=self.n_counties)
+        self.arrays['dwell_s'] += np.bincount(start[step], weights=gaps[step] / 1000.0, minlength=self.n_counties)
+
+def _iso_times(timestamps):
+    """ISO 8601 UTC strings for epoch-millisecond timestamps (None where missing)."""
+    times = pd.to_datetime(timestamps, unit='ms', utc=True)
+    return np.where(times.isna(), None, times.strftime('%Y-%m-%dT%H:%M:%SZ').to_numpy(dtype=object))
+
+def travel_columns(arrays, selected):
+    """Display columns (distance_km, dwell_hours, first_visit, last_visit) for the selected counties."""
+    return {
+        'distance_km': np.round(arrays['distance_m'][selected] / 1000.0, 2),
+        'dwell_hours': np.round(arrays['dwell_s'][selected] / 3600.0, 2),
+        'first_visit': _iso_times(arrays['first_visit'][selected]),
+        'last_visit': _iso_times(arrays['last_visit'][selected]),
+    }
+
+def state_travel(arrays, counts, county_state, states):
+    """Per-state point counts and travel metrics grouped from the per-county arrays.
+    
+    county_state holds the state position of each county (-1 if none).
+    Returns a DataFrame of the visited states, most points first.
+    """
+    n = len(states)
+    has_state = county_state >= 0
+    group = county_state[has_state]
+    point_count = np.bincount(group, weights=counts[has_state], minlength=n).astype(np.int64)
+    distance_m = np.bincount(group, weights=arrays['distance_m'][has_state], minlength=n)
+    dwell_s = np.bincount(group, weights=arrays['dwell_s'][has_state], minlength=n)
+    first = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.full(n, NAT_TIMESTAMP, dtype=np.int64)
+    visited = has_state & (arrays['first_visit'] != NAT_TIMESTAMP)
+    np.minimum.at(first, county_state[visited], arrays['first_visit'][visited])
+    np.maximum.at(last, county_state[visited], arrays['last_visit'][visited])
+    first[first == np.iinfo(np.int64).max] = NAT_TIMESTAMP
+    
+    selected = point_count > 0
+    table = pd.DataFrame({'STATEFP': states['STATEFP'].to_numpy()[selected],
+                          'NAME': states['NAME'].to_numpy()[selected],
+                          'point_count': point_count[selected]})
+    state_arrays = {'distance_m': distance_m, 'dwell_s': dwell_s, 'first_visit': first, 'last_visit': last}
+    for name, values in travel_columns(state_arrays, selected).items():
+        table[name] = values
+    return table.sort_values('point_count', ascending=False, kind='stable').reset_index(drop=True)
+
+def travel_summary(arrays, state_table, matched):
+    """Totals plus per-state and per-county metrics for the result dict."""
+    columns = [c for c in COUNTY_TABLE_COLUMNS if c in matched.columns]
+    visited = arrays['first_visit'] != NAT_TIMESTAMP
+    first = arrays['first_visit'][visited].min() if visited.any() else NAT_TIMESTAMP
+    last = arrays['last_visit'][visited].max() if visited.any() else NAT_TIMESTAMP
+    return {
+        "distance_km": round(float(arrays['distance_m'].sum()) / 1000.0, 2),
+        "dwell_hours": round(float(arrays['dwell_s'].sum()) / 3600.0, 2),
+        "first_visit": _iso_times(np.array([first]))[0],
+        "last_visit": _iso_times(np.array([last]))[0],
+        "states": state_table.to_dict('records'),
+        "counties": pd.DataFrame(matched[columns]).sort_values('point_count', ascending=False).to_dict('records'),
+    }
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from .core import share_boundaries, init_boundary_worker, shared_boundaries, process_data
+from .readers import supported_extensions
+
+def discover_inputs(source):
+    """List location history files from a directory or a manifest.
+    
+    A directory contributes every file with an extension of a registered
+    reader (see readers.py). A manifest is either a text file with one path per line or a JSON file
+    holding a list of paths; relative paths are resolved against the
+    manifest's directory.
+    """
+    if os.path.isdir(source):
+        extensions = tuple(supported_extensions())
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(extensions))
+    
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Batch source not found: {source}")
+    
+    with open(source, 'r', encoding='utf-8') as f:
+        if source.lower().endswith(".json"):
+            entries = json.load(f)
+            if not isinstance(entries, list):
+                raise ValueError(f"JSON manifest must contain a list of paths: {source}")
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    
+    base = os.path.dirname(os.path.abspath(source))
+    return [entry if os.path.isabs(entry) else os.path.join(base, entry) for entry in entries]
+
+def output_stems(inputs):
+    """Unique output name per input file: its stem, made distinct where stems repeat.
+    
+    A repeated stem (e.g. a/Timeline.json and b/Timeline.json) is prefixed
+    with the file's parent directory name, then numbered if still not unique.
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in inputs]
+    counts = Counter(stems)
+    used = set()
+    names = []
+    for path, stem in zip(inputs, stems):
+        name = stem
+        if counts[stem] > 1:
+            name = f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}_{stem}"
+        unique = name
+        suffix = 2
+        while unique in used:
+            unique = f"{name}_{suffix}"
+            suffix += 1
+        if unique != stem:
+            logging.warning(f"Several inputs are named {stem}; writing the outputs of {path} as {unique}")
+        used.add(unique)
+        names.append(unique)
+    return names
+
+def batch_output_paths(stem, output_dir):
+    """Per-file output locations inside output_dir, named after the file's output stem."""
+    return {
+        "output_map": os.path.join(output_dir, f"{stem}.html"),
+        "export_geojson": os.path.join(output_dir, f"{stem}_counties.geojson"),
+        "export_points": os.path.join(output_dir, f"{stem}_points.geojson"),
+        "thumbnail": os.path.join(output_dir, f"{stem}.png"),
+    }
+
+def _process_one(json_file, stem, output_dir, project_dir, exports, thumbnails, options):
+    """Run the full pipeline for one file against the shared boundaries."""
+    paths = batch_output_paths(stem, output_dir)
+    entry = {"input": json_file, "output_map": paths["output_map"]}
+    start = time.perf_counter()
+    try:
+        outputs = dict(options.get("outputs") or {})
+        if exports:
+            outputs.update(export_geojson=paths["export_geojson"], export_points=paths["export_points"])
+        if thumbnails:
+            outputs["thumbnail"] = paths["thumbnail"]
+        result = process_data(
+            json_file,
+            paths["output_map"],
+            project_dir,
+            boundaries=shared_boundaries(),
+            **{**options, "outputs": outputs}
+        )
+        entry.update(result)
+        entry["status"] = "ok"
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = f"{type(e).__name__}: {e}".strip()
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    entry["pid"] = os.getpid()
+    return entry
+
+def process_batch(source, output_dir, project_dir, workers=None, exports=False, thumbnails=False, **options):
+    """Process many timeline files against one warm set of boundaries.
+    
+    Boundaries and the lookup index are built once in the parent, then files
+    are parsed, matched and rendered across a process pool. With thumbnails,
+    a <stem>.png preview is written next to each map; inputs sharing a stem
+    get distinct names (see output_stems). Writes summary.json to
+    output_dir and returns the same summary dict.
+    """
+    inputs = discover_inputs(source)
+    if not inputs:
+        raise ValueError(f"No location history files found in {source}")
+    stems = output_stems(inputs)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    batch_start = time.perf_counter()
+    share_boundaries(project_dir, (options.get("cache_options") or {}).get("rebuild_cache", False))
+    boundary_seconds = time.perf_counter() - batch_start
+    
+    workers = max(1, min(workers or os.cpu_count() or 1, len(inputs)))
+    logging.info(f"Processing {len(inputs)} files with {workers} worker(s)")
+    if workers == 1:
+        files = [_process_one(f, stem, output_dir, project_dir, exports, thumbnails, options)
+                 for f, stem in zip(inputs, stems)]
+    else:
+        start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+        context = multiprocessing.get_context(start_method)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=init_boundary_worker, initargs=(project_dir,)) as pool:
+            files = list(pool.map(_process_one, inputs, stems, [output_dir] * len(inputs), [project_dir] * len(inputs),
+                                  [exports] * len(inputs), [thumbnails] * len(inputs), [options] * len(inputs)))
+    
+    succeeded = [f for f in files if f["status"] == "ok"]
+    summary = {
+        "files": files,
+        "files_total": len(files),
+        "files_succeeded": len(succeeded),
+        "files_failed": len(files) - len(succeeded),
+        "workers": workers,
+        "boundary_load_seconds": round(boundary_seconds, 3),
+        "total_seconds": round(time.perf_counter() - batch_start, 3),
+        "points_total": sum(f["points_count"] for f in succeeded),
+    }
+    summary_path = os.path.join(output_dir, "summary.json")
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    logging.info(f"Batch summary written to: {summary_path}")
+    return summary
@@ -0,0 +1,193 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+import geopandas as gpd
+
+CACHE_DIR_NAME = ".wanderglyph_cache"
+# Bump when the preprocessing in load_shapefiles changes so old entries are ignored
+CACHE_VERSION = 2
+SHAPEFILE_COMPONENTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+BOUNDS_COLUMNS = ["minx", "miny", "maxx", "maxy"]
+
+def boundary_shapefile_paths(project_dir):
+    """Paths of the county and state TIGER shapefiles under project_dir."""
+    county_path = os.path.join(project_dir, "tl_2024_us_county", "tl_2024_us_county.shp")
+    state_path = os.path.join(project_dir, "tl_2024_us_state", "tl_2024_us_state.shp")
+    return county_path, state_path
+
+def boundary_cache_root(project_dir):
+    """Directory holding all preprocessed boundary cache entries."""
+    return os.path.join(project_dir, CACHE_DIR_NAME, "boundaries")
+
+def layer_cache_root(project_dir, layer):
+    """Directory holding the cache entries of one extra geography layer file (e.g. tl_2024_06_tract)."""
+    return os.path.join(project_dir, CACHE_DIR_NAME, "layers", layer)
+
+def source_fingerprint(shp_path):
+    """Describe a shapefile and its sidecar files by name, size and mtime."""
+    base, _ = os.path.splitext(shp_path)
+    parts = []
+    for ext in SHAPEFILE_COMPONENTS:
+        path = base + ext
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append({"file": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    return parts
+
+def boundary_cache_key(shp_paths, simplify_tolerance):
+    """Hash the source fingerprints and preprocessing parameters into a cache key."""
+    payload = {
+        "version": CACHE_VERSION,
+        "simplify_tolerance": simplify_tolerance,
+        "sources": [source_fingerprint(p) for p in shp_paths],
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return digest[:16], payload
+
+def boundary_cache_entry(project_dir, simplify_tolerance=0.01):
+    """Directory of the cache entry matching the current shapefiles, or None if not built yet."""
+    key, _ = boundary_cache_key(boundary_shapefile_paths(project_dir), simplify_tolerance)
+    entry = os.path.join(boundary_cache_root(project_dir), key)
+    return entry if os.path.exists(os.path.join(entry, "manifest.json")) else None
+
+def load_cached_arrays(entry, name):
+    """Load a named .npz of derived arrays stored next to cached boundaries, or None."""
+    if entry is None:
+        return None
+    path = os.path.join(entry, f"{name}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return {k: data[k] for k in data.files}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable cache file {path}: {e}")
+        return None
+
+def save_cached_arrays(entry, name, **arrays):
+    """Store derived arrays in a cache entry; they are evicted together with it."""
+    if entry is None:
+        return
+    path = os.path.join(entry, f"{name}.npz")
+    try:
+        np.savez(path + ".tmp.npz", **arrays)
+        os.replace(path + ".tmp.npz", path)
+    except OSError as e:
+        logging.warning(f"Could not write cache file {path}: {e}")
+
+def load_cached_json(entry, name):
+    """Load a named JSON document stored next to cached boundaries, or None."""
+    if entry is None:
+        return None
+    path = os.path.join(entry, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable cache file {path}: {e}")
+        return None
+
+def save_cached_json(entry, name, document):
+    """Store a JSON document in a cache entry; it is evicted together with it."""
+    if entry is None:
+        return
+    path = os.path.join(entry, f"{name}.json")
+    try:
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"Could not write cache file {path}: {e}")
+
+def bbox_filters(bbox):
+    """Parquet row filters keeping features whose stored bounds intersect bbox."""
+    minx, miny, maxx, maxy = bbox
+    return [("minx", "<=", maxx), ("maxx", ">=", minx), ("miny", "<=", maxy), ("maxy", ">=", miny)]
+
+def _read_cached_layer(path, bbox, columns):
+    """Read one cached layer, pruned to columns and to features intersecting bbox."""
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + ["geometry"] + BOUNDS_COLUMNS
+    gdf = gpd.read_parquet(path, columns=read_columns, filters=bbox_filters(bbox) if bbox else None)
+    return gdf.drop(columns=BOUNDS_COLUMNS).reset_index(drop=True)
+
+def load_cached_boundaries(project_dir, key, bbox=None, county_columns=None, state_columns=None):
+    """Return cached (counties, states) for key, or None on a miss.
+    
+    bbox (minx, miny, maxx, maxy) limits the read to features whose bounds
+    intersect it, using the stored bounds columns as row filters; the
+    column lists limit the attributes read (geometry is always included).
+    The full county count is set as counties.attrs['total_features'].
+    """
+    entry = os.path.join(boundary_cache_root(project_dir), key)
+    if not os.path.exists(os.path.join(entry, "manifest.json")):
+        return None
+    try:
+        with open(os.path.join(entry, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        counties = _read_cached_layer(os.path.join(entry, "counties.parquet"), bbox, county_columns)
+        states = _read_cached_layer(os.path.join(entry, "states.parquet"), bbox, state_columns)
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable boundary cache {entry}: {e}")
+        return None
+    counties.attrs['total_features'] = manifest.get("features", {}).get("counties", len(counties))
+    return counties, states
+
+def _write_cache_entry(root, key, manifest, layers):
+    """Atomically write {name: GeoDataFrame} as GeoParquet under root/key and drop stale entries."""
+    entry = os.path.join(root, key)
+    tmp = entry + ".tmp"
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, gdf in layers.items():
+            # Store per-feature bounds next to the geometry so spatial index
+            # construction and extent filtering can start from plain columns
+            out = gdf.reset_index(drop=True)
+            out[BOUNDS_COLUMNS] = out.geometry.bounds.to_numpy()
+            out.to_parquet(os.path.join(tmp, f"{name}.parquet"))
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except (ImportError, OSError) as e:
+        logging.warning(f"Could not write boundary cache: {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    
+    # Only one entry is ever valid for a given set of sources, so evict the rest
+    for name in os.listdir(root):
+        if name != key:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    logging.info(f"Boundary cache written to {entry}")
+
+def save_cached_boundaries(project_dir, key, payload, counties, states):
+    """Persist preprocessed boundaries under key and drop stale entries."""
+    manifest = {**payload, "features": {"counties": len(counties), "states": len(states)}}
+    _write_cache_entry(boundary_cache_root(project_dir), key, manifest, {"counties": counties, "states": states})
+
+def load_cached_layer(project_dir, layer, key, bbox=None, columns=None):
+    """Return the cached features of an extra geography layer file, or None on a miss."""
+    entry = os.path.join(layer_cache_root(project_dir, layer), key)
+    if not os.path.exists(os.path.join(entry, "manifest.json")):
+        return None
+    try:
+        return _read_cached_layer(os.path.join(entry, "features.parquet"), bbox, columns)
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable layer cache {entry}: {e}")
+        return None
+
+def save_cached_layer(project_dir, layer, key, payload, features):
+    """Persist the preprocessed features of an extra geography layer file under key."""
+    manifest = {**payload, "features": {layer: len(features)}}
+    _write_cache_entry(layer_cache_root(project_dir, layer), key, manifest, {"features": features})
+
+def clear_boundary_cache(project_dir):
+    """Remove every cached boundary entry for project_dir."""
+    shutil.rmtree(boundary_cache_root(project_dir), ignore_errors=True)
@@ -1,14 +1,15 @@
 import logging
-from shapely.geometry import Point
+from itertools import repeat
+import numpy as np
 
-def extract_coordinates(point_data):
-    """Extract latitude and longitude from different formats."""
+def parse_lat_lon(point_data):
+    """Extract a (latitude, longitude) pair from different formats, or None."""
     try:
         if isinstance(point_data, dict):
             lat = point_data.get("latitude")
             lon = point_data.get("longitude")
             if lat is not None and lon is not None:
-                return Point(lon, lat)
+                return lat, lon
         elif isinstance(point_data, str):
             # Handle different string formats
             point_data = point_data.strip()
@@ -17,7 +18,7 @@ def extract_coordinates(point_data):
                 if len(coords) == 2:
                     lat = float(coords[0].strip())
                     lon = float(coords[1].strip())
-                    return Point(lon, lat)
+                    return lat, lon
             else:
                 # Try simple comma separation
                 coords = point_data.split(",")
@@ -27,9 +28,37 @@ def extract_coordinates(point_data):
                         lon = float(coords[1].strip())
                         # Basic validation of coordinates
                         if -90 <= lat <= 90 and -180 <= lon <= 180:
-                            return Point(lon, lat)
+                            return lat, lon
                     except ValueError:
                         pass
     except Exception as e:
         logging.warning(f"Error extracting coordinates: {e}")
     return None
+
+def parse_lat_lon_strings(values):
+    """Parse a whole column of "lat°, lon°" / "lat, lon" values at once.
+
+    Returns latitude and longitude float64 arrays plus a boolean mask of the
+    entries that parsed to in-range coordinates.
+    """
+    n = len(values)
+    try:
+        # Fast path: one join/split over the whole column and a single float conversion.
+        # Every value must hold exactly one comma, or fields would shift between rows
+        if set(map(str.count, values, repeat(","))) != {1}:
+            raise ValueError("unexpected number of coordinate fields")
+        flat = ",".join(values).replace("°", "").split(",")
+        coords = np.array(flat, dtype=np.float64).reshape(n, 2)
+        lat = coords[:, 0]
+        lon = coords[:, 1]
+    except (TypeError, ValueError):
+        # At least one malformed or non-string entry; fall back to per-value parsing
+        lat = np.full(n, np.nan)
+        lon = np.full(n, np.nan)
+        for i, value in enumerate(values):
+            lat_lon = parse_lat_lon(value)
+            if lat_lon is not None:
+                lat[i], lon[i] = lat_lon
+    
+    valid = (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    return lat, lon, valid
@@ -1,56 +1,491 @@
 # Import necessary modules
 import os
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-import geopandas as gpd
 
 # Import functions from other modules
-from .data_loader import load_shapefiles, load_points_from_json, create_points_dataframe
-from .geo_utils import find_matching_counties, get_states_from_counties
-from .visualization import generate_map
+from .data_loader import load_shapefiles, read_boundary_shapefiles, padded_extent, DEFAULT_CHUNK_SIZE
+from .readers import iter_point_chunks
+from .geo_utils import counties_with_counts, get_states_from_counties
+from .analytics import TravelAnalytics, travel_columns, state_travel, travel_summary, COUNTY_TABLE_COLUMNS
+from .spatial_index import load_boundary_index
+from .points import PointStore, NAT_TIMESTAMP
+from .incremental import (load_incremental_state, state_county_arrays, state_extent, load_state_points,
+                          save_incremental_state)
+from .thinning import thin_points, DEFAULT_THIN_DISTANCE_M, DEFAULT_THIN_MIN_STAY_S
+from .topology import load_boundary_topology
+from .profiling import StageRecorder
+from .geographies import prepare_geographies, match_geographies, visited_features
+from .exporters import write_feature_export, write_point_export, DEFAULT_EXPORT_PRECISION
+from .thumbnail import render_thumbnail, DEFAULT_THUMBNAIL_SIZE
+from .visit_index import VisitIndex, VisitIndexWriter
+from .spool import PointSpool, chunk_size_for_budget, iter_store_chunks, reduce_points
+from .result_cache import (result_cache_key, result_cache_entry, load_cached_result, cached_county_positions,
+                           cached_county_arrays, iter_cached_matches, ResultWriter, map_cache_key,
+                           load_cached_map, save_cached_map)
 
-def process_data(json_file, output_map, project_dir, add_markers=True, export_geojson=None, export_points=None):
-    """Process GPS data from JSON file and generate interactive map."""
+# Stages run on the background export thread
+BACKGROUND_STAGES = ('export', 'thumbnail')
+
+def prepare_boundaries(project_dir, rebuild_cache=False, bbox=None):
+    """Load county/state boundaries and their lookup index once for reuse across runs.
+    
+    With bbox only the features intersecting it are loaded (and indexed).
+    """
+    logging.info(f"Loading shapefiles from {project_dir}")
+    counties, states = load_shapefiles(project_dir, rebuild_cache=rebuild_cache, bbox=bbox)
+    index = load_boundary_index(project_dir, counties, states, use_cache=bbox is None)
+    return counties, states, index
+
+# Boundaries shared with worker processes. Set in the parent before a pool
+# is created so forked workers inherit them copy-on-write; under the spawn
+# start method each worker loads them once (from the boundary cache) instead.
+_SHARED_BOUNDARIES = None
+
+def share_boundaries(project_dir, rebuild_cache=False):
+    """Load boundaries for this process and the worker pools it starts next."""
+    global _SHARED_BOUNDARIES
+    _SHARED_BOUNDARIES = prepare_boundaries(project_dir, rebuild_cache)
+    return _SHARED_BOUNDARIES
+
+def init_boundary_worker(project_dir):
+    """Pool initializer: load boundaries in a spawned worker (no-op when inherited through fork)."""
+    global _SHARED_BOUNDARIES
+    if _SHARED_BOUNDARIES is None:
+        _SHARED_BOUNDARIES = prepare_boundaries(project_dir)
+
+def shared_boundaries():
+    """Boundaries set by share_boundaries / init_boundary_worker in this process, or None."""
+    return _SHARED_BOUNDARIES
+
+def write_exports(recorder, matched, visited, points, export_geojson=None, export_csv=None, export_points=None,
+                  precision=DEFAULT_EXPORT_PRECISION, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write the requested county, finer-layer and point exports (format from each path's extension)."""
+    if export_geojson and not matched.empty:
+        with recorder.stage("export", len(matched)):
+            write_feature_export(matched, export_geojson, precision)
+        logging.info(f"Counties exported to: {export_geojson}")
+    
+    if export_csv:
+        with recorder.stage("export", len(matched)):
+            columns = [c for c in COUNTY_TABLE_COLUMNS if c in matched.columns]
+            matched[columns].sort_values('point_count', ascending=False).to_csv(export_csv, index=False)
+        logging.info(f"County table exported to: {export_csv}")
+        for name, features in visited.items():
+            path = f"{os.path.splitext(export_csv)[0]}_{name}.csv"
+            with recorder.stage("export", len(features)):
+                features[['GEOID', 'NAME', 'point_count']].sort_values('point_count', ascending=False).to_csv(path, index=False)
+            logging.info(f"{name} table exported to: {path}")
+    
+    if export_points:
+        # Streamed from the point columns chunk by chunk; no geometries are built
+        with recorder.stage("export", len(points)):
+            write_point_export(points, export_points, precision, chunk_size)
+        logging.info(f"Points exported to: {export_points}")
+
+def run_now(fn, *args):
+    """Run fn on this thread and return a finished Future, like ThreadPoolExecutor.submit would."""
+    future = Future()
     try:
-        logging.info(f"Loading shapefiles from {project_dir}")
-        counties, states = load_shapefiles(project_dir)
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def write_thumbnail(recorder, counties, counts, states, points, output_path, size=DEFAULT_THUMBNAIL_SIZE,
+                    chunk_size=DEFAULT_CHUNK_SIZE):
+    """Render the static PNG thumbnail of the visited counties (see thumbnail.py)."""
+    with recorder.stage("thumbnail", len(points)):
+        return render_thumbnail(counties, counts, states, points, output_path, size, chunk_size)
+
+def process_data(json_file, output_map, project_dir, add_markers=True, chunk_size=DEFAULT_CHUNK_SIZE, thin=False,
+                 thin_distance=DEFAULT_THIN_DISTANCE_M, thin_min_stay=DEFAULT_THIN_MIN_STAY_S, boundaries=None,
+                 state_file=None, map_options=None, topojson=False, full_extent=False, memory_budget=None,
+                 spill_dir=None, input_format=None, geographies=None, outputs=None, cache_options=None,
+                 profile_options=None):
+    """Process GPS data from JSON file and generate interactive map.
+    
+    json_file may be in any format registered in readers.py (semantic
+    timeline, Takeout Records.json, GPX, CSV); input_format names one
+    explicitly instead of detecting it.
+    
+    boundaries may be a (counties, states, index) tuple from prepare_boundaries
+    to skip loading shapefiles and building the index. Otherwise only the
+    boundaries intersecting the points' extent are loaded, unless full_extent
+    is set. With state_file, only
+    points newer than the previous run are parsed and matched, then merged
+    into the persisted per-county aggregates; earlier points are only stored
+    (and reloaded) for runs that draw or export them. map_options are passed on to
+    generate_map (e.g. its element caps). With topojson, boundaries are
+    embedded in the map as quantized TopoJSON built from project_dir's shapefiles.
+    
+    geographies names finer layers from geographies.GEOGRAPHY_LAYERS (tract,
+    zcta, place) to match in the same pass, each point tested only against
+    the features of its matched county or state; the visited features are
+    drawn on the map and, with export_csv, written next to the county table.
+    
+    output_map may be None to skip map generation (and importing folium).
+    outputs holds the other outputs, all optional:
+    - export_csv: the matched county table (analytics.COUNTY_TABLE_COLUMNS)
+    - export_geojson, export_points: counties and points as GeoJSON,
+      newline-delimited GeoJSON or GeoParquet depending on the extension
+      (see exporters.py), rounded to export_precision decimals
+    - thumbnail: a static PNG of the visited counties and point density,
+      thumbnail_size pixels on its longer side, rasterized with numpy alone
+    - visit_index: a directory where the matched points are persisted sorted
+      by time with per-county daily counts (see visit_index.py); not built
+      with state_file, whose earlier points are not matched again
+    Exports and the thumbnail are written in a background thread while the
+    map renders.
+    
+    Every matched chunk also feeds analytics.TravelAnalytics, so distance
+    travelled, time spent and first/last visit are known per county (on the
+    map tooltips and in the exports) and per state; totals and both tables
+    are returned under "travel".
+    
+    With memory_budget (MB), the run is out-of-core: chunks are sized to the
+    budget and spilled to a memory-mapped PointSpool (under spill_dir, default
+    the system temp directory), matched back chunk by chunk, and reduced to
+    weighted cells before rendering, so input size no longer bounds memory.
+    
+    cache_options may set rebuild_cache, to rebuild the boundary cache, and
+    result_cache_size (MB), to store parsed points, their county matches and
+    the rendered map in a content-addressed cache under project_dir (see
+    result_cache.py) that a rerun changing only output options reuses. The
+    result cache is not used with state_file, which keeps its own aggregates.
+    
+    Per-stage timings are returned under "profile" (see profiling.StageRecorder).
+    profile_options may set hooks, which receive each stage event, and
+    profile_stage, which is run under cProfile with its stats written to
+    profile_stats.
+    """
+    outputs = outputs or {}
+    export_geojson = outputs.get("export_geojson")
+    export_points = outputs.get("export_points")
+    export_csv = outputs.get("export_csv")
+    export_precision = outputs.get("export_precision", DEFAULT_EXPORT_PRECISION)
+    thumbnail = outputs.get("thumbnail")
+    thumbnail_size = outputs.get("thumbnail_size", DEFAULT_THUMBNAIL_SIZE)
+    visit_index = outputs.get("visit_index")
+    rebuild_cache = (cache_options or {}).get("rebuild_cache", False)
+    result_cache_size = (cache_options or {}).get("result_cache_size")
+    hooks = (profile_options or {}).get("hooks")
+    profile_stage = (profile_options or {}).get("profile_stage")
+    profile_stats = (profile_options or {}).get("profile_stats")
+    
+    recorder = StageRecorder(hooks, profile_stage)
+    spool = None
+    writer = None
+    index_writer = None
+    exports = []
+    if memory_budget:
+        chunk_size = min(chunk_size, chunk_size_for_budget(memory_budget))
+    try:
+        cache_key = None
+        cached = None
+        if result_cache_size and not state_file:
+            with recorder.stage("cache_lookup"):
+                # Thinning runs per chunk, so the chunk size only changes the points when thinning
+                parse_options = {"input_format": input_format, "thin": thin, "thin_distance": thin_distance,
+                                 "thin_min_stay": thin_min_stay, "chunk_size": chunk_size if thin else None}
+                cache_key = result_cache_key(project_dir, json_file, parse_options)
+                cached = load_cached_result(project_dir, cache_key)
+        if memory_budget and cached is None:
+            spool = PointSpool(spill_dir)
+            logging.info(f"Out-of-core mode: {chunk_size} points per chunk, spilling to {spool.directory}")
         
+        # Stream the timeline in fixed-size chunks; only compact coordinate
+        # arrays are kept, and their extent decides which boundaries to load
         logging.info(f"Processing JSON data from {json_file}")
-        points, metadata = load_points_from_json(json_file)
+        state_options = {"thin": thin, "thin_distance": thin_distance, "thin_min_stay": thin_min_stay}
+        # Earlier runs' points are only kept and reloaded when this run draws or exports them
+        need_points = bool(output_map or export_points or thumbnail or geographies)
+        with recorder.stage("load_state"):
+            state = load_incremental_state(state_file, json_file, state_options, need_points) if state_file else None
+            since = state["last_timestamp"] if state else None
+            if state:
+                logging.info(f"Incremental run: only processing points after {pd.to_datetime(since, unit='ms', utc=True)}")
+            chunks = [load_state_points(state_file)] if state and need_points else []
+            earlier_count = state["points_count"] if state and not need_points else 0
+        raw_count = 0
+        new_chunks = []
+        source = [] if cached is not None else iter_point_chunks(json_file, chunk_size, since=since, input_format=input_format)
+        for chunk in recorder.iterate("parse", source):
+            raw_count += len(chunk)
+            if thin:
+                # Weighted stay points keep per-county counts equal to the raw totals
+                with recorder.stage("thin", len(chunk)):
+                    chunk, _ = thin_points(chunk, thin_distance, thin_min_stay)
+            if spool is None:
+                new_chunks.append(chunk)
+            else:
+                with recorder.stage("spill", len(chunk)):
+                    spool.append(chunk)
         
-        if not points:
+        if cached is not None:
+            # Cached points are memory-mapped, like the spool in out-of-core mode
+            points = cached["points"]
+            raw_count = cached["meta"]["raw_count"]
+            new_chunks = iter_store_chunks(points, chunk_size)
+            n_chunks = -(-len(points) // chunk_size)
+        elif spool is None:
+            points = PointStore.concat(chunks + new_chunks)
+            n_chunks = len(new_chunks)
+        else:
+            # Earlier runs' points go after the new ones so the new ones are a prefix of the spool
+            with recorder.stage("spill", sum(len(chunk) for chunk in chunks)):
+                new_total = len(spool)
+                for chunk in chunks:
+                    spool.append(chunk)
+                points = spool.store()
+            new_chunks = iter_store_chunks(points[:new_total], chunk_size)
+            n_chunks = -(-new_total // chunk_size)
+        if len(points) == 0 and not state:
             raise ValueError("No valid points found in the JSON file")
         
-        # Create GeoDataFrame from points
-        point_gdf = create_points_dataframe(points, metadata)
+        # Counties from the state aggregates must be loaded even when none of their points are
+        extent = state_extent(state, points)
+        if boundaries is None:
+            with recorder.stage("load_boundaries"):
+                bbox = None if full_extent else padded_extent(extent)
+                boundaries = prepare_boundaries(project_dir, rebuild_cache, bbox)
+        counties, states, index = boundaries
+        
+        # Earlier runs' points are already in the state aggregates; only new chunks are matched
+        county_counts, travel = state_county_arrays(state, counties)
+        layers = {}
+        if geographies:
+            with recorder.stage("load_geographies"):
+                layers = prepare_geographies(project_dir, geographies, counties, states, padded_extent(points.bounds()))
+            # Finer layers are not kept in the incremental state, so earlier runs' points are matched again for them
+            for chunk in chunks:
+                with recorder.stage("match_geographies", len(chunk)):
+                    county_idx, _ = index.match(chunk.lons, chunk.lats)
+                    match_geographies(layers, county_idx, index.county_state, chunk)
+        if visit_index and state_file:
+            logging.warning("Incremental runs do not build a visit index; run once without --state-file")
+        elif visit_index:
+            index_writer = VisitIndexWriter(visit_index)
+        new_count = 0
+        match_stats = {"points": 0, "grid_hits": 0}
+        positions = cached_county_positions(cached, counties) if cached is not None else None
+        if positions is not None:
+            # Counties come from the cache; the stored per-point matches still narrow the finer layers
+            county_counts, travel = cached_county_arrays(cached, positions, len(counties))
+            analytics = TravelAnalytics(len(counties), travel)
+            match_stats = cached["meta"]["match_stats"]
+            new_count = len(points)
+            if layers or index_writer is not None:
+                for chunk, county_idx in iter_cached_matches(cached, positions, chunk_size):
+                    if index_writer is not None:
+                        with recorder.stage("visit_index", len(chunk)):
+                            index_writer.append(chunk, county_idx)
+                    if layers:
+                        with recorder.stage("match_geographies", len(chunk)):
+                            match_geographies(layers, county_idx, index.county_state, chunk)
+        else:
+            analytics = TravelAnalytics(len(counties), travel)
+            if cache_key and cached is None:
+                writer = ResultWriter(project_dir, cache_key)
+            for chunk in new_chunks:
+                with recorder.stage("match", len(chunk)):
+                    county_idx, counts = index.match(chunk.lons, chunk.lats, chunk.weights, stats=match_stats)
+                    county_counts += counts
+                with recorder.stage("analytics", len(chunk)):
+                    analytics.add(chunk, county_idx)
+                if writer is not None:
+                    with recorder.stage("cache_store", len(chunk)):
+                        writer.append(chunk, county_idx)
+                if index_writer is not None:
+                    with recorder.stage("visit_index", len(chunk)):
+                        index_writer.append(chunk, county_idx)
+                if layers:
+                    with recorder.stage("match_geographies", len(chunk)):
+                        match_geographies(layers, county_idx, index.county_state, chunk)
+                new_count += len(chunk)
+        if writer is not None:
+            with recorder.stage("cache_store"):
+                meta = {"raw_count": raw_count, "match_stats": match_stats}
+                writer.commit(counties, county_counts, analytics.arrays, meta, int(result_cache_size * 1024 * 1024))
+                writer = None
+        if index_writer is not None:
+            with recorder.stage("visit_index", len(points)):
+                index_writer.commit(counties, index.county_state, states, analytics.arrays,
+                                    {"input": os.path.abspath(json_file), "raw_count": raw_count}, chunk_size)
+                index_writer = None
         
-        logging.info(f"Finding counties that match {len(points)} points")
-        matched = find_matching_counties(counties.copy(), points)
+        thin_reduction = 1.0 - new_count / raw_count if raw_count else 0.0
+        if thin:
+            logging.info(f"Thinned {raw_count} points to {new_count} ({thin_reduction:.1%} reduction)")
+        grid_hit_rate = match_stats["grid_hits"] / match_stats["points"] if match_stats["points"] else 0.0
+        logging.info(f"Matched {new_count} points to {len(counties)} candidate counties in {n_chunks} chunk(s), "
+                     f"grid hit rate {grid_hit_rate:.1%}")
         
-        # Get state names from matched counties
-        state_names = get_states_from_counties(matched, states)
+        # Out of core, the map (and the state's rendered points) come from weighted cells
+        rendered = points
+        if memory_budget and (output_map or (state_file and need_points)):
+            with recorder.stage("reduce", len(points)):
+                rendered = reduce_points(points, chunk_size)
+        
+        if state_file:
+            with recorder.stage("save_state", len(rendered)):
+                newest = int(points.timestamps.max()) if len(points) else NAT_TIMESTAMP
+                last_timestamp = max(since or NAT_TIMESTAMP, newest)
+                save_incremental_state(state_file, json_file, state_options, counties, county_counts,
+                                       analytics.arrays, last_timestamp, earlier_count + points.total_weight, extent,
+                                       rendered if need_points else None)
+        
+        with recorder.stage("aggregate", len(counties)):
+            matched = counties_with_counts(counties, county_counts)
+            for name, values in travel_columns(analytics.arrays, county_counts > 0).items():
+                matched[name] = values
+            # Get state names from matched counties
+            state_names = get_states_from_counties(matched, states)
+            state_table = state_travel(analytics.arrays, county_counts, index.county_state, states)
+            visited = visited_features(layers)
         logging.info(f"Found points in {len(state_names)} states: {', '.join(state_names)}")
         
-        logging.info("Generating interactive map")
-        generate_map(counties, matched, states, points, point_gdf, output_map, add_markers, state_names)
+        # Exports only read the results above, so they are written in a background
+        # thread while the map renders instead of after it
+        thumbnail_job = None
+        if export_geojson or export_csv or export_points or thumbnail:
+            exporter = None
+            if profile_stage in BACKGROUND_STAGES:
+                # cProfile only sees the thread that enables it, so a profiled export runs here before rendering
+                submit = run_now
+            else:
+                exporter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wanderglyph-export")
+                submit = exporter.submit
+            if export_geojson or export_csv or export_points:
+                exports.append(submit(write_exports, recorder, matched, visited, points, export_geojson,
+                                      export_csv, export_points, export_precision, chunk_size))
+            if thumbnail:
+                thumbnail_job = submit(write_thumbnail, recorder, counties, county_counts, states, points,
+                                       thumbnail, thumbnail_size, chunk_size)
+                exports.append(thumbnail_job)
+            if exporter is not None:
+                exporter.shutdown(wait=False)
         
-        if export_geojson and not matched.empty:
-            matched.to_file(export_geojson, driver='GeoJSON')
-            logging.info(f"GeoJSON exported to: {export_geojson}")
+        map_report = None
+        map_key = None
+        cache_entry = result_cache_entry(project_dir, cache_key) if cache_key else None
+        if output_map and cache_entry:
+            # Everything the page depends on besides the cached points and matches. The
+            # boundaries drawn are keyed by what was loaded, not by full_extent, since
+            # batch and serve pass in the full set
+            map_key = map_cache_key({"add_markers": add_markers, "map_options": map_options, "topojson": topojson,
+                                     "boundaries": [len(counties), len(states)],
+                                     "reduced_chunk_size": chunk_size if memory_budget else None,
+                                     "sidecar_stem": os.path.splitext(os.path.basename(output_map))[0]
+                                     if (map_options or {}).get("sidecars") else None}, visited)
+            with recorder.stage("render", len(rendered)):
+                map_report = load_cached_map(cache_entry, map_key, output_map)
+        map_cached = map_report is not None
+        if output_map and map_report is None:
+            # folium is only needed (and imported) when a map is rendered
+            from .visualization import generate_map
+            
+            logging.info("Generating interactive map")
+            topology = None
+            if topojson:
+                with recorder.stage("load_topology"):
+                    topology = load_boundary_topology(project_dir, lambda: read_boundary_shapefiles(project_dir))
+            with recorder.stage("render", len(rendered)):
+                map_report = generate_map(counties, matched, states, rendered, output_map, add_markers, state_names,
+                                          topology=topology, geographies=visited, **(map_options or {}))
+            if map_key:
+                with recorder.stage("cache_store"):
+                    save_cached_map(cache_entry, map_key, output_map, map_report, int(result_cache_size * 1024 * 1024))
         
-        if export_points and not point_gdf.empty:
-            point_gdf.to_file(export_points, driver='GeoJSON')
-            logging.info(f"Points exported to: {export_points}")
+        for export in exports:
+            export.result()
         
-        logging.info("Processing completed successfully")
+        if profile_stats:
+            recorder.dump_profile(profile_stats)
+        profile = recorder.report()
+        logging.info("Processing completed successfully in "
+                     + ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in profile["stages"].items()))
         
         return {
-            "points_count": len(points),
+            "points_count": earlier_count + points.total_weight,
+            "points_rendered": len(rendered),
+            "new_points": new_count,
+            "points_thinned": new_count,
+            "incremental": state is not None,
+            "thin_reduction": thin_reduction,
             "counties_matched": len(matched),
             "states_covered": len(state_names),
-            "state_names": state_names
+            "state_names": state_names,
+            "grid_hit_rate": grid_hit_rate,
+            "result_cache": None if cache_key is None else {"key": cache_key, "points": cached is not None,
+                                                            "matches": positions is not None, "map": map_cached},
+            "travel": travel_summary(analytics.arrays, state_table, matched),
+            "geographies": {name: {"candidates": len(layers[name]["features"]), "matched": len(features)}
+                            for name, features in visited.items()},
+            "map_report": map_report,
+            "thumbnail": thumbnail_job.result() if thumbnail_job else None,
+            "profile": profile
         }
         
     except Exception as e:
         logging.error(f"An error occurred: {e}", exc_info=True)
         raise
+    finally:
+        for export in exports:
+            # Never delete the spool under a running export
+            export.exception()
+        if spool is not None:
+            spool.close()
+        if writer is not None:
+            writer.discard()
+        if index_writer is not None:
+            index_writer.discard()
+
+def render_window(index_path, project_dir, start=None, end=None, output_map=None, add_markers=False,
+                  map_options=None, topojson=False, outputs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Map, thumbnail and/or county table of the points of a visit index in [start, end).
+    
+    outputs may set export_csv, thumbnail and thumbnail_size as for
+    process_data. The window's points are a memory-mapped slice of the index
+    and carry their county matches, so only the boundaries intersecting them
+    are loaded for drawing; nothing is parsed or matched again.
+    """
+    outputs = outputs or {}
+    export_csv = outputs.get("export_csv")
+    thumbnail = outputs.get("thumbnail")
+    thumbnail_size = outputs.get("thumbnail_size", DEFAULT_THUMBNAIL_SIZE)
+    index = VisitIndex(index_path)
+    points = index.points(start, end)
+    if len(points) == 0:
+        raise ValueError("No points in the selected time window")
+    counts, travel = index.window_arrays(start, end, chunk_size)
+    if export_csv:
+        index.county_table(counts, travel).to_csv(export_csv, index=False)
+        logging.info(f"County table exported to: {export_csv}")
+    
+    map_report = None
+    thumbnail_report = None
+    if output_map or thumbnail:
+        counties, states = load_shapefiles(project_dir, bbox=padded_extent(points.bounds()))
+        positions = pd.Index(counties['GEOID']).get_indexer(index.geoids)
+        county_counts, county_travel = cached_county_arrays({"counts": counts, "travel": travel}, positions,
+                                                            len(counties))
+        if thumbnail:
+            thumbnail_report = render_thumbnail(counties, county_counts, states, points, thumbnail, thumbnail_size,
+                                                chunk_size)
+        if output_map:
+            from .visualization import generate_map
+            
+            matched = counties_with_counts(counties, county_counts)
+            for name, values in travel_columns(county_travel, county_counts > 0).items():
+                matched[name] = values
+            state_names = get_states_from_counties(matched, states)
+            topology = None
+            if topojson:
+                topology = load_boundary_topology(project_dir, lambda: read_boundary_shapefiles(project_dir))
+            map_report = generate_map(counties, matched, states, points, output_map, add_markers, state_names,
+                                      topology=topology, **(map_options or {}))
+    return {"points": points.total_weight, "counties_matched": int(np.count_nonzero(counts)),
+            "map_report": map_report, "thumbnail": thumbnail_report}
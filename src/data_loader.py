@@ -1,93 +1,102 @@
 import os
-import json
 import logging
-import pandas as pd
 import geopandas as gpd
 from tqdm import tqdm
-from .coordinates import extract_coordinates
+from shapely.geometry import box
+from .points import PointStore
+from .readers import iter_point_chunks
+from .boundary_cache import boundary_shapefile_paths, boundary_cache_key, load_cached_boundaries, save_cached_boundaries, clear_boundary_cache
+from .defaults import DEFAULT_CHUNK_SIZE
 
-def load_shapefiles(project_dir):
-    """Load and prepare county and state shapefiles."""
-    county_path = os.path.join(project_dir, "tl_2024_us_county", "tl_2024_us_county.shp")
-    state_path = os.path.join(project_dir, "tl_2024_us_state", "tl_2024_us_state.shp")
+# Attribute columns the pipeline uses; everything else in the TIGER files is never read into the frames
+COUNTY_COLUMNS = ['GEOID', 'NAME', 'STATEFP']
+STATE_COLUMNS = ['STATEFP', 'NAME']
+# Padding around the points' extent (degrees) when loading only the boundaries they can touch
+EXTENT_MARGIN_DEG = 0.05
+
+def padded_extent(bounds, margin=EXTENT_MARGIN_DEG):
+    """(minx, miny, maxx, maxy) grown by margin on every side."""
+    minx, miny, maxx, maxy = bounds
+    return (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+def read_boundary_shapefiles(project_dir, bbox=None):
+    """Read the county and state shapefiles at full resolution, in WGS84, valid geometries only.
+    
+    Only COUNTY_COLUMNS / STATE_COLUMNS are kept; with bbox (WGS84 minx, miny,
+    maxx, maxy) only features intersecting it are read from the files.
+    """
+    county_path, state_path = boundary_shapefile_paths(project_dir)
     
     if not os.path.exists(county_path):
         raise FileNotFoundError(f"County shapefile not found: {county_path}")
     if not os.path.exists(state_path):
         raise FileNotFoundError(f"State shapefile not found: {state_path}")
     
-    # Load and reproject to WGS84 if needed
-    counties = gpd.read_file(county_path)
-    states = gpd.read_file(state_path)
-    
-    # Ensure proper CRS
-    if counties.crs is None or counties.crs.to_string() != 'EPSG:4326':
-        counties = counties.to_crs(epsg=4326)
-    if states.crs is None or states.crs.to_string() != 'EPSG:4326':
-        states = states.to_crs(epsg=4326)
-    
-    # Filter out invalid geometries
-    counties = counties[counties.geometry.is_valid].copy()
-    states = states[states.geometry.is_valid].copy()
-    
-    # Simplify geometries for performance
-    simplify_tolerance = 0.01  # Adjust based on your needs
-    counties['geometry'] = counties['geometry'].apply(
-        lambda g: g.simplify(simplify_tolerance).buffer(0) if g.is_valid else g)
-    states['geometry'] = states['geometry'].apply(
-        lambda g: g.simplify(simplify_tolerance).buffer(0) if g.is_valid else g)
-    
+    counties = read_layer_shapefile(county_path, COUNTY_COLUMNS, bbox)
+    states = read_layer_shapefile(state_path, STATE_COLUMNS, bbox)
     return counties, states
 
-def load_points_from_json(json_path):
-    """Load GPS points from JSON file with progress tracking."""
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse JSON file: {e}")
-        raise
-    except UnicodeDecodeError:
-        # Try with different encoding if UTF-8 fails
-        with open(json_path, 'r', encoding='latin-1') as f:
-            data = json.load(f)
+def read_layer_shapefile(path, columns, bbox=None):
+    """Read one shapefile in WGS84 with valid geometries and only the given attribute columns.
     
-    points = []
-    point_metadata = []  # Store additional data if needed
+    With bbox (WGS84 minx, miny, maxx, maxy) only intersecting features are read.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Shapefile not found: {path}")
     
-    # Extract points from the JSON structure
-    for segment in data.get("semanticSegments", []):
-        for path in segment.get("timelinePath", []):
-            point = extract_coordinates(path.get("point"))
-            if point:
-                points.append(point)
-                # Optionally store timestamp or other metadata
-                timestamp = path.get("timestamp", "")
-                point_metadata.append({"timestamp": timestamp})
+    # Read only the needed attribute columns (plus geometry), then reproject to WGS84 if needed
+    mask = gpd.GeoSeries([box(*bbox)], crs='EPSG:4326') if bbox is not None else None
+    gdf = gpd.read_file(path, bbox=mask, columns=list(columns))
+    if gdf.crs is None or gdf.crs.to_string() != 'EPSG:4326':
+        gdf = gdf.to_crs(epsg=4326)
     
-    logging.info(f"Extracted {len(points)} valid points from JSON")
-    return points, point_metadata
+    # Filter out invalid geometries, keeping the column order callers expect
+    gdf = gdf.loc[gdf.geometry.is_valid.to_numpy(), list(columns) + ['geometry']]
+    return gdf.reset_index(drop=True)
+
+def within_bbox(gdf, bbox):
+    """Rows of gdf whose bounds intersect bbox."""
+    bounds = gdf.geometry.bounds.to_numpy()
+    minx, miny, maxx, maxy = bbox
+    keep = (bounds[:, 0] <= maxx) & (bounds[:, 2] >= minx) & (bounds[:, 1] <= maxy) & (bounds[:, 3] >= miny)
+    return gdf[keep].reset_index(drop=True)
 
-def create_points_dataframe(points, metadata=None):
-    """Convert points list to GeoDataFrame with coordinates."""
-    if not points:
-        return gpd.GeoDataFrame()
+def load_shapefiles(project_dir, simplify_tolerance=0.01, use_cache=True, rebuild_cache=False, bbox=None):
+    """Load and prepare county and state shapefiles, reusing the boundary cache when possible.
     
-    # Extract coordinates as lat/lon pairs
-    coords = [(p.y, p.x) for p in points]
+    With bbox (minx, miny, maxx, maxy in WGS84) only the features intersecting
+    it are returned; the total county count, when known, is kept in
+    counties.attrs['total_features'].
+    """
+    key, payload = boundary_cache_key(boundary_shapefile_paths(project_dir), simplify_tolerance)
+    if rebuild_cache:
+        clear_boundary_cache(project_dir)
+    elif use_cache:
+        cached = load_cached_boundaries(project_dir, key, bbox, COUNTY_COLUMNS, STATE_COLUMNS)
+        if cached is not None:
+            counties, states = cached
+            logging.info(f"Loaded {len(counties)} counties and {len(states)} states from cache ({key})")
+            return counties, states
     
-    # Create DataFrame
-    df = pd.DataFrame({
-        'latitude': [p[0] for p in coords],
-        'longitude': [p[1] for p in coords],
-        'geometry': points
-    })
+    # Without a cache only the intersecting features are read from the shapefiles;
+    # a cache being built always covers the full extent
+    building = use_cache or rebuild_cache
+    counties, states = read_boundary_shapefiles(project_dir, bbox=None if building else bbox)
     
-    # Add metadata if available
-    if metadata and len(metadata) == len(points):
-        for key in metadata[0].keys():
-            df[key] = [m.get(key, "") for m in metadata]
+    # Simplify geometries for performance (vectorized over the whole column)
+    counties['geometry'] = counties.geometry.simplify(simplify_tolerance).buffer(0)
+    states['geometry'] = states.geometry.simplify(simplify_tolerance).buffer(0)
     
-    # Convert to GeoDataFrame
-    gdf = gpd.GeoDataFrame(df, geometry='geometry', crs="EPSG:4326")
-    return gdf
+    total = len(counties)
+    if building:
+        save_cached_boundaries(project_dir, key, payload, counties, states)
+        if bbox is not None:
+            counties, states = within_bbox(counties, bbox), within_bbox(states, bbox)
+        counties.attrs['total_features'] = total
+    return counties, states
+
+def load_points_from_json(json_path, chunk_size=DEFAULT_CHUNK_SIZE, input_format=None):
+    """Load all GPS points from a location history file (any registered format) into a single PointStore."""
+    points = PointStore.concat(iter_point_chunks(json_path, chunk_size, input_format=input_format))
+    logging.info(f"Extracted {len(points)} valid points from {json_path}")
+    return points
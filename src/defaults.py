@@ -0,0 +1,29 @@
+# Tunable defaults shared by the pipeline modules and the command line.
+# Kept free of third-party imports so the CLI can build its parser (and
+# answer --help) without loading numpy, pandas, geopandas or folium.
+
+# Points per streamed chunk; each point costs ~24 bytes once converted to arrays
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Stay-point thinning
+DEFAULT_THIN_DISTANCE_M = 50.0
+DEFAULT_THIN_MIN_STAY_S = 300
+
+# Decimals of exported coordinates (~0.1 m)
+DEFAULT_EXPORT_PRECISION = 6
+
+# Disk budget of the result cache (parsed points, county matches, maps), in MB
+DEFAULT_RESULT_CACHE_MB = 2048
+
+# Caps on what gets embedded into the map HTML
+DEFAULT_MAX_HEAT_BINS = 20_000
+DEFAULT_MAX_CLUSTER_POINTS = 60_000
+DEFAULT_MAX_RAW_POINTS = 1_000
+
+# Longer side of PNG thumbnails, in pixels
+DEFAULT_THUMBNAIL_SIZE = 512
+
+# Map service
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+DEFAULT_QUEUE_SIZE = 8
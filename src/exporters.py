@@ -0,0 +1,193 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+import shapely
+from .points import NAT_TIMESTAMP
+from .defaults import DEFAULT_CHUNK_SIZE, DEFAULT_EXPORT_PRECISION
+
+# Output format by file extension; anything else is written as a GeoJSON FeatureCollection
+EXPORT_FORMATS = {
+    '.parquet': 'parquet',
+    '.geoparquet': 'parquet',
+    '.ndjson': 'ndjson',
+    '.geojsonl': 'ndjson',
+    '.geojsons': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+WRITE_BUFFER_SIZE = 1 << 20
+_SPACE, _ZERO, _MINUS = (ord(c) for c in ' 0-')
+
+def export_format(path):
+    """'geojson', 'ndjson' or 'parquet' for an output path, from its extension."""
+    return EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), 'geojson')
+
+def _ascii(text, n):
+    """A constant text repeated as n rows of a uint8 byte matrix."""
+    return np.broadcast_to(np.frombuffer(text.encode('ascii'), dtype=np.uint8), (n, len(text)))
+
+def _integer_field(values, width, zero_padded=False):
+    """Non-negative integers as right-aligned ASCII digits in a (n, width) byte matrix."""
+    field = np.empty((len(values), width), dtype=np.uint8)
+    rest = values.copy()
+    for column in range(width - 1, -1, -1):
+        field[:, column] = _ZERO + rest % 10
+        rest //= 10
+    if zero_padded:
+        return field
+    # Leading zeros become spaces, which JSON allows before a number
+    leading = np.cumsum(field[:, :-1] != _ZERO, axis=1) == 0
+    field[:, :-1][leading] = _SPACE
+    return field
+
+def number_field(values, precision):
+    """Format numbers with a fixed number of decimals as equal-width, space-padded ASCII rows.
+    
+    Every row of the returned (n, width) uint8 matrix is a valid JSON
+    number preceded by spaces, so whole columns of features are laid out
+    with array operations instead of formatting each value in Python.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = np.rint(np.abs(values) * 10.0 ** precision).astype(np.int64)
+    negative = (values < 0) & (scaled > 0)
+    whole, fraction = np.divmod(scaled, 10 ** precision)
+    width = len(str(int(whole.max()))) + 1 if len(values) else 2
+    field = _integer_field(whole, width)
+    # The sign goes right before the first digit
+    first_digit = np.argmax(field != _SPACE, axis=1)
+    rows = np.flatnonzero(negative)
+    field[rows, first_digit[rows] - 1] = _MINUS
+    if precision <= 0:
+        return field
+    return np.hstack([field, _ascii('.', len(values)), _integer_field(fraction, precision, zero_padded=True)])
+
+def _time_field(timestamps):
+    """Epoch milliseconds as quoted ISO 8601 UTC strings (null, padded, where missing) in a byte matrix."""
+    missing = timestamps == NAT_TIMESTAMP
+    text = np.datetime_as_string(np.where(missing, 0, timestamps).astype('datetime64[ms]'), unit='ms')
+    # The strings are ASCII and all as long as the first, so their UCS-4 code points narrow directly to bytes
+    characters = text.view(np.uint32).reshape(len(text), -1)[:, :len(text[0]) if len(text) else 0].astype(np.uint8)
+    field = np.hstack([_ascii('"', len(text)), characters, _ascii('Z"', len(text))])
+    field[missing] = _SPACE
+    field[missing, :4] = np.frombuffer(b'null', dtype=np.uint8)
+    return field
+
+def point_properties(points):
+    """Properties written for every point, chosen once for the whole store so all chunks agree."""
+    names = ['latitude', 'longitude']
+    if points.has_timestamps:
+        names.append('timestamp')
+    if points.segment_ids is not None:
+        names.append('segment_id')
+    if points.weights is not None:
+        names.append('weight')
+    return names
+
+def point_feature_rows(chunk, properties, precision, separator):
+    """One GeoJSON Point Feature per point, each followed by separator, as bytes."""
+    n = len(chunk)
+    lon = number_field(chunk.lons, precision)
+    lat = number_field(chunk.lats, precision)
+    fields = {'latitude': lat, 'longitude': lon}
+    if 'timestamp' in properties:
+        fields['timestamp'] = _time_field(np.asarray(chunk.timestamps))
+    if 'segment_id' in properties:
+        fields['segment_id'] = number_field(chunk.segment_ids, 0)
+    if 'weight' in properties:
+        fields['weight'] = number_field(chunk.weight_array(), 0)
+    
+    parts = [_ascii('{"type":"Feature","geometry":{"type":"Point","coordinates":[', n), lon, _ascii(',', n), lat,
+             _ascii(']},"properties":{', n)]
+    for i, name in enumerate(properties):
+        parts += [_ascii(f'{"," if i else ""}"{name}":', n), fields[name]]
+    parts.append(_ascii('}}' + separator, n))
+    return np.hstack(parts).tobytes()
+
+def write_points_json(points, path, precision=DEFAULT_EXPORT_PRECISION, chunk_size=DEFAULT_CHUNK_SIZE,
+                      newline_delimited=False):
+    """Stream points as a GeoJSON FeatureCollection (or one Feature per line) chunk by chunk."""
+    properties = point_properties(points)
+    with open(path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        if not newline_delimited:
+            f.write(b'{"type":"FeatureCollection","features":[\n')
+        for offset in range(0, len(points), chunk_size):
+            rows = point_feature_rows(points[offset:offset + chunk_size], properties, precision,
+                                      '\n' if newline_delimited else ',\n')
+            if not newline_delimited and offset + chunk_size >= len(points):
+                rows = rows[:-2] + b'\n'
+            f.write(rows)
+        if not newline_delimited:
+            f.write(b']}\n')
+
+def _point_wkb(lons, lats):
+    """Little-endian WKB of 2D points as a pyarrow binary array, built without shapely objects."""
+    import pyarrow as pa
+    
+    wkb = np.empty(len(lons), dtype=[('order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')])
+    wkb['order'] = 1
+    wkb['type'] = 1
+    wkb['x'] = lons
+    wkb['y'] = lats
+    offsets = np.arange(0, 21 * len(lons) + 1, 21, dtype=np.int32)
+    return pa.Array.from_buffers(pa.binary(), len(lons), [None, pa.py_buffer(offsets), pa.py_buffer(wkb.tobytes())])
+
+def write_points_parquet(points, path, precision=DEFAULT_EXPORT_PRECISION, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream points to GeoParquet (WKB point geometry plus attribute columns) one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    properties = point_properties(points)
+    types = {'latitude': pa.float64(), 'longitude': pa.float64(), 'timestamp': pa.timestamp('ms', tz='UTC'),
+             'segment_id': pa.int64(), 'weight': pa.int64()}
+    bounds = [round(v, precision) for v in points.bounds()] if len(points) else []
+    geo = {"version": "1.0.0", "primary_column": "geometry",
+           "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"], "bbox": bounds}}}
+    schema = pa.schema([(name, types[name]) for name in properties] + [('geometry', pa.binary())],
+                       metadata={b'geo': json.dumps(geo).encode('utf-8')})
+    with pq.ParquetWriter(path, schema) as writer:
+        for offset in range(0, len(points), chunk_size):
+            chunk = points[offset:offset + chunk_size]
+            lons = np.round(chunk.lons.astype(np.float64), precision)
+            lats = np.round(chunk.lats.astype(np.float64), precision)
+            columns = {'latitude': lats, 'longitude': lons}
+            if 'timestamp' in properties:
+                columns['timestamp'] = pa.array(chunk.timestamps, type=pa.int64(),
+                                                mask=chunk.timestamps == NAT_TIMESTAMP).cast(types['timestamp'])
+            if 'segment_id' in properties:
+                columns['segment_id'] = chunk.segment_ids
+            if 'weight' in properties:
+                columns['weight'] = chunk.weight_array()
+            arrays = [pa.array(columns[name], type=types[name]) if not isinstance(columns[name], pa.Array)
+                      else columns[name] for name in properties]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays + [_point_wkb(lons, lats)], schema=schema))
+
+def write_point_export(points, path, precision=DEFAULT_EXPORT_PRECISION, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write a (possibly memory-mapped) PointStore in the format given by the path's extension."""
+    fmt = export_format(path)
+    if fmt == 'parquet':
+        write_points_parquet(points, path, precision, chunk_size)
+    else:
+        write_points_json(points, path, precision, chunk_size, newline_delimited=fmt == 'ndjson')
+
+def write_feature_export(gdf, path, precision=DEFAULT_EXPORT_PRECISION):
+    """Write polygon features (e.g. matched counties) in the format given by the path's extension.
+    
+    GeoJSON geometries are encoded by GEOS after rounding coordinates to
+    precision decimals and properties by pandas' JSON writer, one call each
+    for the whole frame.
+    """
+    fmt = export_format(path)
+    if fmt == 'parquet':
+        gdf.to_parquet(path)
+        return
+    
+    geometries = shapely.transform(gdf.geometry.to_numpy(), lambda coords: np.round(coords, precision))
+    properties = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).to_json(orient='records', lines=True)
+    rows = [f'{{"type":"Feature","properties":{props},"geometry":{geometry}}}'
+            for props, geometry in zip(properties.splitlines(), shapely.to_geojson(geometries))]
+    with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        if fmt == 'ndjson':
+            f.write('\n'.join(rows) + '\n')
+        else:
+            f.write('{"type":"FeatureCollection","features":[\n' + ',\n'.join(rows) + '\n]}\n')
@@ -1,45 +1,101 @@
 import logging
+import numpy as np
+import geopandas as gpd
+import shapely
 from tqdm import tqdm
-from shapely.errors import TopologicalError
+from .points import NAT_TIMESTAMP
+
+# Number of points handed to the STRtree per vectorized query; bounds the size
+# of the intermediate candidate-pair arrays on very long timelines.
+MATCH_CHUNK_SIZE = 250_000
+
+def prepared_geometries(gdf):
+    """Geometry column as a numpy object array of prepared shapely geometries."""
+    geoms = np.asarray(gdf.geometry.values, dtype=object)
+    shapely.prepare(geoms)
+    return geoms
+
+def query_containing(geoms, lons, lats, chunk_size=MATCH_CHUNK_SIZE):
+    """Positional index of the polygon in geoms containing each point (-1 if none)."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    
+    # Prepared once so every chunk's containment predicate reuses the indexed polygons
+    shapely.prepare(geoms)
+    
+    poly_of_point = np.full(len(lons), -1, dtype=np.int64)
+    if len(geoms) == 0:
+        return poly_of_point
+    starts = range(0, len(lons), chunk_size)
+    for start in tqdm(starts, desc="Matching points to counties", unit="chunk", disable=len(starts) < 2):
+        x = lons[start:start + chunk_size]
+        y = lats[start:start + chunk_size]
+        
+        # Index the chunk's points and let each prepared polygon claim the ones it contains
+        tree = shapely.STRtree(shapely.points(x, y))
+        poly_idx, pt_idx = tree.query(geoms, predicate="contains")
+        poly_of_point[start + pt_idx] = poly_idx
+    return poly_of_point
+
+def count_per_county(county_idx, n_counties, weights=None):
+    """Per-county (optionally weighted) point counts from per-point county indices."""
+    hit = county_idx >= 0
+    if weights is None:
+        return np.bincount(county_idx[hit], minlength=n_counties)
+    counts = np.bincount(county_idx[hit], weights=weights[hit], minlength=n_counties)
+    return np.rint(counts).astype(np.int64)
+
+def visit_time_bounds(county_idx, timestamps, n_counties):
+    """Earliest and latest timestamp per county (NAT_TIMESTAMP where never visited)."""
+    ok = (county_idx >= 0) & (timestamps != NAT_TIMESTAMP)
+    first = np.full(n_counties, np.iinfo(np.int64).max, dtype=np.int64)
+    last = np.full(n_counties, NAT_TIMESTAMP, dtype=np.int64)
+    np.minimum.at(first, county_idx[ok], timestamps[ok])
+    np.maximum.at(last, county_idx[ok], timestamps[ok])
+    first[first == np.iinfo(np.int64).max] = NAT_TIMESTAMP
+    return first, last
+
+def merge_visit_bounds(first_a, last_a, first_b, last_b):
+    """Combine two sets of per-county first/last visit timestamps."""
+    first = np.where(first_a == NAT_TIMESTAMP, first_b,
+                     np.where(first_b == NAT_TIMESTAMP, first_a, np.minimum(first_a, first_b)))
+    return first, np.maximum(last_a, last_b)
+
+def match_points_to_counties(counties, lons, lats, chunk_size=MATCH_CHUNK_SIZE, weights=None):
+    """Vectorized point-in-county matching.
+
+    Returns a per-point array of positional county indices (-1 where no county
+    contains the point) and a per-county array of point counts, each point
+    counting for its weight when weights are given.
+    """
+    county_idx = query_containing(prepared_geometries(counties), lons, lats, chunk_size)
+    return county_idx, count_per_county(county_idx, len(counties), weights)
+
+def counties_with_counts(counties, counts):
+    """Return the counties with a non-zero count, annotated with point_count."""
+    has_points = counts > 0
+    matched = counties[has_points].copy()
+    matched['point_count'] = counts[has_points]
+    logging.info(f"Found {len(matched)} counties matching {int(matched['point_count'].sum())} points")
+    return matched
 
 def find_matching_counties(counties, points):
-    """Find counties that contain at least one point using spatial index."""
-    if not points:
+    """Find counties that contain at least one point of a PointStore."""
+    if len(points) == 0:
         logging.warning("No points provided for matching")
         return gpd.GeoDataFrame(geometry=[])
     
-    # Create spatial index if it doesn't exist
-    if not hasattr(counties, 'sindex') or counties.sindex is None:
-        counties = counties.copy()  # Ensure we don't modify the original
-    
-    counties['point_count'] = 0  # Track number of points in each county
-    
-    for pt in tqdm(points, desc="Matching points to counties"):
-        try:
-            # Get candidate counties using spatial index
-            candidate_ids = list(counties.sindex.intersection(pt.bounds))
-            
-            for idx in candidate_ids:
-                county = counties.iloc[idx]
-                if county.geometry.contains(pt):
-                    counties.at[idx, 'point_count'] += 1
-        except (TopologicalError, IndexError) as e:
-            logging.debug(f"Error processing point {pt}: {e}")
-            continue
+    _, counts = match_points_to_counties(counties, points.lons, points.lats, weights=points.weights)
     
     # Return only counties with points
-    matched = counties[counties['point_count'] > 0].copy()
-    logging.info(f"Found {len(matched)} counties matching {sum(matched['point_count'])} points")
-    return matched
+    return counties_with_counts(counties, counts)
 
 def get_states_from_counties(matched_counties, states):
     """Get state names from matched counties using attribute join."""
     if matched_counties.empty:
         return []
     
-    # Join matched counties with states
-    states_subset = states[['STATEFP', 'NAME']].copy()
-    merged = matched_counties.merge(states_subset, how='left', left_on='STATEFP', right_on='STATEFP')
-    
-    state_names = sorted(merged['NAME_y'].dropna().unique().tolist())
+    # Look up the states of the matched counties by STATEFP (no join copy of the county frame)
+    visited = states['STATEFP'].isin(matched_counties['STATEFP'].unique())
+    state_names = sorted(states.loc[visited, 'NAME'].dropna().unique().tolist())
     return state_names
@@ -0,0 +1,120 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from .boundary_cache import boundary_cache_key, load_cached_layer, save_cached_layer
+from .data_loader import read_layer_shapefile, within_bbox
+from .spatial_index import LayerIndex
+
+# Finer TIGER/Line layers matched below the county level. "file" is the
+# shapefile stem ({statefp} for layers split per state), "id" and "label"
+# the attribute columns kept as GEOID and NAME, and "parent" the level whose
+# match narrows the candidates (tract GEOIDs start with their county's GEOID;
+# ZCTAs cross county lines, so they have none).
+GEOGRAPHY_LAYERS = {
+    'tract': {'file': 'tl_2024_{statefp}_tract', 'id': 'GEOID', 'label': 'NAMELSAD', 'parent': 'county',
+              'title': 'Census Tracts'},
+    'zcta': {'file': 'tl_2024_us_zcta520', 'id': 'GEOID20', 'label': 'ZCTA5CE20', 'parent': None,
+             'title': 'ZIP Code Tabulation Areas'},
+    'place': {'file': 'tl_2024_{statefp}_place', 'id': 'GEOID', 'label': 'NAMELSAD', 'parent': 'state',
+              'title': 'Places'},
+}
+# Fine layers are small, so they keep more detail than counties (~50 m instead of ~1 km)
+GEOGRAPHY_SIMPLIFY_TOLERANCE = 0.0005
+
+def geography_shapefile_paths(project_dir, name, statefps):
+    """(file stem, shapefile path) of every source file of a layer, one per state for per-state layers."""
+    pattern = GEOGRAPHY_LAYERS[name]['file']
+    stems = [pattern.format(statefp=fp) for fp in sorted(set(statefps))] if '{statefp}' in pattern else [pattern]
+    return [(stem, os.path.join(project_dir, stem, f"{stem}.shp")) for stem in stems]
+
+def load_geography_file(project_dir, stem, shp_path, spec, bbox=None, simplify_tolerance=GEOGRAPHY_SIMPLIFY_TOLERANCE):
+    """Load one layer shapefile through the boundary cache, as GEOID/NAME/geometry features within bbox."""
+    key, payload = boundary_cache_key([shp_path], simplify_tolerance)
+    features = load_cached_layer(project_dir, stem, key, bbox, ['GEOID', 'NAME'])
+    if features is not None:
+        return features
+    
+    features = read_layer_shapefile(shp_path, [spec['id'], spec['label']])
+    features = features.rename(columns={spec['id']: 'GEOID', spec['label']: 'NAME'})
+    features['geometry'] = features.geometry.simplify(simplify_tolerance).buffer(0)
+    save_cached_layer(project_dir, stem, key, payload, features)
+    return within_bbox(features, bbox) if bbox is not None else features
+
+def load_geography(project_dir, name, statefps, bbox=None):
+    """Load the features of a geography layer for the given states that intersect bbox.
+    
+    Per-state files that are missing are skipped with a warning, so a layer
+    can be provided for the visited states only.
+    """
+    spec = GEOGRAPHY_LAYERS[name]
+    frames = []
+    for stem, shp_path in geography_shapefile_paths(project_dir, name, statefps):
+        if not os.path.exists(shp_path):
+            logging.warning(f"Skipping {name} layer file (not found): {shp_path}")
+            continue
+        frames.append(load_geography_file(project_dir, stem, shp_path, spec, bbox))
+    if not frames:
+        return gpd.GeoDataFrame({'GEOID': [], 'NAME': []}, geometry=[], crs='EPSG:4326')
+    features = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs='EPSG:4326')
+    logging.info(f"Loaded {len(features)} {name} features from {len(frames)} file(s)")
+    return features
+
+def feature_parents(name, features, counties, states):
+    """Positional parent (county or state) of every feature, -1 where unknown, and the number of parents."""
+    parent = GEOGRAPHY_LAYERS[name]['parent']
+    if parent == 'county':
+        position = {geoid: i for i, geoid in enumerate(counties['GEOID'])}
+        return np.array([position.get(geoid[:5], -1) for geoid in features['GEOID']], dtype=np.int64), len(counties)
+    if parent == 'state':
+        position = {fp: i for i, fp in enumerate(states['STATEFP'])}
+        return np.array([position.get(geoid[:2], -1) for geoid in features['GEOID']], dtype=np.int64), len(states)
+    return np.full(len(features), -1, dtype=np.int64), 0
+
+def point_parents(name, county_idx, county_state):
+    """Positional parent of every point from its matched county (-1 where unmatched or the layer has none)."""
+    parent = GEOGRAPHY_LAYERS[name]['parent']
+    if parent == 'county':
+        return county_idx
+    if parent == 'state':
+        if len(county_state) == 0:
+            # No county was loaded, so every point is unmatched
+            return np.full(len(county_idx), -1, dtype=np.int64)
+        return np.where(county_idx >= 0, county_state[np.maximum(county_idx, 0)], -1)
+    return np.full(len(county_idx), -1, dtype=np.int64)
+
+def prepare_geographies(project_dir, names, counties, states, bbox=None):
+    """Load and index the requested layers for the states intersecting bbox.
+    
+    Returns {name: {"features", "index", "counts"}} with zeroed per-feature counts.
+    """
+    visible_states = within_bbox(states, bbox) if bbox is not None else states
+    layers = {}
+    for name in names:
+        features = load_geography(project_dir, name, visible_states['STATEFP'], bbox)
+        feature_parent, n_parents = feature_parents(name, features, counties, states)
+        layers[name] = {
+            "features": features,
+            "index": LayerIndex(features, feature_parent, n_parents),
+            "counts": np.zeros(len(features), dtype=np.int64),
+        }
+    return layers
+
+def match_geographies(layers, county_idx, county_state, points):
+    """Add one chunk's points to the per-feature counts of every layer, narrowed by their county match."""
+    for name, layer in layers.items():
+        parent_idx = point_parents(name, county_idx, county_state)
+        _, counts = layer["index"].match(points.lons, points.lats, parent_idx, points.weights)
+        layer["counts"] += counts
+
+def visited_features(layers):
+    """{name: features with a non-zero count, annotated with point_count} for rendering and export."""
+    visited = {}
+    for name, layer in layers.items():
+        has_points = layer["counts"] > 0
+        features = layer["features"][has_points].copy()
+        features['point_count'] = layer["counts"][has_points]
+        visited[name] = features
+        logging.info(f"Found {len(features)} of {len(has_points)} candidate {name} features with points")
+    return visited
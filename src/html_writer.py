@@ -0,0 +1,127 @@
+import os
+import gzip
+import json
+import logging
+import htmlmin
+from .map_layers import CompactPointLayer, TopologyData
+
+# Element attributes holding bulk data that are streamed into the output
+# instead of being rendered (and minified) as part of the page template
+PAYLOAD_ATTRIBUTES = {
+    CompactPointLayer: ('levels',),
+    TopologyData: ('topology',),
+}
+PLACEHOLDER = "__wanderglyph_payload_{}__"
+WRITE_BUFFER_SIZE = 1 << 20
+
+try:
+    from folium.plugins import HeatMap
+    PAYLOAD_ATTRIBUTES[HeatMap] = ('data',)
+except ImportError:
+    pass
+
+def _iter_elements(element):
+    """Depth-first walk over an element and all its children."""
+    yield element
+    for child in element._children.values():
+        yield from _iter_elements(child)
+
+def _extract_payloads(root):
+    """Swap bulk data attributes for placeholder tokens; returns [(element, attr, value)]."""
+    payloads = []
+    for element in _iter_elements(root):
+        for cls, attrs in PAYLOAD_ATTRIBUTES.items():
+            if not isinstance(element, cls):
+                continue
+            for attr in attrs:
+                value = getattr(element, attr)
+                if isinstance(value, (dict, list)):
+                    setattr(element, attr, PLACEHOLDER.format(len(payloads)))
+                    payloads.append((element, attr, value))
+    return payloads
+
+def _write_json(f, value):
+    """Stream compact JSON into an open text file, escaped for use inside a <script> tag."""
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    for chunk in encoder.iterencode(value):
+        # <, > and & can only occur inside JSON strings, where unicode escapes are equivalent
+        f.write(chunk.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026'))
+
+def _minify(html):
+    """Minify the static page; payloads are not part of it, so this stays small."""
+    try:
+        return htmlmin.minify(
+            html,
+            remove_empty_space=True,
+            remove_all_empty_space=False,  # Complete removal can break some JS
+            remove_optional_attribute_quotes=False  # Can cause issues with some HTML
+        )
+    except Exception as e:
+        logging.warning(f"HTML minification failed: {e}")
+        return html
+
+def write_map_html(m, output_path, compress=False, sidecars=False):
+    """Render a folium map to disk in a single streaming pass.
+    
+    The page template is rendered and minified with bulk data layers replaced
+    by placeholders; the static parts and the data payloads are then written
+    in order through one buffered file, so the output is never re-read.
+    compress gzips the page (adding .gz to the path). sidecars writes each
+    payload to <name>_data/payload_N.js, loaded by a script tag so the page
+    also works from file://. Returns the path written and the total sidecar size.
+    """
+    root = m.get_root()
+    payloads = _extract_payloads(root)
+    try:
+        html = root.render()
+    finally:
+        for element, attr, value in payloads:
+            setattr(element, attr, value)
+    html = _minify(html)
+    
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    sidecar_dir = os.path.join(os.path.dirname(output_path), f"{stem}_data")
+    references = []
+    sidecar_bytes = 0
+    if sidecars and payloads:
+        os.makedirs(sidecar_dir, exist_ok=True)
+        scripts = []
+        for i, (_, _, value) in enumerate(payloads):
+            path = os.path.join(sidecar_dir, f"payload_{i}.js")
+            with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(f"var wanderglyph_payload_{i} = ")
+                _write_json(f, value)
+                f.write(";\n")
+            sidecar_bytes += os.path.getsize(path)
+            scripts.append(f'<script src="{stem}_data/payload_{i}.js"></script>')
+            references.append(f"wanderglyph_payload_{i}")
+        html = html.replace("</head>", "".join(scripts) + "</head>", 1)
+    
+    # Split the page around the quoted placeholders left by the |tojson filter,
+    # in the order they appear in the page
+    positions = []
+    for i in range(len(payloads)):
+        token = json.dumps(PLACEHOLDER.format(i))
+        start = html.find(token)
+        if start < 0:
+            raise ValueError(f"Map payload {i} did not render into the page")
+        positions.append((start, start + len(token), i))
+    positions.sort()
+    
+    if compress and not output_path.endswith(".gz"):
+        output_path += ".gz"
+    if compress:
+        f = gzip.open(output_path, 'wt', encoding='utf-8', compresslevel=6)
+    else:
+        f = open(output_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+    with f:
+        written = 0
+        for start, end, i in positions:
+            f.write(html[written:start])
+            if references:
+                f.write(references[i])
+            else:
+                _write_json(f, payloads[i][2])
+            written = end
+        f.write(html[written:])
+    return output_path, sidecar_bytes
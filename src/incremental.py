@@ -0,0 +1,124 @@
+import os
+import json
+import logging
+import numpy as np
+from .points import PointStore
+from .analytics import empty_travel_arrays
+
+# Bump when the layout of the state file changes so old files are ignored
+STATE_VERSION = 3
+
+def state_points_path(state_file):
+    """Optional sidecar holding the processed point arrays needed to re-render the map."""
+    return f"{state_file}.points.npz"
+
+def load_incremental_state(state_file, json_file, options, need_points=False):
+    """Load the persisted aggregates, or None if absent or not reusable for this run.
+    
+    need_points asks for earlier runs' points too (to draw a map, export
+    points, render a thumbnail or match finer layers); a state saved
+    without them is then not reusable.
+    """
+    if not os.path.exists(state_file):
+        return None
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable state file {state_file}: {e}")
+        return None
+    
+    if state.get("version") != STATE_VERSION:
+        logging.info("State file version changed; reprocessing from scratch")
+        return None
+    if state.get("input") != os.path.abspath(json_file) or state.get("options") != options:
+        logging.info("Input file or processing options changed; reprocessing from scratch")
+        return None
+    if need_points and not (state.get("has_points") and os.path.exists(state_points_path(state_file))):
+        logging.info("State has no stored points, which this run needs; reprocessing from scratch")
+        return None
+    return state
+
+def state_county_arrays(state, counties):
+    """Expand the per-GEOID aggregates of a state into positional county counts and travel arrays."""
+    counts = np.zeros(len(counties), dtype=np.int64)
+    travel = empty_travel_arrays(len(counties))
+    if state is None:
+        return counts, travel
+    
+    position = {geoid: i for i, geoid in enumerate(counties['GEOID'])}
+    for geoid, agg in state["counties"].items():
+        i = position.get(geoid)
+        if i is None:
+            logging.warning(f"County {geoid} from state file not found in boundaries")
+            continue
+        counts[i] = agg["point_count"]
+        for name, values in travel.items():
+            values[i] = agg[name]
+    return counts, travel
+
+def state_extent(state, points):
+    """Extent of earlier runs' points (from the state) and of points, as (minx, miny, maxx, maxy)."""
+    bounds = [tuple(state["bounds"])] if state and state.get("bounds") else []
+    if len(points):
+        bounds.append(points.bounds())
+    if not bounds:
+        return None
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+def load_state_points(state_file):
+    """Points processed by earlier runs, in the same form they were rendered from."""
+    with np.load(state_points_path(state_file)) as data:
+        weights = data['weights'] if 'weights' in data.files else None
+        return PointStore(data['lons'], data['lats'], data['timestamps'], data['segment_ids'], weights=weights)
+
+def save_incremental_state(state_file, json_file, options, counties, counts, travel, last_timestamp, points_count,
+                           bounds, points=None):
+    """Persist per-county aggregates (counts and travel arrays), the high-water timestamp and the points' extent.
+    
+    The state itself stays small. The rendered points go to a sidecar only
+    when points is given, i.e. when the run needs earlier points again
+    (maps, point exports, thumbnails, finer layers); otherwise any older
+    sidecar is removed.
+    """
+    visited = np.flatnonzero(counts > 0)
+    state = {
+        "version": STATE_VERSION,
+        "input": os.path.abspath(json_file),
+        "options": options,
+        "last_timestamp": int(last_timestamp),
+        "points_count": int(points_count),
+        "bounds": list(bounds) if bounds else None,
+        "has_points": points is not None,
+        "counties": {
+            geoid: {"point_count": int(counts[i]), **{name: values[i].item() for name, values in travel.items()}}
+            for geoid, i in zip(counties['GEOID'].to_numpy()[visited], visited)
+        },
+    }
+    
+    if points is None:
+        with open(state_file + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(state_file + ".tmp", state_file)
+        if os.path.exists(state_points_path(state_file)):
+            os.remove(state_points_path(state_file))
+        logging.info(f"Incremental state saved to: {state_file}")
+        return
+    
+    arrays = {
+        "lons": points.lons,
+        "lats": points.lats,
+        "timestamps": points.timestamps,
+        "segment_ids": points.segment_ids if points.segment_ids is not None else np.full(len(points), -1),
+    }
+    if points.weights is not None:
+        arrays["weights"] = points.weights
+    
+    # Write both files under temporary names first so an interrupted run
+    # never leaves aggregates that disagree with the stored points
+    np.savez(state_points_path(state_file) + ".tmp.npz", **arrays)
+    with open(state_file + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(state_points_path(state_file) + ".tmp.npz", state_points_path(state_file))
+    os.replace(state_file + ".tmp", state_file)
+    logging.info(f"Incremental state saved to: {state_file}")
@@ -0,0 +1,126 @@
+from jinja2 import Template
+from branca.element import MacroElement, JavascriptLink
+from folium.map import Layer
+
+# Same topojson client folium's own TopoJson layer loads
+TOPOJSON_JS_URL = 'https://cdnjs.cloudflare.com/ajax/libs/topojson/1.6.9/topojson.min.js'
+
+class CompactPointLayer(Layer):
+    """Leaflet layer drawing precomputed point clusters from compact arrays.
+    
+    levels maps a zoom level to a flat [lat, lon, weight, ...] list (see
+    aggregation.encode_levels); the layer shows the deepest level not finer
+    than the current zoom, drawing only the clusters in view on one shared
+    canvas renderer instead of emitting a Leaflet marker object per point.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(map) {
+                var levels = {{ this.levels|tojson }};
+                var zooms = Object.keys(levels).map(Number).sort(function(a, b) { return a - b; });
+                var renderer = L.canvas({padding: 0.5});
+                var group = L.layerGroup();
+                function levelFor(zoom) {
+                    var best = zooms[0];
+                    for (var i = 0; i < zooms.length; i++) {
+                        if (zooms[i] <= zoom) { best = zooms[i]; }
+                    }
+                    return levels[best];
+                }
+                function redraw() {
+                    if (!map.hasLayer(group)) { return; }
+                    group.clearLayers();
+                    var data = levelFor(map.getZoom());
+                    var view = map.getBounds().pad(0.25);
+                    for (var i = 0; i < data.length; i += 3) {
+                        var lat = data[i], lon = data[i + 1], weight = data[i + 2];
+                        if (!view.contains([lat, lon])) { continue; }
+                        L.circleMarker([lat, lon], {
+                            renderer: renderer,
+                            radius: Math.min({{ this.radius }} + 2 * Math.log(weight), {{ this.max_radius }}),
+                            color: {{ this.color|tojson }},
+                            fillColor: {{ this.color|tojson }},
+                            fillOpacity: 0.7,
+                            weight: 1
+                        }).bindTooltip(weight > 1 ? weight + " points"
+                                       : lat.toFixed(6) + ", " + lon.toFixed(6)).addTo(group);
+                    }
+                }
+                map.on("zoomend moveend", redraw);
+                group.on("add", redraw);
+                return group;
+            })({{ this._parent.get_name() }});
+            {% if this.show %}
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+            {% endif %}
+        {% endmacro %}
+        """)
+    
+    def __init__(self, levels, name=None, color='blue', radius=3, max_radius=20, show=True):
+        super(CompactPointLayer, self).__init__(name=name, overlay=True, control=True, show=show)
+        self._name = 'CompactPointLayer'
+        self.levels = levels
+        self.color = color
+        self.radius = radius
+        self.max_radius = max_radius
+
+class TopologyData(MacroElement):
+    """Embeds one TopoJSON document in the page so several layers can share its arcs."""
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = {{ this.topology|tojson }};
+        {% endmacro %}
+        """)
+    
+    def __init__(self, topology):
+        super(TopologyData, self).__init__()
+        self._name = 'TopologyData'
+        self.topology = topology
+    
+    def render(self, **kwargs):
+        """Add the topojson client library to the page header once."""
+        figure = self.get_root()
+        figure.header.add_child(JavascriptLink(TOPOJSON_JS_URL), name='topojson')
+        super(TopologyData, self).render(**kwargs)
+
+class TopoJsonObjectLayer(Layer):
+    """Leaflet GeoJSON layer decoded client-side from one object of a shared TopologyData.
+    
+    Features are filled with their "fill" property when present; tooltip is a
+    list of (property, label) pairs shown on hover.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.geoJson(
+                topojson.feature({{ this.data.get_name() }}, {{ this.data.get_name() }}.objects[{{ this.object_name|tojson }}]),
+                {
+                    style: function(feature) {
+                        var style = {{ this.style|tojson }};
+                        if (feature.properties.fill) { style.fillColor = feature.properties.fill; }
+                        return style;
+                    },
+                    {% if this.tooltip %}
+                    onEachFeature: function(feature, layer) {
+                        var fields = {{ this.tooltip|tojson }};
+                        var rows = fields.map(function(field) {
+                            var value = feature.properties[field[0]];
+                            return "<b>" + field[1] + "</b> " + (typeof value === "number" ? value.toLocaleString() : value);
+                        });
+                        layer.bindTooltip(rows.join("<br>"), {sticky: true});
+                    }
+                    {% endif %}
+                }
+            );
+            {% if this.show %}
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+            {% endif %}
+        {% endmacro %}
+        """)
+    
+    def __init__(self, data, object_name, name=None, style=None, tooltip=None, control=True, show=True):
+        super(TopoJsonObjectLayer, self).__init__(name=name, overlay=True, control=control, show=show)
+        self._name = 'TopoJsonObjectLayer'
+        self.data = data
+        self.object_name = object_name
+        self.style = style or {}
+        self.tooltip = [list(field) for field in tooltip] if tooltip else None
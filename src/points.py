@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Sentinel for missing/unparseable timestamps (same bit pattern as pandas NaT)
+NAT_TIMESTAMP = np.iinfo(np.int64).min
+
+class PointStore:
+    """Columnar container for timeline points.
+    
+    Coordinates live in contiguous lon/lat arrays, timestamps as int64 epoch
+    milliseconds and, optionally, the index of the source segment each point
+    came from and a weight (how many raw points it stands for after
+    thinning). Shapely geometries are only built on demand.
+    """
+    
+    def __init__(self, lons, lats, timestamps=None, segment_ids=None, coord_dtype=np.float64, weights=None):
+        self.lons = np.ascontiguousarray(lons, dtype=coord_dtype)
+        self.lats = np.ascontiguousarray(lats, dtype=coord_dtype)
+        if timestamps is None:
+            timestamps = np.full(len(self.lons), NAT_TIMESTAMP, dtype=np.int64)
+        self.timestamps = np.ascontiguousarray(timestamps, dtype=np.int64)
+        self.segment_ids = None if segment_ids is None else np.ascontiguousarray(segment_ids, dtype=np.int64)
+        self.weights = None if weights is None else np.ascontiguousarray(weights, dtype=np.int64)
+    
+    def __len__(self):
+        return len(self.lons)
+    
+    def __getitem__(self, index):
+        """Select points by slice, integer array or boolean mask."""
+        return PointStore(
+            self.lons[index],
+            self.lats[index],
+            self.timestamps[index],
+            None if self.segment_ids is None else self.segment_ids[index],
+            coord_dtype=self.lons.dtype,
+            weights=None if self.weights is None else self.weights[index],
+        )
+    
+    @classmethod
+    def empty(cls, coord_dtype=np.float64):
+        return cls(np.empty(0), np.empty(0), coord_dtype=coord_dtype)
+    
+    @classmethod
+    def concat(cls, stores):
+        """Concatenate several stores (e.g. streamed chunks) into one."""
+        stores = list(stores)
+        if not stores:
+            return cls.empty()
+        segment_ids = None
+        if all(s.segment_ids is not None for s in stores):
+            segment_ids = np.concatenate([s.segment_ids for s in stores])
+        weights = None
+        if any(s.weights is not None for s in stores):
+            weights = np.concatenate([s.weight_array() for s in stores])
+        return cls(
+            np.concatenate([s.lons for s in stores]),
+            np.concatenate([s.lats for s in stores]),
+            np.concatenate([s.timestamps for s in stores]),
+            segment_ids,
+            coord_dtype=stores[0].lons.dtype,
+            weights=weights,
+        )
+    
+    @property
+    def has_timestamps(self):
+        return bool(np.any(self.timestamps != NAT_TIMESTAMP))
+    
+    @property
+    def total_weight(self):
+        """Number of raw points represented (equals len() unless thinned)."""
+        return len(self) if self.weights is None else int(self.weights.sum())
+    
+    def weight_array(self):
+        """Per-point weights, ones when the store has not been thinned."""
+        return np.ones(len(self), dtype=np.int64) if self.weights is None else self.weights
+    
+    @property
+    def nbytes(self):
+        total = self.lons.nbytes + self.lats.nbytes + self.timestamps.nbytes
+        for extra in (self.segment_ids, self.weights):
+            if extra is not None:
+                total += extra.nbytes
+        return total
+    
+    def bounds(self):
+        """Extent as (minx, miny, maxx, maxy)."""
+        return (float(self.lons.min()), float(self.lats.min()), float(self.lons.max()), float(self.lats.max()))
+    
+    def datetimes(self):
+        """Timestamps as a UTC pandas DatetimeIndex (NaT where missing)."""
+        return pd.to_datetime(self.timestamps, unit='ms', utc=True)
+    
+    def geometry(self):
+        """Materialize shapely Points; only needed when exporting geometries."""
+        return shapely.points(self.lons.astype(np.float64), self.lats.astype(np.float64))
+    
+    def to_geodataframe(self):
+        """Convert to a GeoDataFrame with latitude/longitude/timestamp columns."""
+        if len(self) == 0:
+            return gpd.GeoDataFrame()
+        
+        df = pd.DataFrame({'latitude': self.lats, 'longitude': self.lons})
+        if self.has_timestamps:
+            df['timestamp'] = self.datetimes()
+        if self.segment_ids is not None:
+            df['segment_id'] = self.segment_ids
+        if self.weights is not None:
+            df['weight'] = self.weights
+        return gpd.GeoDataFrame(df, geometry=self.geometry(), crs="EPSG:4326")
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class StageRecorder:
+    """Collects wall/CPU time, peak RSS growth and item counts for named pipeline stages.
+    
+    A stage may be entered several times (e.g. once per streamed chunk); its
+    metrics accumulate. Stages may also run on other threads (background
+    exports); updates are serialized by a lock, and CPU time is that of the
+    stage's own thread, so concurrent stages do not count each other. Every
+    hook is called with a dict for each stage "start" and "end" event. With
+    profile_stage, that stage runs under cProfile and its stats can be
+    written with dump_profile(); cProfile only sees the thread that enables
+    it, so the stage is only profiled when it runs on the thread that
+    created the recorder.
+    """
+    
+    def __init__(self, hooks=None, profile_stage=None):
+        self.hooks = list(hooks or [])
+        self.stages = {}
+        self.profile_stage = profile_stage
+        self.profiler = cProfile.Profile() if profile_stage else None
+        self.thread = threading.get_ident()
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+    
+    def _emit(self, event):
+        """Send a stage event to every hook; a failing hook never breaks the run."""
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logging.warning(f"Stage hook {hook!r} failed: {e}")
+    
+    @contextmanager
+    def stage(self, name, items=None):
+        """Time the enclosed block as (part of) stage name, counting items processed."""
+        self._emit({"event": "start", "stage": name})
+        rss_before = peak_rss_mb()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        profiling = self.profiler is not None and name == self.profile_stage and threading.get_ident() == self.thread
+        if profiling:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if profiling:
+                self.profiler.disable()
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            rss_after = peak_rss_mb()
+            with self.lock:
+                entry = self.stages.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_delta_mb": 0.0,
+                                                      "items": 0, "calls": 0})
+                entry["seconds"] += wall
+                entry["cpu_seconds"] += cpu
+                entry["items"] += items or 0
+                entry["calls"] += 1
+                if rss_before is not None:
+                    entry["peak_rss_delta_mb"] += rss_after - rss_before
+            self._emit({"event": "end", "stage": name, "seconds": wall, "cpu_seconds": cpu, "items": items})
+    
+    def iterate(self, name, iterable, count=len):
+        """Yield from iterable, timing each step as stage name and counting count(item) items."""
+        iterator = iter(iterable)
+        done = object()
+        while True:
+            with self.stage(name):
+                item = next(iterator, done)
+            if item is done:
+                return
+            with self.lock:
+                self.stages[name]["items"] += count(item)
+            yield item
+    
+    def report(self):
+        """Per-stage metrics with throughput, plus total wall time and process peak RSS."""
+        stages = {}
+        with self.lock:
+            entries = {name: dict(entry) for name, entry in self.stages.items()}
+        for name, entry in entries.items():
+            stages[name] = {
+                "seconds": round(entry["seconds"], 4),
+                "cpu_seconds": round(entry["cpu_seconds"], 4),
+                "peak_rss_delta_mb": round(entry["peak_rss_delta_mb"], 2),
+                "items": entry["items"],
+                "calls": entry["calls"],
+                "throughput": round(entry["items"] / entry["seconds"], 1) if entry["items"] and entry["seconds"] > 0 else None,
+            }
+        peak = peak_rss_mb()
+        return {
+            "stages": stages,
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "peak_rss_mb": round(peak, 2) if peak is not None else None,
+        }
+    
+    def dump_profile(self, path):
+        """Write cProfile stats of the profiled stage (readable with pstats)."""
+        if self.profiler is None:
+            return
+        self.profiler.dump_stats(path)
+        logging.info(f"Profile of stage '{self.profile_stage}' written to: {path}")
+
+def write_profile_report(path, report):
+    """Save a stage report as JSON."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Stage profile written to: {path}")
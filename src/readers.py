@@ -0,0 +1,296 @@
+import os
+import json
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from .coordinates import parse_lat_lon_strings
+from .points import PointStore, NAT_TIMESTAMP
+from .defaults import DEFAULT_CHUNK_SIZE
+
+# pandas >= 2 infers a single format from the first element unless told to accept any ISO-8601 variant
+_ISO_FORMAT = {'format': 'ISO8601'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+
+# Bytes read from the start of a file to detect its format
+SNIFF_BYTES = 1 << 16
+# Takeout wrote some E7 coordinates as unsigned 32-bit values; these bounds mark the overflowed ones
+E7_LAT_OVERFLOW = 900_000_000
+E7_LON_OVERFLOW = 1_800_000_000
+E7_WRAP = 1 << 32
+
+CSV_LAT_COLUMNS = ('latitude', 'lat')
+CSV_LON_COLUMNS = ('longitude', 'lon', 'lng', 'long')
+CSV_TIME_COLUMNS = ('timestamp', 'time', 'datetime', 'date_time', 'date')
+
+def _load_json_document(json_path):
+    """Parse a whole JSON file, falling back to latin-1 if UTF-8 decoding fails."""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse JSON file: {e}")
+        raise
+    except UnicodeDecodeError:
+        # Try with different encoding if UTF-8 fails
+        with open(json_path, 'r', encoding='latin-1') as f:
+            return json.load(f)
+
+def iter_json_array(json_path, key):
+    """Yield the items of the top-level array json_path[key], streaming the file when ijson is available."""
+    try:
+        import ijson
+    except ImportError:
+        logging.warning("ijson not installed; loading the whole JSON file into memory")
+        yield from _load_json_document(json_path).get(key, [])
+        return
+    
+    try:
+        with open(json_path, 'rb') as f:
+            yield from ijson.items(f, f'{key}.item', use_float=True)
+    except ijson.JSONError as e:
+        logging.error(f"Failed to parse JSON file: {e}")
+        raise
+
+def iter_timeline_segments(json_path):
+    """Yield semanticSegments one at a time."""
+    yield from iter_json_array(json_path, "semanticSegments")
+
+def timestamps_to_epoch_ms(values):
+    """Convert ISO-8601 strings to int64 epoch milliseconds (NAT_TIMESTAMP where missing)."""
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', **_ISO_FORMAT)
+    ns = parsed.values.astype('datetime64[ns]').view(np.int64)
+    return np.where(ns == NAT_TIMESTAMP, NAT_TIMESTAMP, ns // 1_000_000)
+
+def segment_end_ms(segment):
+    """Epoch milliseconds of a segment's endTime, or None if absent/unparseable."""
+    end_time = segment.get("endTime")
+    if not isinstance(end_time, str):
+        return None
+    try:
+        return int(datetime.fromisoformat(end_time.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+def iter_timeline_chunks(json_path, chunk_size=DEFAULT_CHUNK_SIZE, coord_dtype=np.float64, since=None):
+    """Stream a semantic timeline (semanticSegments[].timelinePath[]) as PointStore chunks.
+    
+    Raw point strings and timestamps are buffered per chunk and converted a
+    whole column at a time, so peak memory is proportional to chunk_size
+    (plus one segment), not to the file size. With since (epoch ms), segments
+    ending at or before it are skipped without parsing their points, and
+    older or untimed points of straddling segments are dropped.
+    """
+    raw_points, raw_times, segment_ids = [], [], []
+    
+    def flush():
+        lat, lon, valid = parse_lat_lon_strings(raw_points)
+        times = timestamps_to_epoch_ms(raw_times)
+        if since is not None:
+            # Untimed points were counted by the run that set since (NAT_TIMESTAMP is never > since)
+            valid &= times > since
+        chunk = PointStore(lon[valid], lat[valid], times[valid],
+                           np.array(segment_ids, dtype=np.int64)[valid], coord_dtype=coord_dtype)
+        raw_points.clear()
+        raw_times.clear()
+        segment_ids.clear()
+        return chunk
+    
+    for segment_id, segment in enumerate(iter_timeline_segments(json_path)):
+        if since is not None:
+            end_ms = segment_end_ms(segment)
+            if end_ms is not None and end_ms <= since:
+                continue
+        for path in segment.get("timelinePath", []):
+            raw_points.append(path.get("point"))
+            raw_times.append(path.get("time", path.get("timestamp", "")))
+            segment_ids.append(segment_id)
+            if len(raw_points) >= chunk_size:
+                yield flush()
+    
+    if raw_points:
+        yield flush()
+
+def _float_column(values):
+    """Convert a list of numbers or numeric strings to float64 (NaN where missing or malformed)."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+def _points_chunk(lat, lon, times, segment_ids, coord_dtype, since):
+    """Build a PointStore from parsed columns, dropping invalid coordinates and points not after since (untimed included)."""
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    if since is not None:
+        # Untimed points were counted by the run that set since (NAT_TIMESTAMP is never > since)
+        valid &= times > since
+    segment_ids = None if segment_ids is None else np.asarray(segment_ids, dtype=np.int64)[valid]
+    return PointStore(lon[valid], lat[valid], times[valid], segment_ids, coord_dtype=coord_dtype)
+
+def decode_e7(values, overflow):
+    """Decode integer E7 coordinates, undoing unsigned 32-bit overflow."""
+    e7 = _float_column(values)
+    e7 = np.where(e7 > overflow, e7 - E7_WRAP, e7)
+    return e7 * 1e-7
+
+def iter_records_chunks(json_path, chunk_size=DEFAULT_CHUNK_SIZE, coord_dtype=np.float64, since=None):
+    """Stream a Takeout Records.json (locations[] with latitudeE7/longitudeE7) as PointStore chunks.
+    
+    Only the raw E7 integers and timestamps are buffered per chunk; decoding
+    runs once per column. Both timestamp (ISO-8601) and the older timestampMs
+    are understood.
+    """
+    lat_e7, lon_e7, iso_times, ms_times = [], [], [], []
+    
+    def flush():
+        times = _float_column(ms_times)
+        missing = np.isnan(times)
+        times = np.where(missing, 0, times).astype(np.int64)
+        if missing.any():
+            times[missing] = timestamps_to_epoch_ms([iso_times[i] for i in np.flatnonzero(missing)])
+        chunk = _points_chunk(decode_e7(lat_e7, E7_LAT_OVERFLOW), decode_e7(lon_e7, E7_LON_OVERFLOW),
+                              times, None, coord_dtype, since)
+        for column in (lat_e7, lon_e7, iso_times, ms_times):
+            column.clear()
+        return chunk
+    
+    for record in iter_json_array(json_path, "locations"):
+        lat_e7.append(record.get("latitudeE7"))
+        lon_e7.append(record.get("longitudeE7"))
+        iso_times.append(record.get("timestamp"))
+        ms_times.append(record.get("timestampMs"))
+        if len(lat_e7) >= chunk_size:
+            yield flush()
+    
+    if lat_e7:
+        yield flush()
+
+def iter_gpx_chunks(gpx_path, chunk_size=DEFAULT_CHUNK_SIZE, coord_dtype=np.float64, since=None):
+    """Stream GPX track, route and waypoint points as PointStore chunks.
+    
+    The XML is parsed incrementally and every point element is discarded
+    once its lat/lon attributes and <time> are buffered. Each trkseg or rte
+    gets its own segment id (waypoints get -1).
+    """
+    lats, lons, times, segment_ids = [], [], [], []
+    
+    def flush():
+        chunk = _points_chunk(_float_column(lats), _float_column(lons), timestamps_to_epoch_ms(times),
+                              segment_ids, coord_dtype, since)
+        for column in (lats, lons, times, segment_ids):
+            column.clear()
+        return chunk
+    
+    # Points are read on their end events; the <time> child ends just before its point
+    local_names = {}
+    segment_id = 0
+    time = None
+    for _, element in ET.iterparse(gpx_path, events=('end',)):
+        tag = local_names.get(element.tag)
+        if tag is None:
+            tag = local_names.setdefault(element.tag, element.tag.rsplit('}', 1)[-1])
+        if tag == 'time':
+            time = element.text
+        elif tag in ('trkpt', 'rtept', 'wpt'):
+            lats.append(element.get('lat'))
+            lons.append(element.get('lon'))
+            times.append(time)
+            segment_ids.append(segment_id if tag != 'wpt' else -1)
+            time = None
+            element.clear()
+            if len(lats) >= chunk_size:
+                yield flush()
+        elif tag in ('trkseg', 'rte'):
+            segment_id += 1
+            # Drop the segment's (already cleared) points
+            element.clear()
+        elif tag == 'metadata':
+            time = None
+    
+    if lats:
+        yield flush()
+
+def _find_column(columns, names):
+    """First column whose lowercased name is in names, or None."""
+    lowered = {str(column).strip().lower(): column for column in columns}
+    return next((lowered[name] for name in names if name in lowered), None)
+
+def _csv_times(values):
+    """Epoch milliseconds from a CSV time column of ISO strings or epoch seconds/milliseconds."""
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = values.to_numpy(dtype=np.float64)
+        # Epoch seconds stay below 1e11 until the year 5138
+        ms = np.where(np.abs(numbers) < 1e11, numbers * 1000, numbers)
+        return np.where(np.isnan(ms), NAT_TIMESTAMP, np.nan_to_num(ms)).astype(np.int64)
+    return timestamps_to_epoch_ms(values.tolist())
+
+def iter_csv_chunks(csv_path, chunk_size=DEFAULT_CHUNK_SIZE, coord_dtype=np.float64, since=None):
+    """Stream a CSV (or .tsv) with latitude/longitude and optional timestamp columns as PointStore chunks.
+    
+    Column names are matched case-insensitively (lat/latitude, lon/lng/longitude,
+    time/timestamp/datetime); only those columns are read.
+    """
+    sep = '\t' if csv_path.lower().endswith('.tsv') else ','
+    header = pd.read_csv(csv_path, sep=sep, nrows=0).columns
+    lat_column = _find_column(header, CSV_LAT_COLUMNS)
+    lon_column = _find_column(header, CSV_LON_COLUMNS)
+    time_column = _find_column(header, CSV_TIME_COLUMNS)
+    if lat_column is None or lon_column is None:
+        raise ValueError(f"No latitude/longitude columns found in {csv_path}: {list(header)}")
+    
+    columns = [c for c in (lat_column, lon_column, time_column) if c is not None]
+    for frame in pd.read_csv(csv_path, sep=sep, usecols=columns, chunksize=chunk_size):
+        lat = pd.to_numeric(frame[lat_column], errors='coerce').to_numpy(dtype=np.float64)
+        lon = pd.to_numeric(frame[lon_column], errors='coerce').to_numpy(dtype=np.float64)
+        if time_column is not None:
+            times = _csv_times(frame[time_column])
+        else:
+            times = np.full(len(frame), NAT_TIMESTAMP, dtype=np.int64)
+        yield _points_chunk(lat, lon, times, None, coord_dtype, since)
+
+# Registered location history readers: name -> reader, file extensions and content markers
+READERS = {}
+
+def register_reader(name, reader, extensions=(), markers=()):
+    """Register a reader for detect_format and iter_point_chunks.
+    
+    reader(path, chunk_size, coord_dtype, since) must yield PointStore
+    chunks. extensions (lowercase, with the dot) and byte strings expected
+    near the start of matching files are used for auto-detection.
+    """
+    READERS[name] = {"reader": reader, "extensions": tuple(extensions), "markers": tuple(markers)}
+
+register_reader('timeline', iter_timeline_chunks, ('.json',), (b'"semanticSegments"',))
+register_reader('records', iter_records_chunks, ('.json',), (b'"locations"', b'"latitudeE7"'))
+register_reader('gpx', iter_gpx_chunks, ('.gpx', '.xml'), (b'<gpx',))
+register_reader('csv', iter_csv_chunks, ('.csv', '.tsv'))
+
+def supported_extensions():
+    """File extensions of every registered reader."""
+    return sorted({ext for spec in READERS.values() for ext in spec["extensions"]})
+
+def detect_format(path):
+    """Name of the registered reader for path, from its content markers and extension."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    candidates = [name for name, spec in READERS.items() if extension in spec["extensions"]] or list(READERS)
+    for name in candidates:
+        if any(marker in head for marker in READERS[name]["markers"]):
+            return name
+    if len(candidates) == 1:
+        return candidates[0]
+    raise ValueError(f"Cannot detect the format of {path}; choose one of: {', '.join(READERS)}")
+
+def iter_point_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, coord_dtype=np.float64, since=None, input_format=None):
+    """Stream any supported location history file as PointStore chunks.
+    
+    input_format names a registered reader; by default it is detected from
+    the file. With since (epoch ms), only newer points are returned; points
+    without a timestamp are dropped too, as the run that set since saw them.
+    """
+    name = input_format or detect_format(path)
+    if name not in READERS:
+        raise ValueError(f"Unknown input format '{name}'; choose one of: {', '.join(READERS)}")
+    logging.info(f"Reading {path} as {name}")
+    yield from READERS[name]["reader"](path, chunk_size, coord_dtype, since)
@@ -0,0 +1,293 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+import shapely
+from .boundary_cache import CACHE_DIR_NAME, boundary_shapefile_paths, boundary_cache_key
+from .points import PointStore
+from .analytics import TRAVEL_ARRAYS, empty_travel_arrays
+
+# Bump when the layout of an entry changes so old entries are ignored
+RESULT_CACHE_VERSION = 2
+HASH_BLOCK_SIZE = 1 << 20
+INPUT_DIGESTS_NAME = "inputs.json"
+
+# Per-point columns of an entry: the parsed (and thinned) points plus the
+# position of each point's county in the entry's county list (-1 if none)
+RESULT_COLUMNS = (
+    ('lons', np.float64),
+    ('lats', np.float64),
+    ('timestamps', np.int64),
+    ('segment_ids', np.int64),
+    ('weights', np.int64),
+    ('county_idx', np.int32),
+)
+
+def result_cache_root(project_dir):
+    """Directory holding all cached processing results."""
+    return os.path.join(project_dir, CACHE_DIR_NAME, "results")
+
+def _column_path(entry, name):
+    return os.path.join(entry, f"{name}.bin")
+
+def input_digest(root, path):
+    """SHA-256 of a file's content, memoized by path, size and mtime in root/inputs.json."""
+    stat = os.stat(path)
+    memo_path = os.path.join(root, INPUT_DIGESTS_NAME)
+    try:
+        with open(memo_path, 'r', encoding='utf-8') as f:
+            memo = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        memo = {}
+    
+    source = os.path.abspath(path)
+    known = memo.get(source)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    # Forget files that are gone (e.g. uploads of finished service jobs)
+    memo = {name: value for name, value in memo.items() if os.path.exists(name)}
+    memo[source] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    try:
+        os.makedirs(root, exist_ok=True)
+        with open(memo_path + f".{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(memo, f)
+        os.replace(memo_path + f".{os.getpid()}.tmp", memo_path)
+    except OSError as e:
+        logging.warning(f"Could not write input digests {memo_path}: {e}")
+    return memo[source]["sha256"]
+
+def result_cache_key(project_dir, json_file, options):
+    """Hash the input content, the boundary sources and the options that change the parsed points.
+    
+    options must hold everything that changes which points come out of
+    parsing and thinning (format, thinning parameters, chunk size when
+    thinning); output options never go into the key.
+    """
+    _, boundaries = boundary_cache_key(boundary_shapefile_paths(project_dir), None)
+    payload = {
+        "version": RESULT_CACHE_VERSION,
+        "input": input_digest(result_cache_root(project_dir), json_file),
+        "boundaries": boundaries["sources"],
+        "boundary_version": boundaries["version"],
+        "options": options,
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return digest[:24]
+
+def result_cache_entry(project_dir, key):
+    """Directory of the complete entry for key, or None."""
+    entry = os.path.join(result_cache_root(project_dir), key)
+    return entry if os.path.exists(os.path.join(entry, "manifest.json")) else None
+
+def load_cached_result(project_dir, key):
+    """Memory-mapped points and county matches of a cached run, or None on a miss.
+    
+    Returns {"points", "county_idx", "geoids", "counts", "travel", "meta"};
+    county_idx and the per-county counts and travel arrays refer to positions
+    in geoids, the candidate counties of the run that stored the entry. A
+    hit marks the entry as recently used.
+    """
+    entry = result_cache_entry(project_dir, key)
+    if entry is None:
+        return None
+    manifest_path = os.path.join(entry, "manifest.json")
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        n = manifest["points"]
+        columns = {name: np.memmap(_column_path(entry, name), dtype=dtype, mode='r', shape=(n,))
+                   for name, dtype in RESULT_COLUMNS}
+        with np.load(os.path.join(entry, "counties.npz")) as data:
+            geoids, counts = data['geoids'], data['counts']
+            travel = {name: data[name] for name in TRAVEL_ARRAYS}
+    except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable result cache entry {entry}: {e}")
+        return None
+    
+    # Entries are evicted least recently used first, by manifest mtime
+    os.utime(manifest_path)
+    points = PointStore(columns['lons'], columns['lats'], columns['timestamps'],
+                        columns['segment_ids'] if manifest["segments"] else None,
+                        weights=columns['weights'] if manifest["weighted"] else None)
+    logging.info(f"Reusing {n} parsed and matched points from the result cache ({key})")
+    return {"points": points, "county_idx": columns['county_idx'], "geoids": geoids, "counts": counts,
+            "travel": travel, "meta": manifest["meta"]}
+
+def cached_county_positions(cached, counties):
+    """Map the entry's county positions onto counties, or None if a county with points is missing."""
+    positions = pd.Index(counties['GEOID']).get_indexer(cached["geoids"])
+    if np.any((positions < 0) & (cached["counts"] > 0)):
+        logging.info("Cached county matches do not fit the loaded boundaries; matching again")
+        return None
+    return positions
+
+def cached_county_arrays(cached, positions, n_counties):
+    """The entry's per-county counts and travel arrays as positional arrays over the loaded counties."""
+    counts = np.zeros(n_counties, dtype=np.int64)
+    travel = empty_travel_arrays(n_counties)
+    found = positions >= 0
+    counts[positions[found]] = cached["counts"][found]
+    for name, values in travel.items():
+        values[positions[found]] = cached["travel"][name][found]
+    return counts, travel
+
+def iter_cached_matches(cached, positions, chunk_size):
+    """(points chunk, county positions over the loaded counties) for consecutive slices of the entry."""
+    points, county_idx = cached["points"], cached["county_idx"]
+    for offset in range(0, len(points), chunk_size):
+        idx = np.asarray(county_idx[offset:offset + chunk_size])
+        yield points[offset:offset + chunk_size], np.where(idx >= 0, positions[np.maximum(idx, 0)], -1)
+
+class ResultWriter:
+    """Builds a result cache entry from the chunks as they are matched.
+    
+    Columns are appended to raw binary files in a temporary directory, so
+    writing the entry never holds more than one chunk; commit() publishes it
+    atomically and evicts least recently used entries beyond max_bytes.
+    discard() drops an unfinished entry.
+    """
+    
+    def __init__(self, project_dir, key):
+        self.root = result_cache_root(project_dir)
+        self.key = key
+        self.tmp = os.path.join(self.root, f"{key}.{os.getpid()}.tmp")
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.files = {name: open(_column_path(self.tmp, name), 'wb') for name, _ in RESULT_COLUMNS}
+        self.count = 0
+        self.weighted = False
+        self.segments = True
+    
+    def append(self, chunk, county_idx):
+        """Write a matched PointStore chunk and the county position of each of its points."""
+        segment_ids = chunk.segment_ids if chunk.segment_ids is not None else np.full(len(chunk), -1)
+        columns = {'lons': chunk.lons, 'lats': chunk.lats, 'timestamps': chunk.timestamps,
+                   'segment_ids': segment_ids, 'weights': chunk.weight_array(), 'county_idx': county_idx}
+        for name, dtype in RESULT_COLUMNS:
+            np.ascontiguousarray(columns[name], dtype=dtype).tofile(self.files[name])
+        self.count += len(chunk)
+        self.weighted = self.weighted or chunk.weights is not None
+        self.segments = self.segments and chunk.segment_ids is not None
+    
+    def commit(self, counties, counts, travel, meta, max_bytes):
+        """Publish the entry with the per-county counts and travel arrays over counties; returns its directory or None."""
+        for f in self.files.values():
+            f.close()
+        try:
+            np.savez(os.path.join(self.tmp, "counties.npz"), geoids=counties['GEOID'].to_numpy(dtype=str),
+                     counts=counts, **travel)
+            manifest = {"version": RESULT_CACHE_VERSION, "points": self.count, "weighted": self.weighted,
+                        "segments": self.segments, "meta": meta}
+            with open(os.path.join(self.tmp, "manifest.json"), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            if _directory_bytes(self.tmp) > max_bytes:
+                logging.info(f"Result too large for the result cache ({max_bytes / (1024 * 1024):.0f} MB); not stored")
+                self.discard()
+                return None
+            entry = os.path.join(self.root, self.key)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(self.tmp, entry)
+        except OSError as e:
+            logging.warning(f"Could not write result cache entry: {e}")
+            self.discard()
+            return None
+        evict_results(self.root, max_bytes, keep=self.key)
+        logging.info(f"Result cache entry written to {entry}")
+        return entry
+    
+    def discard(self):
+        """Remove the unfinished entry."""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+def _directory_bytes(path):
+    """Total size of the files under path."""
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
+
+def evict_results(root, max_bytes, keep=None):
+    """Delete least recently used entries until the cache fits in max_bytes (keep is never deleted)."""
+    entries = []
+    for name in os.listdir(root):
+        manifest = os.path.join(root, name, "manifest.json")
+        if name.endswith(".tmp") or not os.path.exists(manifest):
+            continue
+        entries.append((os.path.getmtime(manifest), name, _directory_bytes(os.path.join(root, name))))
+    total = sum(size for _, _, size in entries)
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        total -= size
+        logging.info(f"Evicted result cache entry {name} ({size / (1024 * 1024):.1f} MB)")
+
+def map_cache_key(options, geographies):
+    """Hash the map options and the drawn finer-layer features into the name of a cached map."""
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    for name in sorted(geographies):
+        features = geographies[name]
+        digest.update(name.encode("utf-8"))
+        digest.update(b"".join(shapely.to_wkb(features.geometry.to_numpy())))
+        digest.update(np.ascontiguousarray(features['point_count'], dtype=np.int64).tobytes())
+    return digest.hexdigest()[:16]
+
+def _map_paths(entry, map_key, compressed):
+    """Cached page, sidecar directory and report of a map inside an entry."""
+    base = os.path.join(entry, "maps", map_key)
+    return base + (".html.gz" if compressed else ".html"), base + "_data", base + ".json"
+
+def _sidecar_dir(output_path):
+    """Where write_map_html puts the sidecars of a map written to output_path."""
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    return os.path.join(os.path.dirname(output_path), f"{stem}_data")
+
+def load_cached_map(entry, map_key, output_path):
+    """Copy a cached map (and its sidecars) to output_path; returns its report, or None on a miss."""
+    report_path = os.path.join(entry, "maps", f"{map_key}.json")
+    if not os.path.exists(report_path):
+        return None
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        compressed = report["output_path"].endswith(".gz")
+        page, sidecars, _ = _map_paths(entry, map_key, compressed)
+        # Mirror write_map_html, which adds .gz to the name of compressed pages
+        target = output_path + ".gz" if compressed and not output_path.endswith(".gz") else output_path
+        shutil.copyfile(page, target)
+        if os.path.isdir(sidecars):
+            shutil.copytree(sidecars, _sidecar_dir(output_path), dirs_exist_ok=True)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable cached map {report_path}: {e}")
+        return None
+    os.utime(os.path.join(entry, "manifest.json"))
+    report["output_path"] = target
+    logging.info(f"Map reused from the result cache: {target}")
+    return report
+
+def save_cached_map(entry, map_key, output_path, report, max_bytes):
+    """Store a rendered map (written to output_path) and its report in an entry."""
+    compressed = report["output_path"].endswith(".gz")
+    page, sidecars, report_path = _map_paths(entry, map_key, compressed)
+    try:
+        os.makedirs(os.path.dirname(page), exist_ok=True)
+        shutil.copyfile(report["output_path"], page)
+        if report.get("sidecar_bytes"):
+            shutil.copytree(_sidecar_dir(output_path), sidecars, dirs_exist_ok=True)
+        with open(report_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        os.replace(report_path + ".tmp", report_path)
+    except OSError as e:
+        logging.warning(f"Could not store the map in the result cache: {e}")
+        return
+    evict_results(os.path.dirname(entry), max_bytes, keep=os.path.basename(entry))
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from .core import share_boundaries, init_boundary_worker, shared_boundaries, process_data
+from .readers import READERS
+from .topology import load_boundary_topology
+from .data_loader import read_boundary_shapefiles
+from .defaults import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_QUEUE_SIZE
+
+# Finished jobs whose outputs stay downloadable; older ones are deleted
+DEFAULT_MAX_JOBS = 100
+LATENCY_WINDOW = 1000
+UPLOAD_CHUNK_SIZE = 1 << 20
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.geojson': 'application/geo+json',
+    '.json': 'application/json',
+    '.js': 'application/javascript',
+}
+# Upload Content-Types that name a reader; JSON bodies (and any other type) are detected from their content
+CONTENT_TYPE_FORMATS = {
+    'application/gpx+xml': 'gpx',
+    'text/csv': 'csv',
+    'text/tab-separated-values': 'csv',
+}
+
+def _run_job(json_file, job_dir, project_dir, options):
+    """Process one request in a worker; returns the result and when processing started."""
+    started = time.time()
+    result = process_data(
+        json_file,
+        os.path.join(job_dir, "map.html"),
+        project_dir,
+        outputs={"export_geojson": os.path.join(job_dir, "counties.geojson")},
+        boundaries=shared_boundaries(),
+        **options
+    )
+    return result, started
+
+class MapService:
+    """Warm boundaries plus a bounded process pool that turns timelines into maps.
+    
+    At most workers jobs run at once and queue_size more may wait; further
+    submissions are rejected. Outputs of the last max_jobs jobs are kept in
+    work_dir for download.
+    """
+    
+    def __init__(self, project_dir, workers=1, queue_size=DEFAULT_QUEUE_SIZE, work_dir=None,
+                 max_jobs=DEFAULT_MAX_JOBS, **options):
+        self.project_dir = project_dir
+        self.options = options
+        self.workers = max(1, workers)
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="wanderglyph_serve_")
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self.queue_size = queue_size
+        self.pending = 0
+        self.started = time.time()
+        self.latencies = {"queue": deque(maxlen=LATENCY_WINDOW), "processing": deque(maxlen=LATENCY_WINDOW),
+                          "total": deque(maxlen=LATENCY_WINDOW)}
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0}
+        
+        start = time.perf_counter()
+        share_boundaries(project_dir, (options.get("cache_options") or {}).get("rebuild_cache", False))
+        if options.get("topojson"):
+            # Memoized per process, so forked workers inherit the built topology
+            load_boundary_topology(project_dir, lambda: read_boundary_shapefiles(project_dir))
+        self.boundary_seconds = time.perf_counter() - start
+        
+        start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(start_method),
+                                        initializer=init_boundary_worker, initargs=(project_dir,))
+        logging.info(f"Map service ready in {self.boundary_seconds:.2f}s with {self.workers} worker(s), "
+                     f"queue of {queue_size}; outputs in {self.work_dir}")
+    
+    def new_job(self):
+        """Create an empty job directory; returns (job id, directory)."""
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.work_dir, job_id)
+        os.makedirs(job_dir)
+        return job_id, job_dir
+    
+    def reserve(self):
+        """Claim a running or queued slot without waiting; False (and counted as rejected) if the queue is full."""
+        if self.slots.acquire(blocking=False):
+            return True
+        with self.lock:
+            self.counters["rejected"] += 1
+        return False
+    
+    def release(self):
+        """Free a slot claimed with reserve() that was not submitted."""
+        self.slots.release()
+    
+    def submit(self, job_id, job_dir, json_file, input_format=None):
+        """Process a timeline in a slot claimed with reserve(); returns the job summary and frees the slot.
+        
+        input_format names the reader for this request instead of the service's default.
+        """
+        options = {**self.options, "input_format": input_format} if input_format else self.options
+        submitted = time.time()
+        with self.lock:
+            self.pending += 1
+        try:
+            result, started = self.pool.submit(_run_job, json_file, job_dir, self.project_dir, options).result()
+            summary = {"job": job_id, "status": "ok", **result}
+        except Exception as e:
+            started = submitted
+            summary = {"job": job_id, "status": "error", "error": f"{type(e).__name__}: {e}".strip()}
+        finally:
+            self.slots.release()
+            with self.lock:
+                self.pending -= 1
+        
+        finished = time.time()
+        summary["latency"] = {
+            "queue_seconds": round(started - submitted, 4),
+            "processing_seconds": round(finished - started, 4),
+            "total_seconds": round(finished - submitted, 4),
+        }
+        with open(os.path.join(job_dir, "summary.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        self._record(job_id, job_dir, summary)
+        return summary
+    
+    def _record(self, job_id, job_dir, summary):
+        """Track latencies and keep only the newest max_jobs job directories."""
+        with self.lock:
+            self.counters["completed" if summary["status"] == "ok" else "failed"] += 1
+            if summary["status"] == "ok":
+                for name in ("queue", "processing", "total"):
+                    self.latencies[name].append(summary["latency"][f"{name}_seconds"])
+            self.jobs[job_id] = job_dir
+            expired = []
+            while len(self.jobs) > self.max_jobs:
+                expired.append(self.jobs.popitem(last=False)[1])
+        for directory in expired:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    def job_file(self, job_id, relative_path):
+        """Absolute path of an output file of a known job, or None (never escapes the job directory)."""
+        with self.lock:
+            job_dir = self.jobs.get(job_id)
+        if job_dir is None:
+            return None
+        path = os.path.realpath(os.path.join(job_dir, relative_path))
+        if not path.startswith(os.path.realpath(job_dir) + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+    
+    def metrics(self):
+        """Counters, queue state and latency percentiles over the recent window."""
+        with self.lock:
+            latency = {}
+            for name, values in self.latencies.items():
+                if values:
+                    p50, p95, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95, 99])
+                    latency[name] = {"p50": round(p50, 4), "p95": round(p95, 4), "p99": round(p99, 4),
+                                     "max": round(max(values), 4)}
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "boundary_load_seconds": round(self.boundary_seconds, 3),
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": self.pending,
+                "jobs_retained": len(self.jobs),
+                **self.counters,
+                "latency_seconds": latency,
+            }
+    
+    def close(self):
+        """Stop the worker pool."""
+        self.pool.shutdown(wait=True)
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    """HTTP API of the map service.
+    
+    POST /maps            location history as the request body, or ?path=<file> on the server;
+                          ?format= (or a GPX/CSV Content-Type) names its reader
+    GET  /maps/<job>/...  map.html, counties.geojson, summary.json (and map sidecars)
+    GET  /metrics         counters and latency percentiles
+    GET  /health          liveness check
+    """
+    server_version = "WanderGlyph"
+    
+    def _send_json(self, status, document):
+        """Respond with a JSON document."""
+        body = json.dumps(document).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_file(self, path):
+        """Stream a job output file, marking .gz files as gzip-encoded."""
+        name = path[:-3] if path.endswith('.gz') else path
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'))
+        if name != path:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+    
+    def do_GET(self):
+        service = self.server.service
+        parts = urlsplit(self.path).path.strip('/').split('/')
+        if parts == ['health']:
+            return self._send_json(200, {"status": "ok"})
+        if parts == ['metrics']:
+            return self._send_json(200, service.metrics())
+        if len(parts) >= 3 and parts[0] == 'maps':
+            relative = '/'.join(parts[2:])
+            path = service.job_file(parts[1], relative)
+            if path is None and relative == 'map.html':
+                path = service.job_file(parts[1], 'map.html.gz')
+            if path is None and relative == 'counties.geojson' and service.job_file(parts[1], 'summary.json'):
+                # No county matched, so nothing was exported
+                return self._send_json(200, {"type": "FeatureCollection", "features": []})
+            if path is not None:
+                return self._send_file(path)
+        self._send_json(404, {"error": "not found"})
+    
+    def _input_format(self, query):
+        """Reader named by ?format= or the upload's Content-Type, or None to detect it from the content."""
+        formats = parse_qs(query).get('format')
+        if formats:
+            return formats[0]
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        return CONTENT_TYPE_FORMATS.get(content_type)
+    
+    def _receive_input(self, query, job_dir, input_format):
+        """Timeline path of a POST (server-side ?path= or the upload streamed to job_dir); None after a 400."""
+        paths = parse_qs(query).get('path')
+        if paths:
+            if not os.path.isfile(paths[0]):
+                self._send_json(400, {"error": f"file not found: {paths[0]}"})
+                return None
+            return paths[0]
+        
+        # Stream the upload to disk; the parser reads it incrementally from there
+        remaining = int(self.headers.get('Content-Length') or 0)
+        if remaining <= 0:
+            self._send_json(400, {"error": "send a location history file as the body or ?path=<file>"})
+            return None
+        # Named with the reader's extension; without a format, no extension lets every reader's markers be tried
+        extension = READERS[input_format]["extensions"][0] if input_format else ""
+        json_file = os.path.join(job_dir, "input" + extension)
+        with open(json_file, 'wb') as f:
+            while remaining > 0:
+                data = self.rfile.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+        if remaining > 0:
+            # The client went away before sending the whole body
+            self._send_json(400, {"error": "incomplete upload"})
+            return None
+        return json_file
+    
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path.rstrip('/') != '/maps':
+            return self._send_json(404, {"error": "not found"})
+        
+        input_format = self._input_format(url.query)
+        if input_format is not None and input_format not in READERS:
+            return self._send_json(400, {"error": f"unknown format '{input_format}'; choose one of: {', '.join(READERS)}"})
+        
+        # Claim a slot before reading any upload, so a full queue is answered
+        # right away instead of this thread waiting on the pool
+        if not service.reserve():
+            self.close_connection = True
+            return self._send_json(503, {"error": "queue full, retry later"})
+        
+        job_id, job_dir = service.new_job()
+        json_file = None
+        try:
+            json_file = self._receive_input(url.query, job_dir, input_format)
+        finally:
+            if json_file is None:
+                service.release()
+                shutil.rmtree(job_dir, ignore_errors=True)
+        if json_file is None:
+            return
+        
+        summary = service.submit(job_id, job_dir, json_file, input_format)
+        if summary["status"] == "ok":
+            summary["urls"] = {name: f"/maps/{job_id}/{name}" for name in ("map.html", "counties.geojson", "summary.json")}
+        self._send_json(200 if summary["status"] == "ok" else 422, summary)
+    
+    def log_message(self, format, *args):
+        """Route access logs through logging instead of stderr."""
+        logging.info(f"{self.address_string()} - {format % args}")
+
+def serve(project_dir, host=DEFAULT_HOST, port=DEFAULT_PORT, **service_options):
+    """Run the map service until interrupted."""
+    service = MapService(project_dir, **service_options)
+    httpd = ThreadingHTTPServer((host, port), MapRequestHandler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    logging.info(f"Serving maps on http://{host}:{httpd.server_address[1]}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down map service")
+    finally:
+        httpd.server_close()
+        service.close()
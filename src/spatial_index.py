@@ -0,0 +1,185 @@
+import logging
+import numpy as np
+import shapely
+from .geo_utils import prepared_geometries, query_containing, count_per_county
+from .boundary_cache import boundary_cache_entry, load_cached_arrays, save_cached_arrays
+
+# Grid cell edge in degrees (~5 km); small enough that most cells sit well
+# inside a single county, large enough to keep the table to a few MB.
+GRID_CELL_SIZE = 0.05
+# Counties whose bounding box spans more cells than this (e.g. the Aleutians,
+# which cross the antimeridian) are left to the exact fallback.
+MAX_CELLS_PER_COUNTY = 2_000_000
+
+def grid_cell_keys(lons, lats, cell_size):
+    """Integer key of the global grid cell each coordinate falls in."""
+    n_cols = int(np.ceil(360.0 / cell_size))
+    ix = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / cell_size).astype(np.int64)
+    iy = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / cell_size).astype(np.int64)
+    return iy * n_cols + ix
+
+def build_county_grid(county_geoms, cell_size=GRID_CELL_SIZE):
+    """Precompute the grid cells lying entirely inside one county.
+    
+    Returns sorted cell keys and the positional county index for each key.
+    """
+    n_cols = int(np.ceil(360.0 / cell_size))
+    keys, values = [], []
+    bounds = shapely.bounds(county_geoms)
+    for county, (minx, miny, maxx, maxy) in enumerate(bounds):
+        if not np.isfinite(minx):
+            continue
+        ix = np.arange(np.floor((minx + 180.0) / cell_size), np.floor((maxx + 180.0) / cell_size) + 1, dtype=np.int64)
+        iy = np.arange(np.floor((miny + 90.0) / cell_size), np.floor((maxy + 90.0) / cell_size) + 1, dtype=np.int64)
+        if len(ix) * len(iy) > MAX_CELLS_PER_COUNTY:
+            continue
+        gx, gy = np.meshgrid(ix, iy)
+        gx = gx.ravel()
+        gy = gy.ravel()
+        x0 = gx * cell_size - 180.0
+        y0 = gy * cell_size - 90.0
+        cells = shapely.box(x0, y0, x0 + cell_size, y0 + cell_size)
+        inside = shapely.contains_properly(county_geoms[county], cells)
+        keys.append(gy[inside] * n_cols + gx[inside])
+        values.append(np.full(int(inside.sum()), county, dtype=np.int32))
+    
+    if not keys:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+    keys = np.concatenate(keys)
+    values = np.concatenate(values)
+    order = np.argsort(keys, kind='stable')
+    return keys[order], values[order]
+
+class BoundaryIndex:
+    """Hierarchical point-to-county lookup.
+    
+    Points are first resolved through a precomputed grid of cells known to lie
+    entirely inside one county; the remaining boundary-cell points are bucketed
+    by state and tested only against that state's counties, with a national
+    exact test as the final fallback.
+    """
+    
+    def __init__(self, counties, states, grid_keys=None, grid_values=None, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.n_counties = len(counties)
+        self.county_geoms = prepared_geometries(counties)
+        self.state_geoms = prepared_geometries(states)
+        
+        # Group counties by the positional index of their state
+        state_pos = {fp: i for i, fp in enumerate(states['STATEFP'])}
+        self.county_state = np.array([state_pos.get(fp, -1) for fp in counties['STATEFP']], dtype=np.int64)
+        self.state_counties = [np.flatnonzero(self.county_state == s) for s in range(len(states))]
+        
+        if grid_keys is None or grid_values is None:
+            grid_keys, grid_values = build_county_grid(self.county_geoms, cell_size)
+        self.grid_keys = grid_keys
+        self.grid_values = grid_values
+        
+        self.points_matched = 0
+        self.grid_hits = 0
+    
+    @property
+    def grid_hit_rate(self):
+        """Fraction of matched points resolved by the grid alone."""
+        return self.grid_hits / self.points_matched if self.points_matched else 0.0
+    
+    def _grid_lookup(self, lons, lats):
+        county_idx = np.full(len(lons), -1, dtype=np.int64)
+        if len(self.grid_keys) == 0:
+            return county_idx
+        keys = grid_cell_keys(lons, lats, self.cell_size)
+        pos = np.minimum(np.searchsorted(self.grid_keys, keys), len(self.grid_keys) - 1)
+        found = self.grid_keys[pos] == keys
+        county_idx[found] = self.grid_values[pos[found]]
+        return county_idx
+    
+    def match(self, lons, lats, weights=None, stats=None):
+        """Return per-point positional county indices (-1 if none) and per-county (weighted) counts.
+        
+        If stats is a dict, its "points" and "grid_hits" entries are incremented
+        so callers sharing one index can track their own hit rate.
+        """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        county_idx = self._grid_lookup(lons, lats)
+        grid_hits = int(np.count_nonzero(county_idx >= 0))
+        
+        # Boundary cells: find the state first, then test only its counties
+        pending = np.flatnonzero(county_idx < 0)
+        if len(pending):
+            state_idx = query_containing(self.state_geoms, lons[pending], lats[pending])
+            for state in np.unique(state_idx[state_idx >= 0]):
+                members = pending[state_idx == state]
+                candidates = self.state_counties[state]
+                local = query_containing(self.county_geoms[candidates], lons[members], lats[members])
+                county_idx[members[local >= 0]] = candidates[local[local >= 0]]
+            
+            # Simplified state and county outlines do not coincide exactly, so
+            # anything still unmatched gets the exact national test
+            leftover = pending[county_idx[pending] < 0]
+            if len(leftover):
+                county_idx[leftover] = query_containing(self.county_geoms, lons[leftover], lats[leftover])
+        
+        self.points_matched += len(lons)
+        self.grid_hits += grid_hits
+        if stats is not None:
+            stats["points"] = stats.get("points", 0) + len(lons)
+            stats["grid_hits"] = stats.get("grid_hits", 0) + grid_hits
+        return county_idx, count_per_county(county_idx, self.n_counties, weights)
+
+class LayerIndex:
+    """Point lookup for a finer geography layer (tracts, ZCTAs, places) narrowed by a parent level.
+    
+    Features are grouped by the positional index of their parent (county or
+    state) in the frames the BoundaryIndex matched against. Points are tested
+    only against the features of the parent they were matched to; the rest
+    (no parent, or between simplified outlines) get an exact test over all
+    loaded features.
+    """
+    
+    def __init__(self, features, feature_parent, n_parents):
+        self.n_features = len(features)
+        self.geoms = prepared_geometries(features)
+        feature_parent = np.asarray(feature_parent, dtype=np.int64)
+        self.parent_features = [np.flatnonzero(feature_parent == p) for p in range(n_parents)]
+    
+    def match(self, lons, lats, parent_idx, weights=None):
+        """Return per-point positional feature indices (-1 if none) and per-feature (weighted) counts."""
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        feature_idx = np.full(len(lons), -1, dtype=np.int64)
+        
+        # Bucket points by parent with one sort instead of a mask per parent
+        has_parent = np.flatnonzero(parent_idx >= 0)
+        order = has_parent[np.argsort(parent_idx[has_parent], kind='stable')]
+        parents, starts = np.unique(parent_idx[order], return_index=True)
+        for parent, members in zip(parents, np.split(order, starts[1:])):
+            candidates = self.parent_features[parent]
+            if len(candidates) == 0:
+                continue
+            local = query_containing(self.geoms[candidates], lons[members], lats[members])
+            feature_idx[members[local >= 0]] = candidates[local[local >= 0]]
+        
+        leftover = np.flatnonzero(feature_idx < 0)
+        if len(leftover) and self.n_features:
+            feature_idx[leftover] = query_containing(self.geoms, lons[leftover], lats[leftover])
+        return feature_idx, count_per_county(feature_idx, self.n_features, weights)
+
+def load_boundary_index(project_dir, counties, states, cell_size=GRID_CELL_SIZE, use_cache=True):
+    """Build a BoundaryIndex, reusing the grid persisted in the boundary cache when present.
+    
+    use_cache=False builds the grid without reading or writing the cache, for
+    extent-filtered boundaries whose positions differ from the cached full set.
+    """
+    entry = boundary_cache_entry(project_dir) if use_cache else None
+    name = f"county_grid_{cell_size:g}"
+    cached = load_cached_arrays(entry, name)
+    if cached is not None and int(cached['n_counties']) == len(counties):
+        logging.info(f"Loaded county grid from cache ({len(cached['keys'])} interior cells)")
+        return BoundaryIndex(counties, states, cached['keys'], cached['values'], cell_size)
+    
+    index = BoundaryIndex(counties, states, cell_size=cell_size)
+    logging.info(f"Built county grid with {len(index.grid_keys)} interior cells")
+    save_cached_arrays(entry, name, keys=index.grid_keys, values=index.grid_values,
+                       n_counties=np.int64(len(counties)))
+    return index
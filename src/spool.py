@@ -0,0 +1,157 @@
+import os
+import shutil
+import logging
+import tempfile
+import numpy as np
+from .points import PointStore, NAT_TIMESTAMP
+
+# Approximate peak working memory per point of a chunk while it is parsed,
+# thinned and matched (Python objects from the parser plus array temporaries)
+WORKING_BYTES_PER_POINT = 512
+MIN_SPOOL_CHUNK = 10_000
+# Cell size the spilled points are pre-aggregated to before rendering (~100 m)
+RENDER_CELL_DEG = 0.001
+
+SPOOL_COLUMNS = (
+    ('lons', np.float64),
+    ('lats', np.float64),
+    ('timestamps', np.int64),
+    ('segment_ids', np.int64),
+    ('weights', np.int64),
+)
+
+def chunk_size_for_budget(memory_budget_mb):
+    """Largest chunk whose working set fits in memory_budget_mb."""
+    return max(MIN_SPOOL_CHUNK, int(memory_budget_mb * 1024 * 1024) // WORKING_BYTES_PER_POINT)
+
+class PointSpool:
+    """Append-only on-disk columnar store of timeline points.
+    
+    Each column is a raw binary file that chunks are appended to as they are
+    parsed; store() maps the columns back read-only as np.memmap, so only the
+    pages being read are resident and the history can exceed RAM. The
+    directory is removed by close().
+    """
+    
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix="wanderglyph_spool_", dir=directory)
+        self.files = {name: open(self._path(name), 'wb') for name, _ in SPOOL_COLUMNS}
+        self.count = 0
+        self.weighted = False
+        self.extent = None
+    
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+    
+    def __len__(self):
+        return self.count
+    
+    def append(self, chunk):
+        """Write a PointStore chunk to the end of every column."""
+        if len(chunk) == 0:
+            return
+        segment_ids = chunk.segment_ids if chunk.segment_ids is not None else np.full(len(chunk), -1)
+        columns = {'lons': chunk.lons, 'lats': chunk.lats, 'timestamps': chunk.timestamps,
+                   'segment_ids': segment_ids, 'weights': chunk.weight_array()}
+        for name, dtype in SPOOL_COLUMNS:
+            np.ascontiguousarray(columns[name], dtype=dtype).tofile(self.files[name])
+        self.count += len(chunk)
+        self.weighted = self.weighted or chunk.weights is not None
+        bounds = chunk.bounds()
+        if self.extent is None:
+            self.extent = bounds
+        else:
+            self.extent = (min(self.extent[0], bounds[0]), min(self.extent[1], bounds[1]),
+                           max(self.extent[2], bounds[2]), max(self.extent[3], bounds[3]))
+    
+    def bounds(self):
+        """Extent of all appended points as (minx, miny, maxx, maxy), or None if empty."""
+        return self.extent
+    
+    def store(self):
+        """Read-only memory-mapped PointStore over everything appended so far."""
+        if self.count == 0:
+            return PointStore.empty()
+        for f in self.files.values():
+            f.flush()
+        columns = {name: np.memmap(self._path(name), dtype=dtype, mode='r', shape=(self.count,))
+                   for name, dtype in SPOOL_COLUMNS}
+        return PointStore(columns['lons'], columns['lats'], columns['timestamps'], columns['segment_ids'],
+                          weights=columns['weights'] if self.weighted else None)
+    
+    def close(self):
+        """Delete the spool directory."""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def iter_store_chunks(points, chunk_size, start=0):
+    """Consecutive slices of a (memory-mapped) PointStore; slicing never copies."""
+    for offset in range(start, len(points), chunk_size):
+        yield points[offset:offset + chunk_size]
+
+def _max_by_group(inverse, values, n):
+    """Per-group maximum of values."""
+    result = np.full(n, NAT_TIMESTAMP, dtype=np.int64)
+    np.maximum.at(result, inverse, values)
+    return result
+
+def _merge_cells(keys, lon_sums, lat_sums, weights, latest):
+    """Combine partial cell aggregates that share a key."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    n = len(unique)
+    return (unique,
+            np.bincount(inverse, weights=lon_sums, minlength=n),
+            np.bincount(inverse, weights=lat_sums, minlength=n),
+            np.bincount(inverse, weights=weights, minlength=n).astype(np.int64),
+            _max_by_group(inverse, latest, n))
+
+def _cell_keys(lons, lats, cell_deg):
+    """Integer key of the cell_deg grid cell containing each point."""
+    n_cols = int(np.ceil(360.0 / cell_deg)) + 1
+    return (np.floor((lats + 90.0) / cell_deg).astype(np.int64) * n_cols
+            + np.floor((lons + 180.0) / cell_deg).astype(np.int64))
+
+def reduce_points(points, chunk_size, cell_deg=RENDER_CELL_DEG):
+    """Collapse a large PointStore into at most chunk_size weighted cell centroids.
+    
+    Points are aggregated chunk by chunk per cell_deg grid cell (weighted
+    centroid, total weight, latest timestamp) and partial aggregates are
+    merged whenever they outgrow chunk_size. If the merged cells still exceed
+    chunk_size, the cell size doubles and the cells are re-binned by their
+    centroids, so memory stays bounded by the chunk size. Weights keep heatmap
+    intensities and cluster counts equal to those of the raw points.
+    """
+    merged = None
+    pending = []
+    pending_size = 0
+    chunks = iter_store_chunks(points, chunk_size)
+    while True:
+        chunk = next(chunks, None)
+        if chunk is not None:
+            lons = np.asarray(chunk.lons, dtype=np.float64)
+            lats = np.asarray(chunk.lats, dtype=np.float64)
+            weights = chunk.weight_array().astype(np.float64)
+            pending.append(_merge_cells(_cell_keys(lons, lats, cell_deg), lons * weights, lats * weights,
+                                        weights, np.asarray(chunk.timestamps)))
+            pending_size += len(pending[-1][0])
+            if pending_size <= chunk_size:
+                continue
+        if pending:
+            parts = pending if merged is None else [merged] + pending
+            merged = _merge_cells(*(np.concatenate(column) for column in zip(*parts)))
+            pending, pending_size = [], 0
+        while merged is not None and len(merged[0]) > chunk_size:
+            cell_deg *= 2
+            _, lon_sums, lat_sums, weights, latest = merged
+            keys = _cell_keys(lon_sums / weights, lat_sums / weights, cell_deg)
+            merged = _merge_cells(keys, lon_sums, lat_sums, weights, latest)
+        if chunk is None:
+            break
+    if merged is None:
+        return PointStore.empty()
+    
+    _, lon_sums, lat_sums, weights, latest = merged
+    logging.info(f"Reduced {len(points)} spilled points to {len(weights)} weighted cells "
+                 f"({cell_deg:g}° cells) for rendering")
+    return PointStore(lon_sums / weights, lat_sums / weights, latest, weights=weights)
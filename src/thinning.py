@@ -0,0 +1,62 @@
+import logging
+import numpy as np
+from .points import PointStore, NAT_TIMESTAMP
+from .defaults import DEFAULT_THIN_DISTANCE_M, DEFAULT_THIN_MIN_STAY_S
+
+METERS_PER_DEGREE = 111_320.0
+
+def thin_points(points, distance_m=DEFAULT_THIN_DISTANCE_M, min_stay_s=DEFAULT_THIN_MIN_STAY_S):
+    """Collapse stationary clusters into weighted stay points and thin movement.
+    
+    Points are ordered chronologically and snapped to a local grid of
+    distance_m cells. Each run of consecutive points in the same cell is
+    replaced by one point carrying the run's total weight: runs lasting at
+    least min_stay_s become stay points at the run's weighted centroid, shorter
+    (movement) runs keep their first point. Returns the thinned PointStore and
+    a dict of reduction statistics.
+    """
+    n = len(points)
+    if n < 2:
+        return points, {"input_points": n, "output_points": n, "stay_points": 0, "reduction": 0.0}
+    
+    order = np.argsort(points.timestamps, kind='stable')
+    lons = points.lons[order].astype(np.float64)
+    lats = points.lats[order].astype(np.float64)
+    times = points.timestamps[order]
+    weights = points.weight_array()[order]
+    
+    # Equirectangular projection is accurate enough at the scale of one cell
+    y = lats * METERS_PER_DEGREE
+    x = lons * METERS_PER_DEGREE * np.cos(np.radians(lats))
+    cell_x = np.floor(x / distance_m).astype(np.int64)
+    cell_y = np.floor(y / distance_m).astype(np.int64)
+    
+    new_run = np.empty(n, dtype=bool)
+    new_run[0] = True
+    new_run[1:] = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+    starts = np.flatnonzero(new_run)
+    ends = np.append(starts[1:], n) - 1
+    
+    run_weight = np.add.reduceat(weights, starts)
+    centroid_lon = np.add.reduceat(lons * weights, starts) / run_weight
+    centroid_lat = np.add.reduceat(lats * weights, starts) / run_weight
+    timed = (times[starts] != NAT_TIMESTAMP) & (times[ends] != NAT_TIMESTAMP)
+    duration_ms = np.where(timed, times[ends] - times[starts], 0)
+    is_stay = (ends > starts) & (duration_ms >= min_stay_s * 1000)
+    
+    thinned = PointStore(
+        np.where(is_stay, centroid_lon, lons[starts]),
+        np.where(is_stay, centroid_lat, lats[starts]),
+        times[starts],
+        None if points.segment_ids is None else points.segment_ids[order][starts],
+        coord_dtype=points.lons.dtype,
+        weights=run_weight,
+    )
+    stats = {
+        "input_points": n,
+        "output_points": len(thinned),
+        "stay_points": int(is_stay.sum()),
+        "reduction": 1.0 - len(thinned) / n,
+    }
+    logging.debug(f"Thinned {n} points to {len(thinned)} ({stats['stay_points']} stay points)")
+    return thinned, stats
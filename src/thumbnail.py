@@ -0,0 +1,183 @@
+import zlib
+import struct
+import logging
+import numpy as np
+import shapely
+from .defaults import DEFAULT_CHUNK_SIZE, DEFAULT_THUMBNAIL_SIZE
+
+# Same six YlOrRd steps as the interactive map's county choropleth
+CHOROPLETH_COLORS = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+BACKGROUND_COLOR = '#ffffff'
+LAND_COLOR = '#ececec'
+BORDER_COLOR = '#5a6b8c'
+DENSITY_COLOR = '#2b1a6b'
+# Opacity of the densest point cell; lighter cells fade out on a log scale
+DENSITY_MAX_ALPHA = 0.85
+# Margin around the visited area, as a fraction of its size
+THUMBNAIL_MARGIN = 0.05
+
+def hex_rgb(color):
+    """'#rrggbb' as a uint8 RGB triple."""
+    return np.array([int(color[i:i + 2], 16) for i in (1, 3, 5)], dtype=np.uint8)
+
+def write_png(path, image):
+    """Write an (height, width, 3) uint8 RGB array as an 8-bit PNG using only zlib and struct."""
+    height, width, _ = image.shape
+    # Every scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)]).tobytes()
+    
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(chunk(b'IEND', b''))
+
+class RasterGrid:
+    """Maps lon/lat onto a width x height pixel grid covering bounds.
+    
+    Longitudes are scaled by the cosine of the middle latitude so shapes
+    keep their proportions; the longer side gets size pixels.
+    """
+    
+    def __init__(self, bounds, size):
+        minx, miny, maxx, maxy = bounds
+        span_x = max(maxx - minx, 1e-6)
+        span_y = max(maxy - miny, 1e-6)
+        minx -= span_x * THUMBNAIL_MARGIN
+        maxx += span_x * THUMBNAIL_MARGIN
+        miny -= span_y * THUMBNAIL_MARGIN
+        maxy += span_y * THUMBNAIL_MARGIN
+        aspect = (maxx - minx) * np.cos(np.radians((miny + maxy) / 2)) / (maxy - miny)
+        self.width = size if aspect >= 1 else max(1, int(round(size * aspect)))
+        self.height = size if aspect < 1 else max(1, int(round(size / aspect)))
+        self.minx, self.maxy = minx, maxy
+        self.scale_x = self.width / (maxx - minx)
+        self.scale_y = self.height / (maxy - miny)
+    
+    def to_pixels(self, lons, lats):
+        """Fractional pixel coordinates (x right, y down) of lon/lat arrays."""
+        return (np.asarray(lons, dtype=np.float64) - self.minx) * self.scale_x, \
+               (self.maxy - np.asarray(lats, dtype=np.float64)) * self.scale_y
+
+def _ring_coordinates(geoms):
+    """Coordinates of every ring of every (multi)polygon, with the feature and ring each belongs to."""
+    parts, part_feature = shapely.get_parts(geoms, return_index=True)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+    return coords, part_feature[ring_part[coord_ring]], coord_ring
+
+def rasterize_polygons(geoms, grid):
+    """Label raster of (multi)polygons: the position of the feature covering each pixel center, -1 if none.
+    
+    Even-odd scanline fill over all features at once: every ring edge is
+    expanded to the pixel rows whose centers it spans, crossings are sorted
+    per feature and row, and consecutive crossing pairs become filled spans.
+    Later features win where features overlap.
+    """
+    labels = np.full((grid.height, grid.width), -1, dtype=np.int64)
+    if len(geoms) == 0:
+        return labels
+    coords, feature, ring = _ring_coordinates(np.asarray(geoms, dtype=object))
+    x, y = grid.to_pixels(coords[:, 0], coords[:, 1])
+    
+    # Edges join consecutive vertices of the same ring; horizontal edges never cross a row center
+    same_ring = ring[:-1] == ring[1:]
+    x0, y0, x1, y1, edge_feature = x[:-1][same_ring], y[:-1][same_ring], x[1:][same_ring], y[1:][same_ring], feature[:-1][same_ring]
+    first_row = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, grid.height).astype(np.int64)
+    end_row = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, grid.height).astype(np.int64)
+    rows_per_edge = end_row - first_row
+    edge = np.repeat(np.arange(len(x0)), rows_per_edge)
+    if len(edge) == 0:
+        return labels
+    row = np.repeat(first_row, rows_per_edge) + (np.arange(len(edge)) - np.repeat(np.cumsum(rows_per_edge) - rows_per_edge, rows_per_edge))
+    t = (row + 0.5 - y0[edge]) / (y1[edge] - y0[edge])
+    crossing = x0[edge] + t * (x1[edge] - x0[edge])
+    
+    # Pair the crossings of each feature and row in x order (every ring crosses a row an even number of times)
+    owner = edge_feature[edge]
+    order = np.lexsort((crossing, row, owner))
+    crossing, row, owner = crossing[order], row[order], owner[order]
+    start_x = np.clip(np.ceil(crossing[0::2] - 0.5), 0, grid.width).astype(np.int64)
+    end_x = np.clip(np.ceil(crossing[1::2] - 0.5), 0, grid.width).astype(np.int64)
+    span_row, span_owner = row[0::2], owner[0::2]
+    lengths = np.maximum(end_x - start_x, 0)
+    span = np.repeat(np.arange(len(lengths)), lengths)
+    column = np.repeat(start_x, lengths) + (np.arange(len(span)) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+    labels[span_row[span], column] = span_owner[span]
+    return labels
+
+def line_mask(geoms, grid):
+    """Boolean raster of the pixels touched by the rings of (multi)polygons, sampled about every half pixel."""
+    mask = np.zeros((grid.height, grid.width), dtype=bool)
+    if len(geoms) == 0:
+        return mask
+    coords, _, ring = _ring_coordinates(np.asarray(geoms, dtype=object))
+    x, y = grid.to_pixels(coords[:, 0], coords[:, 1])
+    same_ring = ring[:-1] == ring[1:]
+    x0, y0, x1, y1 = x[:-1][same_ring], y[:-1][same_ring], x[1:][same_ring], y[1:][same_ring]
+    samples = np.maximum(np.ceil(2 * np.hypot(x1 - x0, y1 - y0)).astype(np.int64), 1)
+    edge = np.repeat(np.arange(len(x0)), samples)
+    t = (np.arange(len(edge)) - np.repeat(np.cumsum(samples) - samples, samples)) / samples[edge]
+    px = np.floor(x0[edge] + t * (x1[edge] - x0[edge])).astype(np.int64)
+    py = np.floor(y0[edge] + t * (y1[edge] - y0[edge])).astype(np.int64)
+    inside = (px >= 0) & (px < grid.width) & (py >= 0) & (py < grid.height)
+    mask[py[inside], px[inside]] = True
+    return mask
+
+def point_density(points, grid, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Weighted point count per pixel, accumulated chunk by chunk (works on memory-mapped stores)."""
+    density = np.zeros(grid.width * grid.height, dtype=np.float64)
+    for offset in range(0, len(points), chunk_size):
+        chunk = points[offset:offset + chunk_size]
+        px, py = grid.to_pixels(chunk.lons, chunk.lats)
+        px = np.floor(px).astype(np.int64)
+        py = np.floor(py).astype(np.int64)
+        inside = (px >= 0) & (px < grid.width) & (py >= 0) & (py < grid.height)
+        density += np.bincount(py[inside] * grid.width + px[inside], weights=chunk.weight_array()[inside],
+                               minlength=len(density))
+    return density.reshape(grid.height, grid.width)
+
+def choropleth_colors(counts):
+    """RGB of each count on the six-step YlOrRd scale between the smallest and largest count."""
+    palette = np.array([hex_rgb(c) for c in CHOROPLETH_COLORS])
+    low = counts.min() if len(counts) else 0
+    high = max(counts.max() if len(counts) else 1, low + 1)
+    step = np.clip(((counts - low) / (high - low) * len(palette)).astype(np.int64), 0, len(palette) - 1)
+    return palette[step]
+
+def render_thumbnail(counties, counts, states, points, output_path, size=DEFAULT_THUMBNAIL_SIZE,
+                     chunk_size=DEFAULT_CHUNK_SIZE):
+    """Rasterize a static PNG of the visited counties, without folium, a browser or tiles.
+    
+    counties are the loaded (candidate) counties with their positional
+    counts. Visited counties are filled on the map's YlOrRd scale over the
+    other counties in grey, state borders are drawn on top and points are
+    overlaid as a log-scaled density layer. The image covers the visited
+    counties (or the points when none matched). Returns a small report.
+    """
+    visited = np.flatnonzero(counts > 0)
+    if len(visited):
+        bounds = shapely.total_bounds(counties.geometry.to_numpy()[visited])
+    else:
+        bounds = points.bounds()
+    grid = RasterGrid(bounds, size)
+    
+    labels = rasterize_polygons(counties.geometry.to_numpy(), grid)
+    palette = np.vstack([np.tile(hex_rgb(LAND_COLOR), (len(counties), 1)), hex_rgb(BACKGROUND_COLOR)])
+    palette[visited] = choropleth_colors(counts[visited])
+    # Uncovered pixels (-1) pick the background at the end of the palette
+    image = palette[labels].astype(np.float64)
+    
+    density = point_density(points, grid, chunk_size)
+    if density.max() > 0:
+        alpha = (DENSITY_MAX_ALPHA * np.log1p(density) / np.log1p(density.max()))[..., None]
+        image = image * (1 - alpha) + hex_rgb(DENSITY_COLOR) * alpha
+    
+    image[line_mask(states.geometry.to_numpy(), grid)] = hex_rgb(BORDER_COLOR)
+    image = np.rint(image).astype(np.uint8)
+    write_png(output_path, image)
+    logging.info(f"Thumbnail saved to: {output_path} ({grid.width}x{grid.height})")
+    return {"output_path": output_path, "width": grid.width, "height": grid.height}
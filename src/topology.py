@@ -0,0 +1,248 @@
+import logging
+import numpy as np
+import shapely
+from .boundary_cache import boundary_cache_entry, load_cached_arrays, save_cached_arrays, load_cached_json, save_cached_json
+
+# Quantization grid size per axis; over the TIGER extent this is ~40 m per step
+QUANTIZATION = 1_000_000
+# Zoom levels with precomputed arc simplification (tolerance ~1 screen pixel)
+TOPOLOGY_ZOOM_LEVELS = (4, 6, 8, 10)
+TOPOLOGY_VERSION = 1
+COUNTY_PROPERTIES = ['GEOID', 'NAME', 'STATEFP']
+STATE_PROPERTIES = ['STATEFP', 'NAME']
+
+# Topologies already loaded in this process, keyed by cache entry
+_TOPOLOGY_MEMO = {}
+
+def pixel_tolerance_deg(zoom):
+    """Degrees of longitude covered by one 256-px-tile screen pixel at a zoom level."""
+    return 360.0 / (256 * 2 ** zoom)
+
+def _polygon_rings(geom):
+    """Exterior and interior coordinate arrays of each polygon part of geom."""
+    parts = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+    return [[np.asarray(p.exterior.coords)] + [np.asarray(r.coords) for r in p.interiors] for p in parts]
+
+def _junction_keys(keys, offsets):
+    """Vertex keys where rings stop sharing a boundary (neighbour pairs differ)."""
+    starts = offsets[:-1]
+    ends = offsets[1:]
+    ring_of = np.repeat(np.arange(len(starts)), ends - starts)
+    pos = np.arange(len(keys))
+    prev_idx = np.where(pos == starts[ring_of], ends[ring_of] - 1, pos - 1)
+    next_idx = np.where(pos == ends[ring_of] - 1, starts[ring_of], pos + 1)
+    lo = np.minimum(keys[prev_idx], keys[next_idx])
+    hi = np.maximum(keys[prev_idx], keys[next_idx])
+    
+    order = np.lexsort((hi, lo, keys))
+    k, l, h = keys[order], lo[order], hi[order]
+    new_key = np.ones(len(k), dtype=bool)
+    new_key[1:] = k[1:] != k[:-1]
+    new_pair = new_key.copy()
+    new_pair[1:] |= (l[1:] != l[:-1]) | (h[1:] != h[:-1])
+    pairs_per_key = np.add.reduceat(new_pair.astype(np.int64), np.flatnonzero(new_key))
+    return k[new_key][pairs_per_key > 1]
+
+def build_topology(layers, quantization=QUANTIZATION):
+    """Encode polygon layers as one topology with shared, deduplicated arcs.
+    
+    layers maps an object name to (GeoDataFrame, property columns). Returns a
+    dict with the quantization transform, the arcs as absolute quantized
+    coordinates (coords, offsets) and per-layer features whose rings
+    reference arcs by index (~index for reversed traversal).
+    """
+    features = {}
+    ring_coords = []
+    for name, (gdf, columns) in layers.items():
+        layer_features = []
+        for props, geom in zip(gdf[columns].to_dict('records'), gdf.geometry):
+            if geom is None or geom.is_empty or geom.geom_type not in ('Polygon', 'MultiPolygon'):
+                continue
+            polygons = []
+            for rings in _polygon_rings(geom):
+                polygons.append(list(range(len(ring_coords), len(ring_coords) + len(rings))))
+                ring_coords.extend(rings)
+            layer_features.append({"properties": props, "polygons": polygons})
+        features[name] = layer_features
+    
+    # Quantize everything onto one integer grid
+    all_coords = np.concatenate(ring_coords)
+    x0, y0 = all_coords.min(axis=0)
+    x1, y1 = all_coords.max(axis=0)
+    kx = (x1 - x0) / (quantization - 1) or 1.0
+    ky = (y1 - y0) / (quantization - 1) or 1.0
+    quantized = np.rint((all_coords - [x0, y0]) / [kx, ky]).astype(np.int64)
+    
+    # Open rings (closing vertex removed) with consecutive duplicates dropped
+    lengths = np.array([len(r) for r in ring_coords])
+    ring_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    ring_of = np.repeat(np.arange(len(ring_coords)), lengths)
+    pos = np.arange(len(quantized))
+    keep = pos != ring_starts[ring_of] + lengths[ring_of] - 1
+    keep[1:] &= ~((quantized[1:] == quantized[:-1]).all(axis=1) & (ring_of[1:] == ring_of[:-1]))
+    quantized = quantized[keep]
+    ring_of = ring_of[keep]
+    open_lengths = np.bincount(ring_of, minlength=len(ring_coords))
+    offsets = np.concatenate([[0], np.cumsum(open_lengths)])
+    valid_ring = open_lengths >= 3
+    
+    keys = quantized[:, 0] * (quantization + 1) + quantized[:, 1]
+    junctions = _junction_keys(keys, offsets)
+    is_junction = np.isin(keys, junctions)
+    
+    # Cut every ring at its junctions and deduplicate the resulting arcs
+    arc_lookup = {}
+    arcs = []
+    ring_arcs = []
+    for r in range(len(ring_coords)):
+        if not valid_ring[r]:
+            ring_arcs.append(None)
+            continue
+        ring = quantized[offsets[r]:offsets[r + 1]]
+        ring_keys = keys[offsets[r]:offsets[r + 1]]
+        cuts = np.flatnonzero(is_junction[offsets[r]:offsets[r + 1]])
+        if len(cuts) == 0:
+            # Whole ring is one closed arc; start it at its smallest vertex so
+            # identical rings in different layers share it
+            cuts = np.array([np.argmin(ring_keys)])
+        ring = np.roll(ring, -cuts[0], axis=0)
+        ring_keys = np.roll(ring_keys, -cuts[0])
+        cuts = np.append(cuts - cuts[0], len(ring))
+        refs = []
+        for a, b in zip(cuts[:-1], cuts[1:]):
+            idx = np.arange(a, b + 1) % len(ring)
+            forward = ring_keys[idx].tobytes()
+            if forward in arc_lookup:
+                refs.append(arc_lookup[forward])
+                continue
+            backward = ring_keys[idx[::-1]].tobytes()
+            if backward in arc_lookup:
+                refs.append(~arc_lookup[backward])
+                continue
+            arc_lookup[forward] = len(arcs)
+            refs.append(len(arcs))
+            arcs.append(ring[idx])
+        ring_arcs.append(refs)
+    
+    for layer_features in features.values():
+        for feature in layer_features:
+            polygons = []
+            for rings in feature.pop("polygons"):
+                # A polygon whose exterior collapsed under quantization is dropped
+                if ring_arcs[rings[0]] is None:
+                    continue
+                polygons.append([ring_arcs[r] for r in rings if ring_arcs[r] is not None])
+            feature["arcs"] = polygons
+    
+    arc_offsets = np.concatenate([[0], np.cumsum([len(a) for a in arcs])])
+    logging.info(f"Built topology with {len(arcs)} shared arcs from {len(ring_coords)} rings")
+    return {
+        "transform": {"scale": [kx, ky], "translate": [float(x0), float(y0)]},
+        "coords": np.concatenate(arcs).astype(np.int32),
+        "offsets": arc_offsets,
+        "features": features,
+    }
+
+def simplify_arcs(coords, offsets, tolerance):
+    """Douglas-Peucker simplify every arc, keeping its endpoints (and thus shared junctions)."""
+    n_arcs = len(offsets) - 1
+    lengths = np.diff(offsets)
+    lines = shapely.linestrings(coords.astype(np.float64), indices=np.repeat(np.arange(n_arcs), lengths))
+    simplified = shapely.simplify(lines, tolerance, preserve_topology=False)
+    new_coords, index = shapely.get_coordinates(simplified, return_index=True)
+    new_lengths = np.bincount(index, minlength=n_arcs)
+    
+    # Closed arcs (whole rings) need at least four vertices to stay a ring
+    starts = offsets[:-1]
+    closed = (coords[starts] == coords[offsets[1:] - 1]).all(axis=1)
+    collapsed = np.flatnonzero(closed & (new_lengths < 4))
+    parts = np.split(np.rint(new_coords).astype(np.int32), np.cumsum(new_lengths)[:-1])
+    for arc in collapsed:
+        original = coords[offsets[arc]:offsets[arc + 1]]
+        parts[arc] = original[np.linspace(0, len(original) - 1, min(len(original), 4)).astype(int)]
+    
+    out_offsets = np.concatenate([[0], np.cumsum([len(p) for p in parts])])
+    return np.concatenate(parts), out_offsets
+
+def load_boundary_topology(project_dir, read_boundaries):
+    """Load the cached boundary topology, building it from full-resolution boundaries once.
+    
+    read_boundaries() must return the unsimplified (counties, states) frames;
+    arcs are built from those so that neighbouring features share exact
+    borders, then simplified per zoom level.
+    """
+    entry = boundary_cache_entry(project_dir)
+    if entry in _TOPOLOGY_MEMO:
+        return _TOPOLOGY_MEMO[entry]
+    
+    meta = load_cached_json(entry, "topology")
+    arrays = load_cached_arrays(entry, "topology_arcs")
+    if meta is None or arrays is None or meta.get("version") != TOPOLOGY_VERSION:
+        counties, states = read_boundaries()
+        topo = build_topology({
+            "counties": (counties, COUNTY_PROPERTIES),
+            "states": (states, [c for c in STATE_PROPERTIES if c in states.columns]),
+        })
+        arrays = {}
+        for zoom in TOPOLOGY_ZOOM_LEVELS:
+            tolerance = pixel_tolerance_deg(zoom) / topo["transform"]["scale"][0]
+            arrays[f"coords_{zoom}"], arrays[f"offsets_{zoom}"] = simplify_arcs(topo["coords"], topo["offsets"], tolerance)
+        meta = {"version": TOPOLOGY_VERSION, "transform": topo["transform"], "features": topo["features"]}
+        save_cached_json(entry, "topology", meta)
+        save_cached_arrays(entry, "topology_arcs", **arrays)
+    
+    topology = dict(meta, levels={zoom: (arrays[f"coords_{zoom}"], arrays[f"offsets_{zoom}"])
+                                  for zoom in TOPOLOGY_ZOOM_LEVELS})
+    if entry is not None:
+        _TOPOLOGY_MEMO[entry] = topology
+    return topology
+
+def topology_level_for_zoom(zoom):
+    """Coarsest precomputed level that still looks exact at the given map zoom."""
+    for level in TOPOLOGY_ZOOM_LEVELS:
+        if level >= zoom:
+            return level
+    return TOPOLOGY_ZOOM_LEVELS[-1]
+
+def encode_topojson(topology, zoom, selections):
+    """Emit a TopoJSON document for a subset of features at one simplification level.
+    
+    selections maps a layer name to a list of (feature index, extra properties)
+    pairs. Only arcs referenced by the selected features are included; arcs
+    are delta-encoded per the TopoJSON quantized format.
+    """
+    coords, offsets = topology["levels"][topology_level_for_zoom(zoom)]
+    used = {}
+    objects = {}
+    
+    def remap(ref):
+        arc = ref if ref >= 0 else ~ref
+        if arc not in used:
+            used[arc] = len(used)
+        return used[arc] if ref >= 0 else ~used[arc]
+    
+    for name, selected in selections.items():
+        geometries = []
+        for feature_idx, extra in selected:
+            feature = topology["features"][name][feature_idx]
+            polygons = [[[remap(ref) for ref in ring] for ring in polygon] for polygon in feature["arcs"]]
+            if not polygons:
+                continue
+            properties = dict(feature["properties"], **extra)
+            if len(polygons) == 1:
+                geometries.append({"type": "Polygon", "arcs": polygons[0], "properties": properties})
+            else:
+                geometries.append({"type": "MultiPolygon", "arcs": polygons, "properties": properties})
+        objects[name] = {"type": "GeometryCollection", "geometries": geometries}
+    
+    arcs = []
+    for arc in used:
+        points = coords[offsets[arc]:offsets[arc + 1]].astype(np.int64)
+        deltas = np.vstack([points[:1], np.diff(points, axis=0)])
+        arcs.append(deltas.tolist())
+    return {"type": "Topology", "transform": topology["transform"], "objects": objects, "arcs": arcs}
+
+def feature_positions(topology, layer, key, values):
+    """Indices of the layer's features whose property key matches each value (skipping misses)."""
+    position = {f["properties"][key]: i for i, f in enumerate(topology["features"][layer])}
+    return [position.get(v) for v in values]
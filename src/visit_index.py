@@ -0,0 +1,314 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+from .points import PointStore, NAT_TIMESTAMP
+from .result_cache import RESULT_COLUMNS
+from .analytics import TravelAnalytics, travel_columns, COUNTY_TABLE_COLUMNS
+from .defaults import DEFAULT_CHUNK_SIZE
+
+# Bump when the layout of the index changes so old indexes are rebuilt
+VISIT_INDEX_VERSION = 1
+DAY_MS = 86_400_000
+# Calendar periods coverage can be grouped by (UTC)
+PERIODS = ('day', 'week', 'month', 'year')
+
+def _column_path(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+def _open_columns(path, n):
+    """Memory-mapped point columns of an index (or of its unsorted staging files)."""
+    return {name: np.memmap(_column_path(path, name), dtype=dtype, mode='r', shape=(n,))
+            if n else np.empty(0, dtype=dtype) for name, dtype in RESULT_COLUMNS}
+
+def time_bound(text, end=False):
+    """Epoch milliseconds of an ISO date or time ('2023', '2023-10', '2023-10-05', '2023-10-05T12:00', UTC).
+    
+    With end, the bound is the end of the named period, so '--to 2023'
+    includes all of 2023.
+    """
+    value = np.datetime64(text.strip().rstrip('Z'))
+    if end:
+        value = value + np.timedelta64(1, np.datetime_data(value.dtype)[0])
+    return int(value.astype('datetime64[ms]').astype(np.int64))
+
+def period_starts(days, period):
+    """First day (days since the epoch) of the day/week/month/year containing each day; weeks start on Monday."""
+    days = np.asarray(days, dtype=np.int64)
+    if period == 'day':
+        return days
+    if period == 'week':
+        # 1970-01-01 was a Thursday
+        return days - (days + 3) % 7
+    unit = 'M' if period == 'month' else 'Y'
+    return days.astype('datetime64[D]').astype(f'datetime64[{unit}]').astype('datetime64[D]').astype(np.int64)
+
+def _iso_days(days):
+    """ISO dates of days since the epoch."""
+    return np.datetime_as_string(np.asarray(days, dtype=np.int64).astype('datetime64[D]'))
+
+class VisitIndexWriter:
+    """Builds a visit index at path from the chunks as they are matched.
+    
+    Points and their county positions are appended unsorted to raw column
+    files in a temporary directory; commit() sorts them by timestamp, adds
+    the per-county daily counts and replaces the index atomically.
+    discard() drops an unfinished index.
+    """
+    
+    def __init__(self, path):
+        if os.path.exists(path) and not os.path.exists(os.path.join(path, "manifest.json")):
+            raise ValueError(f"{path} exists and is not a visit index")
+        self.path = path
+        self.tmp = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(os.path.join(self.tmp, "unsorted"))
+        self.files = {name: open(_column_path(os.path.join(self.tmp, "unsorted"), name), 'wb')
+                      for name, _ in RESULT_COLUMNS}
+        self.count = 0
+        self.weighted = False
+        self.segments = True
+    
+    def append(self, chunk, county_idx):
+        """Write a matched PointStore chunk and the county position of each of its points."""
+        segment_ids = chunk.segment_ids if chunk.segment_ids is not None else np.full(len(chunk), -1)
+        columns = {'lons': chunk.lons, 'lats': chunk.lats, 'timestamps': chunk.timestamps,
+                   'segment_ids': segment_ids, 'weights': chunk.weight_array(), 'county_idx': county_idx}
+        for name, dtype in RESULT_COLUMNS:
+            np.ascontiguousarray(columns[name], dtype=dtype).tofile(self.files[name])
+        self.count += len(chunk)
+        self.weighted = self.weighted or chunk.weights is not None
+        self.segments = self.segments and chunk.segment_ids is not None
+    
+    def commit(self, counties, county_state, states, travel, meta, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Sort the points by time, bucket them per county and day, and publish the index.
+        
+        counties are the loaded counties the county positions refer to,
+        county_state their state positions in states and travel the run's
+        per-county arrays (whose first_visit answers "new counties" queries).
+        """
+        for f in self.files.values():
+            f.close()
+        n = self.count
+        unsorted_dir = os.path.join(self.tmp, "unsorted")
+        unsorted = _open_columns(unsorted_dir, n)
+        # Missing timestamps (NAT_TIMESTAMP) sort first; stable so equal times keep input order
+        order = np.argsort(unsorted['timestamps'], kind='stable')
+        for name, _ in RESULT_COLUMNS:
+            with open(_column_path(self.tmp, name), 'wb') as f:
+                for offset in range(0, n, chunk_size):
+                    np.asarray(unsorted[name][order[offset:offset + chunk_size]]).tofile(f)
+        del unsorted, order
+        shutil.rmtree(unsorted_dir)
+        
+        columns = _open_columns(self.tmp, n)
+        days, bucket_county, bucket_count = _daily_counts(columns['timestamps'], columns['county_idx'],
+                                                          columns['weights'], len(counties), chunk_size)
+        np.savez(os.path.join(self.tmp, "buckets.npz"), days=days, county=bucket_county, count=bucket_count)
+        state_names = np.append(states['NAME'].to_numpy(dtype=str), '')[county_state]
+        np.savez(os.path.join(self.tmp, "counties.npz"), geoids=counties['GEOID'].to_numpy(dtype=str),
+                 names=counties['NAME'].to_numpy(dtype=str), statefp=counties['STATEFP'].to_numpy(dtype=str),
+                 state_names=state_names, first_visit=travel['first_visit'], last_visit=travel['last_visit'])
+        timestamps = columns['timestamps']
+        untimed = int(np.searchsorted(timestamps, NAT_TIMESTAMP, side='right'))
+        manifest = {"version": VISIT_INDEX_VERSION, "points": n, "untimed": untimed, "weighted": self.weighted,
+                    "segments": self.segments,
+                    "first_timestamp": int(timestamps[untimed]) if untimed < n else None,
+                    "last_timestamp": int(timestamps[-1]) if untimed < n else None, "meta": meta}
+        with open(os.path.join(self.tmp, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        del columns, timestamps
+        
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp, self.path)
+        logging.info(f"Visit index of {n} points and {len(days)} county-days written to {self.path}")
+        return self.path
+    
+    def discard(self):
+        """Remove the unfinished index."""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+def _daily_counts(timestamps, county_idx, weights, n_counties, chunk_size=DEFAULT_CHUNK_SIZE):
+    """(day, county, weighted count) of every county-day with timed points, sorted by day then county."""
+    keys, sums = [], []
+    for offset in range(0, len(timestamps), chunk_size):
+        ts = np.asarray(timestamps[offset:offset + chunk_size])
+        idx = np.asarray(county_idx[offset:offset + chunk_size], dtype=np.int64)
+        ok = (ts != NAT_TIMESTAMP) & (idx >= 0)
+        chunk_keys, inverse = np.unique(ts[ok] // DAY_MS * n_counties + idx[ok], return_inverse=True)
+        keys.append(chunk_keys)
+        sums.append(np.bincount(inverse, weights=np.asarray(weights[offset:offset + chunk_size])[ok],
+                                minlength=len(chunk_keys)))
+    # A county-day can straddle two chunks
+    keys, inverse = np.unique(np.concatenate(keys + [np.empty(0, dtype=np.int64)]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(sums + [np.empty(0)]), minlength=len(keys))
+    return keys // n_counties, (keys % n_counties).astype(np.int32), np.rint(counts).astype(np.int64)
+
+class VisitIndex:
+    """Persisted visit index: matched points sorted by time plus per-county daily counts.
+    
+    Point columns are memory-mapped, so a time window is a contiguous slice
+    found by binary search and nothing is parsed or matched again. Windows
+    are half-open [start, end) in epoch milliseconds (None leaves a side
+    open); points without timestamps only belong to the unbounded window.
+    County positions refer to the counties stored with the index.
+    """
+    
+    def __init__(self, path):
+        manifest_path = os.path.join(path, "manifest.json")
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"No readable visit index at {path}: {e}") from e
+        if manifest.get("version") != VISIT_INDEX_VERSION:
+            raise ValueError(f"Visit index {path} has an old layout; rebuild it with --visit-index")
+        self.path = path
+        self.manifest = manifest
+        self.untimed = manifest["untimed"]
+        columns = _open_columns(path, manifest["points"])
+        self.timestamps = columns['timestamps']
+        self.county_idx = columns['county_idx']
+        self.weights = columns['weights']
+        self.store = PointStore(columns['lons'], columns['lats'], columns['timestamps'],
+                                columns['segment_ids'] if manifest["segments"] else None,
+                                weights=columns['weights'] if manifest["weighted"] else None)
+        with np.load(os.path.join(path, "buckets.npz")) as data:
+            self.days, self.bucket_county, self.bucket_count = data['days'], data['county'], data['count']
+        with np.load(os.path.join(path, "counties.npz")) as data:
+            self.geoids, self.names, self.statefp = data['geoids'], data['names'], data['statefp']
+            self.state_names = data['state_names']
+            self.first_visit, self.last_visit = data['first_visit'], data['last_visit']
+    
+    def __len__(self):
+        return len(self.timestamps)
+    
+    @property
+    def n_counties(self):
+        return len(self.geoids)
+    
+    def window(self, start=None, end=None):
+        """Slice of the sorted points with timestamps in [start, end)."""
+        if start is None and end is None:
+            return slice(0, len(self))
+        lo = self.untimed if start is None else max(self.untimed, int(np.searchsorted(self.timestamps, start)))
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamps, end))
+        return slice(lo, max(lo, hi))
+    
+    def points(self, start=None, end=None):
+        """The window's points as a memory-mapped PointStore."""
+        return self.store[self.window(start, end)]
+    
+    def _day_range(self, first_day, end_day):
+        """Slice of the daily counts for days in [first_day, end_day)."""
+        lo = 0 if first_day is None else int(np.searchsorted(self.days, first_day))
+        hi = len(self.days) if end_day is None else int(np.searchsorted(self.days, end_day))
+        return slice(lo, max(lo, hi))
+    
+    def _scan_counts(self, window):
+        """Weighted points per county of a slice of the sorted points."""
+        idx = np.asarray(self.county_idx[window], dtype=np.int64)
+        hit = idx >= 0
+        counts = np.bincount(idx[hit], weights=np.asarray(self.weights[window])[hit], minlength=self.n_counties)
+        return np.rint(counts).astype(np.int64)
+    
+    def county_counts(self, start=None, end=None):
+        """Weighted points per county in [start, end).
+        
+        Whole days come from the daily counts; only the points of the
+        partial days at the window's edges (and, for the unbounded window,
+        the untimed points) are read.
+        """
+        first_day = None if start is None else -(-start // DAY_MS)
+        end_day = None if end is None else end // DAY_MS
+        if first_day is not None and end_day is not None and end_day < first_day:
+            # The window lies within one day
+            return self._scan_counts(self.window(start, end))
+        days = self._day_range(first_day, end_day)
+        counts = np.bincount(self.bucket_county[days], weights=self.bucket_count[days],
+                             minlength=self.n_counties).astype(np.int64)
+        if start is None and end is None:
+            counts += self._scan_counts(slice(0, self.untimed))
+        if start is not None:
+            counts += self._scan_counts(self.window(start, first_day * DAY_MS))
+        if end is not None:
+            counts += self._scan_counts(self.window(end_day * DAY_MS, end))
+        return counts
+    
+    def window_arrays(self, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Per-county counts and travel arrays (analytics.TravelAnalytics) of the window's points."""
+        window = self.window(start, end)
+        counts = np.zeros(self.n_counties, dtype=np.int64)
+        analytics = TravelAnalytics(self.n_counties)
+        for offset in range(window.start, window.stop, chunk_size):
+            part = slice(offset, min(offset + chunk_size, window.stop))
+            chunk = self.store[part]
+            county_idx = np.asarray(self.county_idx[part], dtype=np.int64)
+            counts += self._scan_counts(part)
+            analytics.add(chunk, county_idx)
+        return counts, analytics.arrays
+    
+    def new_counties(self, start=None, end=None):
+        """Positions of the counties first visited in [start, end), in order of first visit."""
+        first = self.first_visit
+        new = first != NAT_TIMESTAMP
+        if start is not None:
+            new &= first >= start
+        if end is not None:
+            new &= first < end
+        positions = np.flatnonzero(new)
+        return positions[np.argsort(first[positions], kind='stable')]
+    
+    def county_table(self, counts, arrays=None):
+        """Visited counties (GEOID, NAME, STATEFP, point_count and travel columns), most points first."""
+        selected = counts > 0
+        table = pd.DataFrame({'GEOID': self.geoids[selected], 'NAME': self.names[selected],
+                              'STATEFP': self.statefp[selected], 'point_count': counts[selected]})
+        if arrays is not None:
+            for name, values in travel_columns(arrays, selected).items():
+                table[name] = values
+        table = table[[c for c in COUNTY_TABLE_COLUMNS if c in table.columns]]
+        return table.sort_values('point_count', ascending=False, kind='stable').reset_index(drop=True)
+    
+    def coverage(self, period='month', start=None, end=None):
+        """Per-period points, counties visited, counties visited for the first time and running total.
+        
+        Built from the daily counts alone, so periods are whole UTC days
+        (a day belongs to the window when it starts inside it).
+        """
+        days = self._day_range(None if start is None else -(-start // DAY_MS),
+                               None if end is None else -(-end // DAY_MS))
+        labels = period_starts(self.days[days], period)
+        periods, inverse = np.unique(labels, return_inverse=True)
+        county = self.bucket_county[days].astype(np.int64)
+        points = np.bincount(inverse, weights=self.bucket_count[days], minlength=len(periods))
+        visited = np.bincount(np.unique(inverse * self.n_counties + county) // self.n_counties,
+                              minlength=len(periods))
+        
+        # First visits are exact timestamps, so a county is new in exactly one period
+        first = self.first_visit[self.first_visit != NAT_TIMESTAMP]
+        first_labels = np.sort(period_starts(first // DAY_MS, period))
+        total = np.searchsorted(first_labels, periods, side='right')
+        new = total - np.searchsorted(first_labels, periods, side='left')
+        return pd.DataFrame({'period': _iso_days(periods), 'points': np.rint(points).astype(np.int64),
+                             'counties': visited, 'new_counties': new, 'total_counties': total})
+    
+    def summary(self, start=None, end=None):
+        """Points, visited counties and states, and newly visited counties of a window."""
+        counts = self.county_counts(start, end)
+        visited = counts > 0
+        new = self.new_counties(start, end)
+        first = pd.to_datetime(self.first_visit[new], unit='ms', utc=True).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return {
+            "points": int(np.sum(self.weights[self.window(start, end)])),
+            "points_matched": int(counts.sum()),
+            "counties_visited": int(visited.sum()),
+            "states": sorted(str(name) for name in set(self.state_names[visited]) - {''}),
+            "new_counties": [{"GEOID": str(self.geoids[i]), "NAME": str(self.names[i]),
+                              "state": str(self.state_names[i]), "first_visit": time}
+                             for i, time in zip(new, first)],
+        }
@@ -1,10 +1,24 @@
 import logging
 import folium
-import htmlmin
 import os
-import pandas as pd
+import branca
+import numpy as np
 from folium import Element
-from folium.plugins import MarkerCluster
+from .points import NAT_TIMESTAMP
+from .aggregation import (bin_points, build_cluster_levels, encode_levels,
+                          DEFAULT_MAX_HEAT_BINS, DEFAULT_MAX_CLUSTER_POINTS, DEFAULT_MAX_RAW_POINTS)
+from .map_layers import CompactPointLayer, TopologyData, TopoJsonObjectLayer
+from .topology import encode_topojson, feature_positions
+from .geographies import GEOGRAPHY_LAYERS
+from .html_writer import write_map_html
+
+# County tooltip rows (column, label); columns missing from the matched frame are skipped
+COUNTY_TOOLTIP = [('NAME', 'County:'), ('point_count', 'Points:'), ('distance_km', 'Distance (km):'),
+                  ('dwell_hours', 'Time (h):'), ('first_visit', 'First visit:'), ('last_visit', 'Last visit:')]
+
+def county_tooltip(matched):
+    """COUNTY_TOOLTIP rows available in matched."""
+    return [(field, alias) for field, alias in COUNTY_TOOLTIP if field in matched.columns]
 
 def add_heatmap_safely(m, point_coords):
     """Add heatmap layer, handling potential float key errors."""
@@ -25,8 +39,91 @@ def add_heatmap_safely(m, point_coords):
         logging.warning(f"Could not add heatmap: {e}")
         pass
 
-def generate_map(counties, matched, states, points, point_gdf, output_path, add_markers, state_names):
-    """Generate an interactive map with matched counties and point locations with toggleable layers."""
+def add_topology_layers(m, topology, matched, zoom, county_layer, state_layer, report):
+    """Embed visited counties and all state borders as one shared-arc TopoJSON document."""
+    counts = matched['point_count'].to_numpy()
+    tooltip = county_tooltip(matched)
+    extra = [field for field, _ in tooltip if field not in ('NAME', 'point_count')]
+    colormap = None
+    if len(counts):
+        # Six equal steps like the GeoJSON choropleth's default binning
+        colormap = branca.colormap.linear.YlOrRd_09.scale(counts.min(), max(counts.max(), counts.min() + 1)).to_step(6)
+        colormap.caption = 'Point Count'
+    
+    selections = {
+        "counties": [(i, {"point_count": int(count), "fill": colormap(count), **properties})
+                     for i, count, properties in zip(feature_positions(topology, "counties", "GEOID", matched['GEOID']),
+                                                     counts, matched[extra].to_dict('records'))
+                     if i is not None],
+        "states": [(i, {}) for i in range(len(topology["features"]["states"]))],
+    }
+    document = encode_topojson(topology, zoom, selections)
+    data = TopologyData(document)
+    data.add_to(m)
+    report["boundary_arcs"] = len(document["arcs"])
+    
+    if selections["counties"]:
+        TopoJsonObjectLayer(
+            data, "counties",
+            style={'fillOpacity': 0.5, 'color': 'black', 'weight': 1, 'opacity': 0.2},
+            tooltip=tooltip,
+            control=False
+        ).add_to(county_layer)
+        colormap.add_to(m)
+    TopoJsonObjectLayer(
+        data, "states",
+        style={'fillColor': 'transparent', 'fillOpacity': 0, 'color': 'blue', 'weight': 1.5, 'opacity': 0.5},
+        control=False
+    ).add_to(state_layer)
+    county_layer.add_to(m)
+
+def add_geography_layers(m, geographies, report):
+    """Draw the visited features of each finer geography layer as its own hidden, toggleable choropleth."""
+    for name, features in geographies.items():
+        report[f"{name}_features"] = len(features)
+        if features.empty:
+            continue
+        title = GEOGRAPHY_LAYERS[name]['title']
+        counts = features['point_count'].to_numpy()
+        colormap = branca.colormap.linear.YlOrRd_09.scale(counts.min(), max(counts.max(), counts.min() + 1)).to_step(6)
+        layer = folium.FeatureGroup(name=f'🧩 {title}', show=False)
+        folium.GeoJson(
+            features[['GEOID', 'NAME', 'point_count', 'geometry']],
+            name=title,
+            style_function=lambda feature, colormap=colormap: {
+                'fillColor': colormap(feature['properties']['point_count']),
+                'fillOpacity': 0.5,
+                'color': 'black',
+                'weight': 0.5,
+                'opacity': 0.3
+            },
+            tooltip=folium.GeoJsonTooltip(
+                fields=['NAME', 'point_count'],
+                aliases=[f'{title}:', 'Points:'],
+                localize=True
+            )
+        ).add_to(layer)
+        layer.add_to(m)
+
+def generate_map(counties, matched, states, points, output_path, add_markers, state_names,
+                 max_heat_bins=DEFAULT_MAX_HEAT_BINS, max_cluster_points=DEFAULT_MAX_CLUSTER_POINTS,
+                 max_raw_points=DEFAULT_MAX_RAW_POINTS, topology=None, compress=False, sidecars=False,
+                 geographies=None):
+    """Generate an interactive map with matched counties and PointStore locations with toggleable layers.
+
+    Points are embedded pre-aggregated: weighted grid bins (at most
+    max_heat_bins) feed the heatmap, and per-zoom clusters (at most
+    max_cluster_points in total) are drawn by one compact canvas layer.
+    With a boundary topology (see topology.load_boundary_topology), county and
+    state boundaries are embedded once as quantized TopoJSON with shared arcs
+    instead of as separate GeoJSON layers. geographies maps finer layer names
+    to their visited features (with point_count), each drawn as a hidden
+    toggleable layer. The page is written in one
+    streaming pass, optionally gzipped or with its data in sidecar files
+    (see html_writer.write_map_html). Returns a report of embedded element counts and the output size.
+    """
+    report = {"heatmap_bins": 0, "cluster_levels": 0, "cluster_points": 0, "raw_points": 0,
+              "boundary_encoding": "topojson" if topology is not None else "geojson"}
     # Set map center and zoom based on data
     center = [37.0902, -95.7129]  # Default US center
     zoom = 4
@@ -55,13 +152,16 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
     # Create feature groups for better layer organization
     county_layer = folium.FeatureGroup(name='🏙️ Counties with Points')
     state_layer = folium.FeatureGroup(name='🗺️ State Boundaries')
-    points_cluster_layer = folium.FeatureGroup(name='📍 Point Clusters')
+    points_cluster_layer = None
     points_heatmap_layer = folium.FeatureGroup(name='🔥 Point Heatmap')
     recent_path_layer = folium.FeatureGroup(name='📱 Recent Path')
     county_info_layer = folium.FeatureGroup(name='ℹ️ County Information')
     
+    if topology is not None:
+        add_topology_layers(m, topology, matched, zoom, county_layer, state_layer, report)
+    
     # Add matched counties with color gradient based on point count
-    if not matched.empty:
+    if topology is None and not matched.empty:
         # Important change: Add Choropleth directly to the map first, then add to layer
         choropleth = folium.Choropleth(
             geo_data=matched,
@@ -83,29 +183,31 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
             matched,
             name='County Info',
             tooltip=folium.GeoJsonTooltip(
-                fields=['NAME', 'point_count'],
-                aliases=['County:', 'Points:'],
+                fields=[field for field, _ in county_tooltip(matched)],
+                aliases=[alias for _, alias in county_tooltip(matched)],
                 localize=True
             ),
             style_function=lambda x: {'fillOpacity': 0, 'weight': 0}
         ).add_to(county_info_layer)
     
     # Add state borders
-    folium.GeoJson(
-        states.geometry,
-        name='State Borders',
-        style_function=lambda x: {
-            'fillColor': 'transparent',
-            'color': 'blue',
-            'weight': 1.5,
-            'opacity': 0.5
-        }
-    ).add_to(state_layer)
+    if topology is None:
+        folium.GeoJson(
+            states.geometry,
+            name='State Borders',
+            style_function=lambda x: {
+                'fillColor': 'transparent',
+                'color': 'blue',
+                'weight': 1.5,
+                'opacity': 0.5
+            }
+        ).add_to(state_layer)
     
     # Always add point visualization (different methods depending on number of points)
-    if points:
-        # Create coordinates list for potential heatmap
-        point_coords = [[p.y, p.x] for p in points]
+    if len(points):
+        lats = points.lats.astype(np.float64)
+        lons = points.lons.astype(np.float64)
+        weights = points.weight_array()
         
         # Try to add heatmap if many points
         if len(points) > 100:
@@ -113,52 +215,38 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
                 # Import here to catch import errors
                 from folium.plugins import HeatMap
                 
+                # Weighted grid bins stand in for the raw points; a bin of weight w
+                # renders like w stacked points, so intensities are preserved
+                bin_lats, bin_lons, bin_weights, cell_deg = bin_points(lats, lons, weights, max_bins=max_heat_bins)
+                
                 # Use only string keys in gradient to avoid camelize errors
                 HeatMap(
-                    point_coords,
+                    np.column_stack([np.round(bin_lats, 5), np.round(bin_lons, 5), bin_weights]).tolist(),
                     radius=10,
                     blur=15,
                     gradient={'0.4': 'blue', '0.65': 'lime', '1.0': 'red'}
                 ).add_to(points_heatmap_layer)
-                logging.info("Added heatmap layer successfully")
+                report["heatmap_bins"] = len(bin_weights)
+                logging.info(f"Added heatmap layer with {len(bin_weights)} bins ({cell_deg:g}° cells)")
             except (ImportError, AttributeError) as e:
                 logging.warning(f"Could not add heatmap: {e}")
         
-        # Add individual markers with clustering
-        marker_cluster = MarkerCluster().add_to(points_cluster_layer)
+        # Clusters are precomputed per zoom level and drawn by a single canvas layer
+        levels = build_cluster_levels(lats, lons, weights, max_points=max_cluster_points)
+        points_cluster_layer = CompactPointLayer(encode_levels(levels), name='📍 Point Clusters')
+        report["cluster_levels"] = len(levels)
+        report["cluster_points"] = sum(len(level[0]) for level in levels.values())
         
-        # Limit number of individual markers for performance
-        max_markers = min(2000, len(points))
-        step = max(1, len(points) // max_markers)
-        
-        for i in range(0, len(points), step):
-            pt = points[i]
-            folium.CircleMarker(
-                location=[pt.y, pt.x],
-                radius=3,
-                color='blue',
-                fill=True,
-                fill_color='blue',
-                fill_opacity=0.7,
-                tooltip=f"Point {i}: {pt.y:.6f}, {pt.x:.6f}"
-            ).add_to(marker_cluster)
-        
-        # If point_gdf has timestamp, add a time-based trail with the most recent 100 points
-        if not point_gdf.empty and 'timestamp' in point_gdf.columns and len(point_gdf) > 10:
+        # If points have timestamps, add a time-based trail with the most recent 100 points
+        timed = np.flatnonzero(points.timestamps != NAT_TIMESTAMP)
+        if len(timed) > 10:
             try:
-                # Convert timestamps to datetime if they're strings
-                if point_gdf['timestamp'].dtype == 'object':
-                    point_gdf['timestamp'] = pd.to_datetime(
-                        point_gdf['timestamp'], 
-                        errors='coerce'
-                    )
-                
-                # Sort by timestamp and get the most recent points
-                recent_points = point_gdf.sort_values('timestamp').tail(100)
+                # Most recent points in chronological order
+                order = timed[np.argsort(points.timestamps[timed], kind='stable')][-100:]
                 
                 # Create a path line
-                if len(recent_points) > 1:
-                    path_coords = [[row.geometry.y, row.geometry.x] for _, row in recent_points.iterrows()]
+                if len(order) > 1:
+                    path_coords = np.column_stack([lats[order], lons[order]]).tolist()
                     folium.PolyLine(
                         path_coords,
                         color='green',
@@ -167,37 +255,26 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
                     ).add_to(recent_path_layer)
                     
                     # Add start and end markers
-                    start_point = recent_points.iloc[0]
-                    end_point = recent_points.iloc[-1]
-                    
                     folium.Marker(
-                        [start_point.geometry.y, start_point.geometry.x],
+                        path_coords[0],
                         icon=folium.Icon(color='green', icon='play', prefix='fa'),
                         tooltip='Start'
                     ).add_to(recent_path_layer)
                     
                     folium.Marker(
-                        [end_point.geometry.y, end_point.geometry.x],
+                        path_coords[-1],
                         icon=folium.Icon(color='red', icon='stop', prefix='fa'),
                         tooltip='End'
                     ).add_to(recent_path_layer)
             except Exception as e:
                 logging.warning(f"Failed to create time-based path: {e}")
     
-    # Add raw point layer if there aren't too many points (less than 1000)
-    if points and len(points) < 1000:
-        raw_points_layer = folium.FeatureGroup(name='🔍 Individual Points')
-        for i, pt in enumerate(points):
-            folium.CircleMarker(
-                location=[pt.y, pt.x],
-                radius=2,
-                color='purple',
-                fill=True,
-                fill_color='purple',
-                fill_opacity=0.7,
-                tooltip=f"Point {i}: {pt.y:.6f}, {pt.x:.6f}"
-            ).add_to(raw_points_layer)
-        raw_points_layer.add_to(m)
+    # Add raw point layer if there aren't too many points
+    if len(points) and len(points) <= max_raw_points:
+        raw_level = (points.lats.astype(np.float64), points.lons.astype(np.float64), np.ones(len(points)))
+        CompactPointLayer(encode_levels({0: raw_level}, precision=6), name='🔍 Individual Points',
+                          color='purple', radius=2).add_to(m)
+        report["raw_points"] = len(points)
     
     # Create a base layers group for the map types with proper attributions
     folium.TileLayer(
@@ -220,18 +297,25 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
     
     # Add all feature groups to the map
     # Note: county_layer is now the choropleth itself and already added to the map
-    county_info_layer.add_to(m)
+    if topology is None:
+        county_info_layer.add_to(m)
     state_layer.add_to(m)
-    points_cluster_layer.add_to(m)
+    if points_cluster_layer is not None:
+        points_cluster_layer.add_to(m)
     points_heatmap_layer.add_to(m)
     recent_path_layer.add_to(m)
+    if geographies:
+        add_geography_layers(m, geographies, report)
     
     # Add coverage statistics layer
     stats_layer = folium.FeatureGroup(name='📊 Coverage Statistics')
     
     # Calculate statistics
-    point_density = len(points) / len(matched) if not matched.empty and len(matched) > 0 else 0
-    counties_covered_pct = len(matched) / len(counties) * 100 if not counties.empty else 0
+    total_points = points.total_weight
+    point_density = total_points / len(matched) if not matched.empty and len(matched) > 0 else 0
+    # counties may be limited to the points' extent; coverage is of all counties
+    total_counties = counties.attrs.get('total_features') or len(counties)
+    counties_covered_pct = len(matched) / total_counties * 100 if total_counties else 0
     
     # Default values for bounds
     lat_range = 10
@@ -255,7 +339,7 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
     ">
         <h4 style="margin-top:0;">📊 Coverage Statistics</h4>
         <table style="width:100%;">
-            <tr><td>📍 Total Points:</td><td><b>{len(points)}</b></td></tr>
+            <tr><td>📍 Total Points:</td><td><b>{total_points}</b></td></tr>
             <tr><td>🗺️ Counties Matched:</td><td><b>{len(matched)}</b> ({counties_covered_pct:.1f}%)</td></tr>
             <tr><td>🏛️ States Covered:</td><td><b>{len(state_names)}</b></td></tr>
             <tr><td>📊 Avg Points/County:</td><td><b>{point_density:.1f}</b></td></tr>
@@ -304,28 +388,17 @@ def generate_map(counties, matched, states, points, point_gdf, output_path, add_
     """
     m.get_root().html.add_child(Element(legend_html))
     
-    # Save and minify HTML
+    # Stream the minified page and its data payloads to disk in one pass
     try:
-        m.save(output_path)
-        logging.info(f"Map saved to: {output_path}")
-        
-        # Attempt to minify the HTML
-        try:
-            with open(output_path, 'r', encoding='utf-8') as f:
-                minified = htmlmin.minify(
-                    f.read(),
-                    remove_empty_space=True,
-                    remove_all_empty_space=False,  # Complete removal can break some JS
-                    remove_optional_attribute_quotes=False  # Can cause issues with some HTML
-                )
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(minified)
-            
-            file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-            logging.info(f"Minified map size: {file_size_mb:.2f} MB")
-        except Exception as e:
-            logging.warning(f"HTML minification failed: {e}")
+        output_path, sidecar_bytes = write_map_html(m, output_path, compress=compress, sidecars=sidecars)
     except Exception as e:
         logging.error(f"Failed to save map: {e}")
         raise
+    
+    report["output_path"] = output_path
+    report["html_bytes"] = os.path.getsize(output_path)
+    report["sidecar_bytes"] = sidecar_bytes
+    logging.info(f"Map saved to: {output_path} ({report['html_bytes'] / (1024 * 1024):.2f} MB)")
+    logging.info(f"Map elements: {report['heatmap_bins']} heatmap bins, {report['cluster_points']} clusters "
+                 f"over {report['cluster_levels']} zoom levels, {report['raw_points']} raw points")
+    return report
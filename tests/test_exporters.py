@@ -0,0 +1,49 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from src.points import PointStore, NAT_TIMESTAMP
+from src.exporters import number_field, _time_field, write_points_json
+
+def rows(field):
+    """Decode each row of a byte matrix as JSON."""
+    return [json.loads(row.tobytes().decode('ascii')) for row in field]
+
+@pytest.mark.parametrize('precision', [0, 1, 3, 6])
+def test_number_field_round_trips(precision):
+    values = np.array([-0.4, -0.0004, -0.5, 0.0, 0.25, -123.456789, 179.9999999, -1e6, 7.0])
+    field = number_field(values, precision)
+    decoded = rows(field)
+    expected = [float(np.round(v, precision)) for v in values]
+    np.testing.assert_allclose(decoded, expected, atol=10.0 ** -(precision + 6))
+    assert field.shape[0] == len(values)
+
+def test_number_field_signs_below_one():
+    # Negatives between -1 and 0 keep their sign; values that round to zero lose it
+    text = [row.tobytes().decode('ascii').strip() for row in number_field(np.array([-0.4, -0.04, -0.0004]), 2)]
+    assert text == ['-0.40', '-0.04', '0.00']
+
+def test_number_field_empty():
+    assert number_field(np.array([]), 3).shape[0] == 0
+
+def test_time_field_round_trips_with_nat():
+    timestamps = np.array([1704103200123, NAT_TIMESTAMP, -86_400_000, 0], dtype=np.int64)
+    decoded = rows(_time_field(timestamps))
+    assert decoded == ['2024-01-01T10:00:00.123Z', None, '1969-12-31T00:00:00.000Z', '1970-01-01T00:00:00.000Z']
+
+@pytest.mark.parametrize('newline_delimited', [False, True])
+def test_point_export_is_valid_geojson(tmp_path, newline_delimited):
+    points = PointStore([-99.5, 151.125, -0.25], [35.5, -33.25, 0.75], [1704103200000, NAT_TIMESTAMP, 0], [0, 0, 1])
+    path = tmp_path / ('points.ndjson' if newline_delimited else 'points.geojson')
+    write_points_json(points, str(path), precision=4, chunk_size=2, newline_delimited=newline_delimited)
+    
+    text = path.read_text(encoding='ascii')
+    if newline_delimited:
+        features = [json.loads(line) for line in text.splitlines()]
+    else:
+        features = json.loads(text)['features']
+    assert [f['geometry']['coordinates'] for f in features] == [[-99.5, 35.5], [151.125, -33.25], [-0.25, 0.75]]
+    assert [f['properties']['timestamp'] for f in features] == ['2024-01-01T10:00:00.000Z', None,
+                                                                '1970-01-01T00:00:00.000Z']
+    assert [f['properties']['segment_id'] for f in features] == [0, 0, 1]
+    assert pd.Timestamp(features[0]['properties']['timestamp']).value // 1_000_000 == 1704103200000
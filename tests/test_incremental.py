@@ -0,0 +1,40 @@
+import json
+import geopandas as gpd
+from shapely.geometry import box
+from src.core import process_data
+
+def make_project(tmp_path):
+    """Two counties in one state, in TIGER layout."""
+    project = tmp_path / "project"
+    (project / "tl_2024_us_county").mkdir(parents=True)
+    (project / "tl_2024_us_state").mkdir()
+    counties = gpd.GeoDataFrame({'STATEFP': ['01', '01'], 'COUNTYFP': ['001', '002'], 'GEOID': ['01001', '01002'],
+                                 'NAME': ['West', 'East'], 'geometry': [box(-100, 35, -99, 36), box(-99, 35, -98, 36)]},
+                                crs='EPSG:4326')
+    states = gpd.GeoDataFrame({'STATEFP': ['01'], 'NAME': ['Alpha'], 'STUSPS': ['AL'],
+                               'geometry': [box(-100, 35, -98, 36)]}, crs='EPSG:4326')
+    counties.to_file(project / "tl_2024_us_county" / "tl_2024_us_county.shp")
+    states.to_file(project / "tl_2024_us_state" / "tl_2024_us_state.shp")
+    return project
+
+def write_timeline(path, points):
+    """Semantic timeline with one segment; points are (lat, lon, time or None)."""
+    path_points = [{'point': f'{lat}°, {lon}°', **({'time': time} if time else {})} for lat, lon, time in points]
+    segment = {'startTime': '2024-01-01T00:00:00.000Z', 'endTime': '2024-01-02T00:00:00.000Z',
+               'timelinePath': path_points}
+    path.write_text(json.dumps({'semanticSegments': [segment]}), encoding='utf-8')
+
+def test_rerun_on_unchanged_file_keeps_totals(tmp_path):
+    project = make_project(tmp_path)
+    timeline = tmp_path / "timeline.json"
+    write_timeline(timeline, [(35.5, -99.5, '2024-01-01T10:00:00.000Z'), (35.5, -99.4, '2024-01-01T11:00:00.000Z'),
+                              (35.5, -98.5, None)])
+    state_file = tmp_path / "state.json"
+    
+    results = [process_data(str(timeline), None, str(project), state_file=str(state_file)) for _ in range(3)]
+    for result in results:
+        assert result['points_count'] == 3
+        assert {c['GEOID']: c['point_count'] for c in result['travel']['counties']} == {'01001': 2, '01002': 1}
+    assert results[1]['new_points'] == 0
+    # Runs without a map keep only the aggregates
+    assert not (tmp_path / "state.json.points.npz").exists()
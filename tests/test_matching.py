@@ -0,0 +1,87 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point, Polygon, box
+from src.geo_utils import match_points_to_counties
+from src.spatial_index import BoundaryIndex, LayerIndex
+
+def make_boundaries():
+    """Three counties (one non-convex) in two states, sharing edges at lon -99 and lat 36."""
+    counties = gpd.GeoDataFrame({
+        'GEOID': ['01001', '01002', '02001'],
+        'STATEFP': ['01', '01', '02'],
+        'geometry': [
+            Polygon([(-100, 35), (-99, 35), (-99, 36), (-99.5, 35.5), (-100, 36)]),
+            box(-99, 35, -98, 36),
+            box(-100, 36, -98, 37),
+        ],
+    }, crs='EPSG:4326')
+    states = gpd.GeoDataFrame({'STATEFP': ['01', '02'], 'geometry': [box(-100, 35, -98, 36), box(-100, 36, -98, 37)]},
+                              crs='EPSG:4326')
+    return counties, states
+
+def legacy_match(geoms, lons, lats):
+    """Per-point reference: first polygon containing each point, or -1."""
+    result = []
+    for lon, lat in zip(lons, lats):
+        point = Point(lon, lat)
+        result.append(next((i for i, geom in enumerate(geoms) if geom.contains(point)), -1))
+    return np.array(result, dtype=np.int64)
+
+def sample_points():
+    """Random points over and around the counties plus points on shared edges, vertices and the notch."""
+    rng = np.random.default_rng(7)
+    lons = rng.uniform(-100.2, -97.8, 2000)
+    lats = rng.uniform(34.8, 37.2, 2000)
+    edge_lons = np.array([-99.0, -99.0, -98.5, -100.0, -99.5, -99.75, -98.0, -99.0])
+    edge_lats = np.array([35.25, 36.0, 36.0, 35.5, 35.5, 35.9, 36.5, 36.5])
+    return np.concatenate([lons, edge_lons]), np.concatenate([lats, edge_lats])
+
+def test_bulk_matching_equals_per_point():
+    counties, _ = make_boundaries()
+    lons, lats = sample_points()
+    weights = np.full(len(lons), 2.0)
+    
+    county_idx, counts = match_points_to_counties(counties, lons, lats, chunk_size=300, weights=weights)
+    expected = legacy_match(list(counties.geometry), lons, lats)
+    
+    np.testing.assert_array_equal(county_idx, expected)
+    np.testing.assert_array_equal(counts, 2 * np.bincount(expected[expected >= 0], minlength=len(counties)))
+
+def test_hierarchical_matching_equals_per_point():
+    counties, states = make_boundaries()
+    lons, lats = sample_points()
+    index = BoundaryIndex(counties, states)
+    stats = {}
+    
+    county_idx, counts = index.match(lons, lats, stats=stats)
+    expected = legacy_match(list(counties.geometry), lons, lats)
+    
+    np.testing.assert_array_equal(county_idx, expected)
+    np.testing.assert_array_equal(counts, np.bincount(expected[expected >= 0], minlength=len(counties)))
+    # Both the interior-cell grid and the boundary fallback were exercised
+    assert 0 < stats["grid_hits"] < stats["points"]
+
+def test_grid_cells_lie_inside_their_county():
+    counties, states = make_boundaries()
+    index = BoundaryIndex(counties, states)
+    n_cols = int(np.ceil(360.0 / index.cell_size))
+    x0 = (index.grid_keys % n_cols) * index.cell_size - 180.0
+    y0 = (index.grid_keys // n_cols) * index.cell_size - 90.0
+    cells = shapely.box(x0, y0, x0 + index.cell_size, y0 + index.cell_size)
+    assert shapely.contains(counties.geometry.to_numpy()[index.grid_values], cells).all()
+
+def test_layer_matching_equals_per_point():
+    counties, states = make_boundaries()
+    lons, lats = sample_points()
+    # Tracts cover only part of their county, so some points with a county have no tract
+    tracts = gpd.GeoDataFrame({'geometry': [box(-100, 35, -99.5, 35.5), box(-99, 35, -98.5, 36),
+                                            box(-98.5, 35, -98, 35.8), box(-100, 36, -98, 36.5)]}, crs='EPSG:4326')
+    layer = LayerIndex(tracts, [0, 1, 1, 2], len(counties))
+    county_idx, _ = BoundaryIndex(counties, states).match(lons, lats)
+    
+    feature_idx, counts = layer.match(lons, lats, county_idx)
+    expected = legacy_match(list(tracts.geometry), lons, lats)
+    
+    np.testing.assert_array_equal(feature_idx, expected)
+    np.testing.assert_array_equal(counts, np.bincount(expected[expected >= 0], minlength=len(tracts)))
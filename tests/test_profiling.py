@@ -0,0 +1,31 @@
+import time
+import threading
+from src.profiling import StageRecorder
+
+def busy(seconds):
+    """Spin on the CPU for about seconds of wall time."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_concurrent_stages_count_only_their_own_cpu():
+    recorder = StageRecorder()
+    started = threading.Event()
+    
+    def background():
+        with recorder.stage("export"):
+            started.set()
+            busy(0.3)
+    
+    worker = threading.Thread(target=background)
+    worker.start()
+    started.wait()
+    # An idle stage running alongside a busy one must not pick up its CPU time
+    with recorder.stage("render"):
+        time.sleep(0.2)
+    worker.join()
+    
+    stages = recorder.report()["stages"]
+    assert stages["export"]["cpu_seconds"] > 0.1
+    assert stages["render"]["cpu_seconds"] < 0.05
+    assert stages["render"]["seconds"] >= 0.2
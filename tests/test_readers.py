@@ -0,0 +1,88 @@
+import json
+import numpy as np
+import pytest
+from src.points import PointStore, NAT_TIMESTAMP
+from src.readers import iter_point_chunks, detect_format
+from src.coordinates import parse_lat_lon_strings
+
+# (lat, lon, ISO time or None) written in every format below
+POINTS = [(35.5, -99.5, '2024-01-01T10:00:00Z'), (-33.25, 151.125, '2024-01-01T11:30:00Z'), (40.0, -75.0, None)]
+EPOCH_MS = [1704103200000, 1704108600000, NAT_TIMESTAMP]
+
+def write_timeline(path):
+    segment = {'endTime': '2024-01-01T12:00:00Z',
+               'timelinePath': [{'point': f'{lat}°, {lon}°', **({'time': t} if t else {})} for lat, lon, t in POINTS]}
+    path.write_text(json.dumps({'semanticSegments': [segment]}), encoding='utf-8')
+
+def write_records(path):
+    locations = [{'latitudeE7': round(lat * 1e7), 'longitudeE7': round(lon * 1e7), **({'timestamp': t} if t else {})}
+                 for lat, lon, t in POINTS]
+    path.write_text(json.dumps({'locations': locations}), encoding='utf-8')
+
+def write_gpx(path):
+    points = ''.join(f'<trkpt lat="{lat}" lon="{lon}">' + (f'<time>{t}</time>' if t else '') + '</trkpt>'
+                     for lat, lon, t in POINTS)
+    path.write_text('<?xml version="1.0"?><gpx xmlns="http://www.topografix.com/GPX/1/1"><metadata><time>'
+                    '2020-01-01T00:00:00Z</time></metadata><trk><trkseg>' + points + '</trkseg></trk></gpx>',
+                    encoding='utf-8')
+
+def write_csv(path):
+    rows = ''.join(f'{t or ""},{lat},{lon}\n' for lat, lon, t in POINTS)
+    path.write_text('Timestamp,Lat,Lng\n' + rows, encoding='utf-8')
+
+WRITERS = {
+    'timeline': ('timeline.json', write_timeline),
+    'records': ('Records.json', write_records),
+    'gpx': ('track.gpx', write_gpx),
+    'csv': ('points.csv', write_csv),
+}
+
+def read(path, **kwargs):
+    return PointStore.concat(iter_point_chunks(str(path), **kwargs))
+
+@pytest.mark.parametrize('name', sorted(WRITERS))
+def test_every_format_reads_the_same_points(tmp_path, name):
+    filename, write = WRITERS[name]
+    path = tmp_path / filename
+    write(path)
+    
+    assert detect_format(str(path)) == name
+    points = read(path, chunk_size=2)
+    np.testing.assert_allclose(points.lats, [lat for lat, _, _ in POINTS])
+    np.testing.assert_allclose(points.lons, [lon for _, lon, _ in POINTS])
+    np.testing.assert_array_equal(points.timestamps, EPOCH_MS)
+
+@pytest.mark.parametrize('name', sorted(WRITERS))
+def test_since_drops_older_and_untimed_points(tmp_path, name):
+    filename, write = WRITERS[name]
+    path = tmp_path / filename
+    write(path)
+    
+    points = read(path, since=EPOCH_MS[0])
+    np.testing.assert_array_equal(points.timestamps, [EPOCH_MS[1]])
+
+def test_records_overflowed_e7_and_timestamp_ms(tmp_path):
+    path = tmp_path / 'Records.json'
+    # -1 degree latitude written as an unsigned 32-bit value
+    path.write_text(json.dumps({'locations': [{'latitudeE7': (1 << 32) - 10_000_000, 'longitudeE7': 20_000_000,
+                                               'timestampMs': '1704103200000'}]}), encoding='utf-8')
+    points = read(path)
+    np.testing.assert_allclose([points.lats[0], points.lons[0]], [-1.0, 2.0])
+    assert points.timestamps[0] == EPOCH_MS[0]
+
+def test_csv_epoch_seconds(tmp_path):
+    path = tmp_path / 'points.csv'
+    path.write_text('latitude,longitude,time\n1.5,2.5,1704103200\n', encoding='utf-8')
+    assert read(path).timestamps[0] == EPOCH_MS[0]
+
+def test_explicit_format_overrides_detection(tmp_path):
+    path = tmp_path / 'export.json'
+    write_gpx(path)
+    with pytest.raises(ValueError):
+        detect_format(str(path))
+    assert len(read(path, input_format='gpx')) == len(POINTS)
+
+def test_coordinate_strings_never_shift_between_rows():
+    lat, lon, valid = parse_lat_lon_strings(['1,2,3', '4', '5°, 6°'])
+    np.testing.assert_array_equal(valid, [False, False, True])
+    assert (lat[2], lon[2]) == (5.0, 6.0)
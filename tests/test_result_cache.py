@@ -0,0 +1,104 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from src.points import PointStore
+from src.analytics import empty_travel_arrays
+from src.boundary_cache import boundary_shapefile_paths
+from src.result_cache import (result_cache_key, result_cache_root, load_cached_result, cached_county_positions,
+                              cached_county_arrays, iter_cached_matches, ResultWriter, evict_results, map_cache_key)
+
+OPTIONS = {"input_format": None, "thin": False, "thin_distance": 50.0, "thin_min_stay": 300.0, "chunk_size": None}
+
+def make_project(tmp_path):
+    """Project whose boundary shapefile components exist (only their size and mtime are fingerprinted)."""
+    project = tmp_path / "project"
+    for path in boundary_shapefile_paths(str(project)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'shp')
+    return str(project)
+
+def store_entry(project, key, n_points, counties=('01001', '01002')):
+    """Commit an entry of n_points, alternating between the counties, with no size limit."""
+    points = PointStore(np.linspace(-100, -98, n_points), np.full(n_points, 35.5), np.arange(n_points),
+                        np.zeros(n_points))
+    county_idx = np.arange(n_points) % len(counties)
+    writer = ResultWriter(project, key)
+    half = n_points // 2
+    writer.append(points[:half], county_idx[:half])
+    writer.append(points[half:], county_idx[half:])
+    counts = np.bincount(county_idx, minlength=len(counties))
+    frame = pd.DataFrame({'GEOID': list(counties)})
+    return writer.commit(frame, counts, empty_travel_arrays(len(counties)), {"raw_count": n_points}, 1 << 40), points
+
+def test_key_follows_content_boundaries_and_options(tmp_path):
+    project = make_project(tmp_path)
+    first = tmp_path / "a.json"
+    copy = tmp_path / "b.json"
+    first.write_text('{"semanticSegments": []}', encoding='utf-8')
+    shutil.copyfile(first, copy)
+    key = result_cache_key(project, str(first), OPTIONS)
+    
+    # Content-addressed: another path with the same bytes shares the entry
+    assert result_cache_key(project, str(copy), OPTIONS) == key
+    assert result_cache_key(project, str(first), dict(OPTIONS, thin=True)) != key
+    
+    copy.write_text('{"semanticSegments": [{}]}', encoding='utf-8')
+    assert result_cache_key(project, str(copy), OPTIONS) != key
+    
+    county_path, _ = boundary_shapefile_paths(project)
+    with open(county_path, 'ab') as f:
+        f.write(b'changed')
+    assert result_cache_key(project, str(first), OPTIONS) != key
+
+def test_map_key_follows_loaded_boundaries():
+    options = {"add_markers": False, "map_options": None, "topojson": False, "boundaries": [9, 1]}
+    assert map_cache_key(options, {}) == map_cache_key(dict(options), {})
+    assert map_cache_key(dict(options, boundaries=[64, 4]), {}) != map_cache_key(options, {})
+
+def test_entry_round_trip_onto_other_counties(tmp_path):
+    project = make_project(tmp_path)
+    store_entry(project, "k1", 10)
+    cached = load_cached_result(project, "k1")
+    assert len(cached["points"]) == 10
+    np.testing.assert_array_equal(cached["points"].timestamps, np.arange(10))
+    assert cached["meta"] == {"raw_count": 10}
+    
+    # The loaded boundaries list the counties in another order, with an extra one
+    counties = pd.DataFrame({'GEOID': ['01002', '09999', '01001']})
+    positions = cached_county_positions(cached, counties)
+    counts, _ = cached_county_arrays(cached, positions, len(counties))
+    np.testing.assert_array_equal(counts, [5, 0, 5])
+    matches = np.concatenate([idx for _, idx in iter_cached_matches(cached, positions, 3)])
+    np.testing.assert_array_equal(matches, np.where(np.arange(10) % 2 == 0, 2, 0))
+    
+    # A county with points missing from the loaded boundaries means matching again
+    assert cached_county_positions(cached, pd.DataFrame({'GEOID': ['01001']})) is None
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    project = make_project(tmp_path)
+    root = result_cache_root(project)
+    for age, key in enumerate(["old", "used", "new"]):
+        entry, _ = store_entry(project, key, 1000)
+        os.utime(os.path.join(entry, "manifest.json"), (1_000_000 + age, 1_000_000 + age))
+    # Reading an entry makes it the most recently used
+    load_cached_result(project, "old")
+    sizes = {key: sum(os.path.getsize(os.path.join(root, key, name)) for name in os.listdir(os.path.join(root, key)))
+             for key in os.listdir(root) if not key.endswith(".json")}
+    
+    evict_results(root, sizes["old"] + sizes["new"] + 1, keep="new")
+    assert sorted(k for k in os.listdir(root) if not k.endswith(".json")) == ["new", "old"]
+    
+    evict_results(root, 1, keep="new")
+    assert [k for k in os.listdir(root) if not k.endswith(".json")] == ["new"]
+
+def test_entry_larger_than_budget_is_not_stored(tmp_path):
+    project = make_project(tmp_path)
+    points = PointStore(np.zeros(100), np.zeros(100))
+    writer = ResultWriter(project, "big")
+    writer.append(points, np.zeros(100))
+    frame = pd.DataFrame({'GEOID': ['01001']})
+    assert writer.commit(frame, np.array([100]), empty_travel_arrays(1), {}, 1024) is None
+    assert load_cached_result(project, "big") is None
+    assert not [name for name in os.listdir(result_cache_root(project)) if name.endswith(".tmp")]
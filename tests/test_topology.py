@@ -0,0 +1,104 @@
+import json
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import Polygon, MultiPolygon, box
+from src.topology import build_topology, simplify_arcs, encode_topojson, feature_positions, TOPOLOGY_ZOOM_LEVELS
+
+def make_layers():
+    """Two counties sharing a jagged border (one with a hole, one in two parts) inside one state."""
+    border = [(-99, 35), (-98.8, 35.3), (-99.1, 35.6), (-99, 36)]
+    west = Polygon([(-100, 35)] + border + [(-100, 36)], holes=[[(-99.8, 35.2), (-99.6, 35.2), (-99.6, 35.4)]])
+    east = MultiPolygon([Polygon(border + [(-98, 36), (-98, 35)]), box(-97.9, 35, -97.8, 35.1)])
+    counties = gpd.GeoDataFrame({'GEOID': ['01001', '01002'], 'NAME': ['West', 'East'], 'STATEFP': ['01', '01'],
+                                 'geometry': [west, east]}, crs='EPSG:4326')
+    states = gpd.GeoDataFrame({'STATEFP': ['01'], 'NAME': ['Alpha'],
+                               'geometry': [shapely.union(west, east).buffer(0)]}, crs='EPSG:4326')
+    return counties, states
+
+def make_topology(simplify=False):
+    counties, states = make_layers()
+    layers = {'counties': (counties, ['GEOID', 'NAME', 'STATEFP']), 'states': (states, ['STATEFP', 'NAME'])}
+    topo = build_topology(layers, quantization=100_000)
+    levels = {}
+    for zoom in TOPOLOGY_ZOOM_LEVELS:
+        if simplify:
+            levels[zoom] = simplify_arcs(topo['coords'], topo['offsets'], 0.05 / topo['transform']['scale'][0])
+        else:
+            levels[zoom] = (topo['coords'], topo['offsets'])
+    return dict(topo, levels=levels), counties, states
+
+def decode(document):
+    """Shapely geometries per object of a quantized TopoJSON document, following the spec."""
+    (sx, sy), (tx, ty) = document['transform']['scale'], document['transform']['translate']
+    arcs = [np.cumsum(np.array(arc, dtype=np.float64), axis=0) * [sx, sy] + [tx, ty] for arc in document['arcs']]
+    
+    def ring(refs):
+        points = []
+        for ref in refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            points.extend(arc[1:] if points else arc)
+        return points
+    
+    def polygon(rings):
+        return Polygon(ring(rings[0]), [ring(r) for r in rings[1:]])
+    
+    decoded = {}
+    for name, collection in document['objects'].items():
+        decoded[name] = []
+        for geometry in collection['geometries']:
+            if geometry['type'] == 'Polygon':
+                shape = polygon(geometry['arcs'])
+            else:
+                shape = MultiPolygon([polygon(p) for p in geometry['arcs']])
+            decoded[name].append((shape, geometry['properties']))
+    return decoded
+
+def test_topojson_decodes_to_the_input_polygons():
+    topology, counties, states = make_topology()
+    selections = {'counties': [(0, {'point_count': 5}), (1, {})], 'states': [(0, {})]}
+    # The document must survive a JSON round trip (plain ints and lists only)
+    document = json.loads(json.dumps(encode_topojson(topology, 10, selections)))
+    assert document['type'] == 'Topology'
+    
+    decoded = decode(document)
+    # Vertices move by at most half a quantization step
+    step = max(topology['transform']['scale'])
+    for (shape, properties), (_, original) in zip(decoded['counties'], counties.iterrows()):
+        assert shape.is_valid
+        assert shape.hausdorff_distance(original.geometry) < step
+        assert abs(shape.area - original.geometry.area) < 1e-3 * original.geometry.area
+        assert properties['GEOID'] == original['GEOID']
+    assert decoded['counties'][0][1]['point_count'] == 5
+    assert len(decoded['counties'][0][0].interiors) == 1
+    assert decoded['counties'][1][0].geom_type == 'MultiPolygon'
+    assert decoded['states'][0][0].hausdorff_distance(states.geometry[0]) < step
+
+def test_shared_borders_are_single_arcs():
+    topology, _, _ = make_topology()
+    west, east = topology['features']['counties']
+    west_refs = {ref if ref >= 0 else ~ref for ring in west['arcs'][0] for ref in ring}
+    east_refs = {ref if ref >= 0 else ~ref for ring in east['arcs'][0] for ref in ring}
+    # The jagged border is stored once and referenced by both counties
+    assert west_refs & east_refs
+
+def test_subset_only_includes_referenced_arcs():
+    topology, _, _ = make_topology()
+    full = encode_topojson(topology, 10, {'counties': [(0, {}), (1, {})], 'states': [(0, {})]})
+    west = encode_topojson(topology, 10, {'counties': [(0, {})]})
+    assert len(west['arcs']) < len(full['arcs'])
+    refs = [ref if ref >= 0 else ~ref for ring in west['objects']['counties']['geometries'][0]['arcs'] for ref in ring]
+    assert sorted(set(refs)) == list(range(len(west['arcs'])))
+
+def test_simplified_neighbours_stay_gap_free():
+    topology, _, _ = make_topology(simplify=True)
+    decoded = decode(encode_topojson(topology, 4, {'counties': [(0, {}), (1, {})]}))
+    west, east = (shape for shape, _ in decoded['counties'])
+    assert west.is_valid and east.is_valid
+    # Both sides of the simplified border come from the same arc, so they neither overlap nor leave a gap
+    assert west.intersection(east).area < 1e-9
+    assert abs(west.union(east).area - west.area - east.area) < 1e-9
+
+def test_feature_positions():
+    topology, _, _ = make_topology()
+    assert feature_positions(topology, 'counties', 'GEOID', ['01002', '99999', '01001']) == [1, None, 0]
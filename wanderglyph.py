@@ -1,55 +1,455 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import json
 import logging
 import argparse
-from src.core import process_data
+# Only dependency-free defaults are imported up front; each command imports
+# the pipeline (pandas, geopandas, folium, ...) when it actually runs
+from src.defaults import (DEFAULT_CHUNK_SIZE, DEFAULT_THIN_DISTANCE_M, DEFAULT_THIN_MIN_STAY_S,
+                          DEFAULT_MAX_HEAT_BINS, DEFAULT_MAX_CLUSTER_POINTS, DEFAULT_MAX_RAW_POINTS,
+                          DEFAULT_HOST, DEFAULT_PORT, DEFAULT_QUEUE_SIZE, DEFAULT_RESULT_CACHE_MB,
+                          DEFAULT_EXPORT_PRECISION, DEFAULT_THUMBNAIL_SIZE)
+
+# Stages recorded by process_data, in pipeline order
+PROFILE_STAGES = ['load_boundaries', 'load_state', 'cache_lookup', 'parse', 'thin', 'spill', 'load_geographies',
+                  'match', 'analytics', 'match_geographies', 'cache_store', 'reduce', 'save_state', 'aggregate', 'load_topology',
+                  'visit_index', 'render', 'export', 'thumbnail']
+# Names of the readers registered in src/readers.py (kept here so --help needs no imports)
+INPUT_FORMATS = ['timeline', 'records', 'gpx', 'csv']
+# Finer layers defined in src/geographies.py
+GEOGRAPHY_NAMES = ['tract', 'zcta', 'place']
+COMMANDS = ['render', 'match', 'export', 'stats', 'query', 'batch', 'serve']
+# Calendar periods of `query --period` (src/visit_index.py)
+QUERY_PERIODS = ['day', 'week', 'month', 'year']
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
 
-def main():
-    parser = argparse.ArgumentParser(description="Map matched counties from JSON GPS data.")
-    parser.add_argument('--json-file', required=True, help='Path to JSON file with GPS data')
-    parser.add_argument('--output-map', default='output_map.html', help='Output HTML map filename')
+def map_options(args):
+    """Map generation caps selected on the command line."""
+    return {
+        'max_heat_bins': args.max_heat_bins,
+        'max_cluster_points': args.max_cluster_points,
+        'max_raw_points': args.max_raw_points,
+        'compress': args.gzip_map,
+        'sidecars': args.map_sidecars,
+    }
+
+def processing_options(args):
+    """Parsing, matching and cache options shared by every command."""
+    return {
+        'chunk_size': args.chunk_size,
+        'thin': args.thin,
+        'thin_distance': args.thin_distance,
+        'thin_min_stay': args.thin_min_stay,
+        'input_format': args.input_format,
+        'geographies': args.geographies,
+        'memory_budget': args.memory_budget,
+        'spill_dir': args.spill_dir,
+        'cache_options': {
+            'rebuild_cache': args.rebuild_cache,
+            'result_cache_size': args.result_cache_size if args.result_cache else None,
+        },
+    }
+
+def geography_list(value):
+    """argparse type for a comma-separated list of geography layer names."""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in GEOGRAPHY_NAMES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown geography {', '.join(unknown)} (choose from {', '.join(GEOGRAPHY_NAMES)})")
+    return names
+
+def profile_stats_path(args):
+    """cProfile dump for --profile-stage, written next to the --profile report."""
+    if not args.profile_stage:
+        return None
+    return os.path.splitext(args.profile or 'profile.json')[0] + '.pstats'
+
+def run_pipeline(args, output_map=None, **outputs):
+    """Run process_data for one timeline with the command's outputs; writes --profile if given."""
+    from src.core import process_data
+    from src.profiling import write_profile_report
+    
+    result = process_data(
+        args.json_file,
+        output_map,
+        args.project_dir,
+        args.add_markers if output_map else False,
+        state_file=args.state_file,
+        full_extent=args.full_extent,
+        map_options=map_options(args) if output_map else None,
+        topojson=args.topojson if output_map else False,
+        outputs={'thumbnail': args.thumbnail, 'thumbnail_size': args.thumbnail_size,
+                 'visit_index': args.visit_index, **outputs},
+        profile_options={'profile_stage': args.profile_stage, 'profile_stats': profile_stats_path(args)},
+        **processing_options(args)
+    )
+    if args.profile:
+        write_profile_report(args.profile, result['profile'])
+    return result
+
+def print_summary(result, args):
+    """Print the human-readable processing summary."""
+    print("\nProcessing Summary:")
+    print(f"- Total points processed: {result['points_count']}")
+    if result['incremental']:
+        print(f"- New points since last run: {result['new_points']}")
+    if args.thin:
+        print(f"- Points after thinning: {result['points_thinned']} ({result['thin_reduction']:.1%} reduction)")
+    if args.memory_budget and result['map_report']:
+        # Out of core, the map draws weighted cells instead of the points themselves
+        print(f"- Map cells (out-of-core): {result['points_rendered']}")
+    print(f"- Counties matched: {result['counties_matched']}")
+    print(f"- States covered: {result['states_covered']}")
+    states_str = ", ".join(result['state_names'][:5])
+    if len(result['state_names']) > 5:
+        states_str += f" and {len(result['state_names']) - 5} more"
+    print(f"- States: {states_str}")
+    travel = result['travel']
+    if travel['first_visit']:
+        print(f"- Distance travelled: {travel['distance_km']:,.1f} km over {travel['dwell_hours']:,.1f} tracked hours "
+              f"({travel['first_visit'][:10]} to {travel['last_visit'][:10]})")
+    for name, layer in result['geographies'].items():
+        print(f"- {name} features matched: {layer['matched']} of {layer['candidates']} candidates")
+    cache = result['result_cache']
+    if cache and cache['points']:
+        reused = "parsed points" + (", county matches" if cache['matches'] else "") + (" and the map" if cache['map'] else "")
+        print(f"- Reused from the result cache: {reused}")
+    report = result['map_report']
+    if report:
+        print(f"- Map: {report['html_bytes'] / (1024 * 1024):.2f} MB, {report['heatmap_bins']} heatmap bins, "
+              f"{report['cluster_points']} clusters over {report['cluster_levels']} zoom levels")
+    thumbnail = result['thumbnail']
+    if thumbnail:
+        print(f"- Thumbnail: {thumbnail['width']}x{thumbnail['height']} PNG at {os.path.abspath(thumbnail['output_path'])}")
+
+def run_render(args):
+    """Full pipeline: interactive map plus any requested exports."""
+    result = run_pipeline(args, args.output_map, export_geojson=args.export_geojson,
+                          export_points=args.export_points, export_precision=args.export_precision)
+    print_summary(result, args)
+    print(f"\nOutput map saved to: {os.path.abspath(result['map_report']['output_path'])}")
+    return 0
+
+def run_match(args):
+    """Match points to counties and write the per-county table as CSV, without a map."""
+    run_pipeline(args, export_csv=args.output)
+    print(f"County table saved to: {os.path.abspath(args.output)}")
+    return 0
+
+def run_export(args):
+    """Write matched counties and/or points as GeoJSON, NDJSON or GeoParquet, without a map."""
+    if not args.export_geojson and not args.export_points:
+        logging.error("Nothing to export: pass --export-geojson and/or --export-points")
+        return 2
+    result = run_pipeline(args, export_geojson=args.export_geojson, export_points=args.export_points,
+                          export_precision=args.export_precision)
+    print_summary(result, args)
+    return 0
+
+def run_stats(args):
+    """Print coverage statistics only; folium is never imported."""
+    result = run_pipeline(args)
+    if args.json:
+        print(json.dumps({key: value for key, value in result.items() if key != 'map_report'}, indent=2))
+    else:
+        print_summary(result, args)
+    return 0
+
+def print_window(summary, coverage, args):
+    """Print the summary (and per-period coverage) of a visit index query."""
+    window = f"{args.time_from or 'start'} to {args.time_to or 'end'}"
+    print(f"\nVisits from {window}:")
+    print(f"- Points: {summary['points']} ({summary['points_matched']} in counties)")
+    print(f"- Counties visited: {summary['counties_visited']}")
+    print(f"- States: {', '.join(summary['states']) or 'none'}")
+    print(f"- New counties: {len(summary['new_counties'])}")
+    for county in summary['new_counties']:
+        print(f"  {county['first_visit'][:10]}  {county['NAME']}, {county['state']} ({county['GEOID']})")
+    if coverage is not None:
+        print(f"\nCoverage per {args.period}:")
+        print(coverage.to_string(index=False) if len(coverage) else "  (no timed points)")
+
+def run_query(args):
+    """Answer time-window coverage questions from a visit index, optionally re-rendering the window."""
+    from src.visit_index import VisitIndex, time_bound
+    
+    try:
+        start = time_bound(args.time_from) if args.time_from else None
+        end = time_bound(args.time_to, end=True) if args.time_to else None
+    except ValueError as e:
+        logging.error(f"Invalid time bound: {e}")
+        return 2
+    index = VisitIndex(args.index)
+    summary = index.summary(start, end)
+    coverage = index.coverage(args.period, start, end) if args.period else None
+    if args.json:
+        if coverage is not None:
+            summary['coverage'] = coverage.to_dict('records')
+        print(json.dumps(summary, indent=2))
+    else:
+        print_window(summary, coverage, args)
+    
+    if args.output or args.output_map or args.thumbnail:
+        from src.core import render_window
+        
+        result = render_window(args.index, args.project_dir, start, end, output_map=args.output_map,
+                               add_markers=args.add_markers, map_options=map_options(args),
+                               topojson=args.topojson,
+                               outputs={'thumbnail': args.thumbnail, 'thumbnail_size': args.thumbnail_size,
+                                        'export_csv': args.output},
+                               chunk_size=args.chunk_size)
+        if not args.json:
+            for label, path in (("County table", args.output),
+                                ("Map", result['map_report'] and result['map_report']['output_path']),
+                                ("Thumbnail", args.thumbnail)):
+                if path:
+                    print(f"{label} saved to: {os.path.abspath(path)}")
+    return 0
+
+def run_batch(args):
+    """Run batch mode and print the consolidated summary."""
+    from src.batch import process_batch
+    
+    output_dir = args.output_dir or 'batch_output'
+    summary = process_batch(
+        args.batch,
+        output_dir,
+        args.project_dir,
+        workers=args.workers,
+        exports=args.batch_exports,
+        thumbnails=args.batch_thumbnails,
+        outputs={'thumbnail_size': args.thumbnail_size},
+        add_markers=args.add_markers,
+        map_options=map_options(args),
+        topojson=args.topojson,
+        **processing_options(args)
+    )
+    
+    print("\nBatch Summary:")
+    print(f"- Files processed: {summary['files_succeeded']}/{summary['files_total']} ({summary['workers']} workers)")
+    print(f"- Boundary load time: {summary['boundary_load_seconds']:.2f}s")
+    print(f"- Total time: {summary['total_seconds']:.2f}s")
+    for entry in summary['files']:
+        if entry['status'] == 'ok':
+            print(f"  {os.path.basename(entry['input'])}: {entry['points_count']} points, "
+                  f"{entry['counties_matched']} counties in {entry['seconds']:.2f}s")
+        else:
+            print(f"  {os.path.basename(entry['input'])}: FAILED ({entry['error'].splitlines()[0]})")
+    print(f"\nOutputs saved to: {os.path.abspath(output_dir)}")
+    return 0 if summary['files_failed'] == 0 else 1
+
+def run_server(args):
+    """Run the long-lived map service until interrupted."""
+    from src.server import serve
+    
+    serve(
+        args.project_dir,
+        host=args.host,
+        port=args.port,
+        workers=args.workers or os.cpu_count() or 1,
+        queue_size=args.queue_size,
+        work_dir=args.output_dir,
+        add_markers=args.add_markers,
+        map_options=map_options(args),
+        topojson=args.topojson,
+        **processing_options(args)
+    )
+    return 0
+
+HANDLERS = {
+    'render': run_render,
+    'match': run_match,
+    'export': run_export,
+    'query': run_query,
+    'stats': run_stats,
+    'batch': run_batch,
+    'serve': run_server,
+}
+
+def add_processing_arguments(parser):
+    """Options for loading boundaries and parsing/matching points."""
     parser.add_argument('--project-dir', default='.', help='Project directory containing shapefiles')
-    parser.add_argument('--add-markers', action='store_true', help='Add location markers to the map')
-    parser.add_argument('--export-geojson', help='Optional: export matched counties as GeoJSON')
-    parser.add_argument('--export-points', help='Optional: export points as GeoJSON')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Rebuild the preprocessed boundary cache')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Points parsed and matched per streamed chunk (bounds peak memory)')
+    parser.add_argument('--thin', action='store_true',
+                        help='Collapse stationary clusters into weighted stay points before matching')
+    parser.add_argument('--thin-distance', type=float, default=DEFAULT_THIN_DISTANCE_M,
+                        help='Thinning cell size in meters')
+    parser.add_argument('--thin-min-stay', type=float, default=DEFAULT_THIN_MIN_STAY_S,
+                        help='Minimum dwell in seconds for a cluster to count as a stay point')
+    parser.add_argument('--input-format', choices=INPUT_FORMATS,
+                        help='Format of the location history files (default: detected from each file)')
+    parser.add_argument('--geographies', type=geography_list, default=[],
+                        help=f"Comma-separated finer layers to match as well ({', '.join(GEOGRAPHY_NAMES)}); "
+                             "shapefiles go in the project directory in TIGER layout")
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help='Out-of-core mode: size chunks to this budget and spill points to memory-mapped files on disk')
+    parser.add_argument('--spill-dir', help='Directory for out-of-core spill files (default: system temp directory)')
+    parser.add_argument('--result-cache', action='store_true',
+                        help='Store parsed points, county matches and maps in the project directory and reuse them '
+                             'when only output options change')
+    parser.add_argument('--result-cache-size', type=float, default=DEFAULT_RESULT_CACHE_MB, metavar='MB',
+                        help='Disk budget of --result-cache (least recently used entries are evicted)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose logging')
+
+def add_single_file_arguments(parser):
+    """Options of the commands that process one timeline file."""
+    parser.add_argument('--state-file', help='Incremental mode: persist per-county aggregates here and only process new points on reruns')
+    parser.add_argument('--full-extent', action='store_true',
+                        help="Load every boundary instead of only those intersecting the points' extent")
+    parser.add_argument('--thumbnail', metavar='PNG',
+                        help='Also write a static PNG preview of the visited counties (rendered without folium)')
+    parser.add_argument('--thumbnail-size', type=int, default=DEFAULT_THUMBNAIL_SIZE, metavar='PX',
+                        help='Longer side of PNG thumbnails in pixels')
+    parser.add_argument('--visit-index', metavar='DIR',
+                        help='Also persist the matched points sorted by time with per-county daily counts, for `query`')
+    parser.add_argument('--profile', help='Write per-stage timing, memory and throughput metrics to this JSON file')
+    parser.add_argument('--profile-stage', choices=PROFILE_STAGES,
+                        help='Run this stage under cProfile and save its stats next to the --profile report (.pstats)')
+
+def add_map_arguments(parser):
+    """Options controlling the generated map."""
+    parser.add_argument('--add-markers', action='store_true', help='Add location markers to the map')
+    parser.add_argument('--max-heat-bins', type=int, default=DEFAULT_MAX_HEAT_BINS,
+                        help='Maximum weighted bins embedded for the heatmap')
+    parser.add_argument('--max-cluster-points', type=int, default=DEFAULT_MAX_CLUSTER_POINTS,
+                        help='Maximum precomputed clusters embedded across all zoom levels')
+    parser.add_argument('--max-raw-points', type=int, default=DEFAULT_MAX_RAW_POINTS,
+                        help='Show an individual-points layer when there are at most this many points')
+    parser.add_argument('--gzip-map', action='store_true',
+                        help='Write the map gzip-compressed (adds .gz to the output name)')
+    parser.add_argument('--map-sidecars', action='store_true',
+                        help='Write map data payloads to a <map>_data/ directory loaded by the page')
+    parser.add_argument('--topojson', action='store_true',
+                        help='Embed boundaries as quantized TopoJSON with shared arcs (much smaller maps)')
+
+def add_export_arguments(parser):
+    """Export destinations; the format follows the extension (.geojson, .ndjson, .parquet)."""
+    parser.add_argument('--export-geojson', help='Export matched counties (GeoJSON; .ndjson/.geojsonl for one feature '
+                                                 'per line, .parquet for GeoParquet)')
+    parser.add_argument('--export-points', help='Export points (GeoJSON; .ndjson/.geojsonl for one feature per line, '
+                                                '.parquet for GeoParquet)')
+    parser.add_argument('--export-precision', type=int, default=DEFAULT_EXPORT_PRECISION, metavar='DECIMALS',
+                        help='Decimals of exported coordinates (6 is ~0.1 m)')
+
+def add_server_arguments(parser):
+    """Options of the map service."""
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to bind')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Requests allowed to wait for a worker before new ones are rejected')
+
+def build_parser():
+    """Subcommand command line: wanderglyph.py <command> [options]."""
+    parser = argparse.ArgumentParser(
+        description="Map matched counties from JSON GPS data.",
+        epilog="The original flag style (--json-file / --batch / --serve) is still accepted.")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+    
+    render = commands.add_parser('render', help='Generate the interactive map (and optional exports)')
+    render.add_argument('json_file', help='Location history file (timeline or Records JSON, GPX, CSV)')
+    render.add_argument('--output-map', default='output_map.html', help='Output HTML map filename')
+    add_export_arguments(render)
+    add_map_arguments(render)
+    
+    match = commands.add_parser('match', help='Write per-county point counts as CSV (no map)')
+    match.add_argument('json_file', help='Location history file (timeline or Records JSON, GPX, CSV)')
+    match.add_argument('--output', default='matched_counties.csv', help='Output CSV path')
+    
+    export = commands.add_parser('export', help='Export matched counties and/or points as GeoJSON or GeoParquet (no map)')
+    export.add_argument('json_file', help='Location history file (timeline or Records JSON, GPX, CSV)')
+    add_export_arguments(export)
     
-    args = parser.parse_args()
+    stats = commands.add_parser('stats', help='Print coverage statistics only (fastest; no map)')
+    stats.add_argument('json_file', help='Location history file (timeline or Records JSON, GPX, CSV)')
+    stats.add_argument('--json', action='store_true', help='Print the full result as JSON')
+    
+    query = commands.add_parser('query', help='Time-window coverage from a visit index (no parsing or matching)')
+    query.add_argument('index', help='Visit index directory written with --visit-index')
+    query.add_argument('--from', dest='time_from', metavar='TIME',
+                       help='Start of the window: ISO year, month, date or time in UTC (e.g. 2023, 2023-10, 2023-10-05)')
+    query.add_argument('--to', dest='time_to', metavar='TIME',
+                       help='Last period included in the window, in the same forms (--to 2023 includes all of 2023)')
+    query.add_argument('--period', choices=QUERY_PERIODS,
+                       help='Also tabulate points, counties and new counties per UTC calendar period')
+    query.add_argument('--json', action='store_true', help='Print the result as JSON')
+    query.add_argument('--output', help="Write the window's county table with travel metrics as CSV")
+    query.add_argument('--output-map', help="Render the window's interactive map to this HTML file")
+    query.add_argument('--thumbnail', metavar='PNG', help="Write a PNG thumbnail of the window")
+    query.add_argument('--thumbnail-size', type=int, default=DEFAULT_THUMBNAIL_SIZE, metavar='PX',
+                       help='Longer side of the thumbnail in pixels')
+    add_map_arguments(query)
+    
+    batch = commands.add_parser('batch', help='Process many timeline files with shared boundaries')
+    batch.add_argument('batch', metavar='SOURCE',
+                       help='Directory of JSON files, or a manifest (.txt with one path per line, or .json list)')
+    batch.add_argument('--output-dir', help='Directory for per-file outputs and summary.json (default: batch_output)')
+    batch.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    batch.add_argument('--exports', dest='batch_exports', action='store_true',
+                       help='Also export matched counties and points as GeoJSON per file')
+    batch.add_argument('--thumbnails', dest='batch_thumbnails', action='store_true',
+                       help='Also write a PNG thumbnail per file')
+    batch.add_argument('--thumbnail-size', type=int, default=DEFAULT_THUMBNAIL_SIZE, metavar='PX',
+                       help='Longer side of the thumbnails in pixels')
+    add_map_arguments(batch)
+    
+    serve = commands.add_parser('serve', help='Run a local HTTP map service with boundaries kept loaded')
+    serve.add_argument('--output-dir', help='Directory for job outputs (default: a temporary directory)')
+    serve.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    add_server_arguments(serve)
+    add_map_arguments(serve)
+    
+    for name, command in commands.choices.items():
+        add_processing_arguments(command)
+        if name in ('render', 'match', 'export', 'stats'):
+            add_single_file_arguments(command)
+    return parser
+
+def build_legacy_parser():
+    """The original single-command flags, kept for existing scripts."""
+    parser = argparse.ArgumentParser(description="Map matched counties from JSON GPS data.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--json-file', help='Path to JSON file with GPS data')
+    source.add_argument('--batch', help='Directory of JSON files, or a manifest (.txt with one path per line, or .json list)')
+    source.add_argument('--serve', action='store_true', help='Run a local HTTP map service with boundaries kept loaded')
+    parser.add_argument('--output-map', default='output_map.html', help='Output HTML map filename')
+    parser.add_argument('--output-dir', help='Batch mode: directory for per-file outputs and summary.json (default: batch_output); '
+                                             'serve mode: directory for job outputs (default: a temporary directory)')
+    parser.add_argument('--workers', type=int, help='Batch/serve mode: worker processes (default: CPU count)')
+    parser.add_argument('--batch-exports', action='store_true', help='Batch mode: also export matched counties and points as GeoJSON per file')
+    parser.add_argument('--batch-thumbnails', action='store_true', help='Batch mode: also write a PNG thumbnail per file')
+    add_export_arguments(parser)
+    add_map_arguments(parser)
+    add_server_arguments(parser)
+    add_processing_arguments(parser)
+    add_single_file_arguments(parser)
+    return parser
+
+def parse_args(argv):
+    """Parse subcommand arguments, falling back to the original flag style."""
+    if not argv or argv[0] in COMMANDS or argv[0] in ('-h', '--help'):
+        return build_parser().parse_args(argv)
+    args = build_legacy_parser().parse_args(argv)
+    args.command = 'batch' if args.batch else 'serve' if args.serve else 'render'
+    return args
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
     
     # Set logging level based on verbosity
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
     try:
-        result = process_data(
-            args.json_file,
-            args.output_map,
-            args.project_dir,
-            args.add_markers,
-            args.export_geojson,
-            args.export_points
-        )
-        
-        # Print summary
-        print("\nProcessing Summary:")
-        print(f"- Total points processed: {result['points_count']}")
-        print(f"- Counties matched: {result['counties_matched']}")
-        print(f"- States covered: {result['states_covered']}")
-        states_str = ", ".join(result['state_names'][:5])
-        if len(result['state_names']) > 5:
-            states_str += f" and {len(result['state_names']) - 5} more"
-        print(f"- States: {states_str}")
-        print(f"\nOutput map saved to: {os.path.abspath(args.output_map)}")
-        
+        return HANDLERS[args.command](args)
     except Exception as e:
         logging.error(f"An error occurred: {e}", exc_info=args.verbose)
         return 1
-    
-    return 0
 
 if __name__ == '__main__':
     exit(main())